@@ -2,7 +2,7 @@ from flask import Flask, request, session
 import logging
 from logging.handlers import RotatingFileHandler
 import os
-from rag.vectorstore import load_faiss_index
+from rag.singleton import faiss_singleton
 from routes.core import core_bp
 from routes.auth import auth_bp
 from routes.admin import admin_bp
@@ -38,18 +38,11 @@ def create_app():
         logger.error(f"Errore di configurazione: {e}")
         raise
     
-    # Caricamento indice FAISS con gestione errori
-    try:
-        faiss_index, texts, metadata = load_faiss_index(config.INDEX_PATH)
-        logger.info("Indice FAISS caricato con successo")
-    except Exception as e:
-        logger.error(f"Errore nel caricamento dell'indice FAISS: {str(e)}")
-        # In produzione, fallback con indice vuoto
-        if config.IS_PRODUCTION:
-            logger.warning("Utilizzo indice vuoto come fallback")
-            faiss_index, texts, metadata = None, [], []
-        else:
-            raise
+    # Indice FAISS: registrato nel singleton e caricato al primo utilizzo (una sola copia per processo).
+    # In produzione un indice mancante o corrotto degrada a indice vuoto invece di bloccare l'avvio.
+    faiss_singleton.configure(config.INDEX_PATH, mmap=config.INDEX_MMAP,
+                              reload_interval=config.INDEX_RELOAD_INTERVAL,
+                              degrade=config.IS_PRODUCTION)
     
     # Inizializzazione Flask app
     app = Flask(__name__, 
@@ -86,10 +79,9 @@ def create_app():
             limiter.limit(config.RATE_LIMIT_OPENAI_MODEL, 
                          key_func=lambda: f"openai_model_{model}")
     
-    # Config globale accessibile nei blueprint
-    app.config["FAISS_INDEX"] = faiss_index
-    app.config["TEXTS"] = texts
-    app.config["METADATA"] = metadata
+    # Config globale accessibile nei blueprint: il singleton e non l'indice, così dopo una
+    # reindicizzazione la generazione precedente non resta referenziata dalla config
+    app.config["FAISS_INDEX"] = faiss_singleton
     
     # Registrazione gestori di errori
     register_error_handlers(app)
@@ -21,8 +21,57 @@ class Config:
     # RAG
     TOP_K = int(os.getenv("TOP_K", 5))
     MIN_OVERLAP = float(os.getenv("MIN_OVERLAP", 0.3))  # Ridotto da 0.7 a 0.3 (30%)
+    MIN_SCORE = float(os.getenv("MIN_SCORE", 0.75))  # similarità coseno minima dei chunk usati come contesto
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))  # embedding delle domande in memoria (LRU)
+    QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "true").lower() == "true"  # copia su disco (SQLite)
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"  # risposte per domande simili
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))  # similarità coseno tra domande
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 2000))
+    CORRECTIONS_THRESHOLD = float(os.getenv("CORRECTIONS_THRESHOLD", 0.92))  # similarità per applicare una correzione
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 500))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 50))
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"  # rimozione chunk quasi duplicati in ingest
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.85))  # similarità di Jaccard stimata (MinHash)
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"  # embedding dei chunk su disco
+    EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # float32 oppure float16 (metà spazio)
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 0))  # processi per l'estrazione dei PDF (0 = uno per CPU)
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))  # chunk per richiesta di embedding
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 4))  # batch pronti in attesa degli embedding
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))  # richieste di embedding in parallelo
+    EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 20000))  # token massimi per richiesta
+    EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", 3000))  # richieste al minuto (0 = nessun limite)
+    EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", 1000000))  # token al minuto (0 = nessun limite)
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))  # tentativi per errori transitori (429, 5xx, rete)
+    WEB_FETCH_WORKERS = int(os.getenv("WEB_FETCH_WORKERS", 8))  # pagine web scaricate in parallelo
+    WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", 20))  # secondi di attesa della risposta per pagina
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # FAISS + BM25 con Reciprocal Rank Fusion
+    HYBRID_POOL_FACTOR = int(os.getenv("HYBRID_POOL_FACTOR", 4))  # candidati per retriever = TOP_K * fattore
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+    MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"  # diversificazione dei chunk (MMR)
+    MMR_POOL_FACTOR = int(os.getenv("MMR_POOL_FACTOR", 3))  # candidati = TOP_K * fattore
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))  # 1 = sola rilevanza, 0 = sola diversità
+    MMR_SOURCE_CAP = int(os.getenv("MMR_SOURCE_CAP", 2))  # chunk massimi per documento (0 = nessun limite)
+    
+    # Indice vettoriale (flat = ricerca esatta, hnsw/ivf = ricerca approssimata,
+    # sq8/sqfp16/pq = vettori compressi con riordinamento esatto dei candidati)
+    INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+    INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() == "true"  # indice mappato in memoria, condiviso tra worker
+    INDEX_KEEP_GENERATIONS = int(os.getenv("INDEX_KEEP_GENERATIONS", 2))  # generazioni conservate su disco
+    INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", 5))  # secondi tra i controlli di nuove generazioni
+    # Frazione di tombstone (chunk rimossi ma ancora nell'indice HNSW/con riordinamento) oltre cui
+    # l'aggiornamento incrementale ricostruisce l'indice
+    INDEX_COMPACT_TOMBSTONE_RATIO = float(os.getenv("INDEX_COMPACT_TOMBSTONE_RATIO", 0.2))
+    INDEX_PARAMS = {
+        "metric": os.getenv("INDEX_METRIC", "l2"),  # l2 oppure cosine (prodotto interno su vettori normalizzati)
+        "M": int(os.getenv("HNSW_M", 32)),
+        "efConstruction": int(os.getenv("HNSW_EF_CONSTRUCTION", 200)),
+        "efSearch": int(os.getenv("HNSW_EF_SEARCH", 64)),
+        "nlist": int(os.getenv("IVF_NLIST", 0)) or None,  # 0 = calcolato dal numero di chunk
+        "nprobe": int(os.getenv("IVF_NPROBE", 8)),
+        "pq_m": int(os.getenv("PQ_M", 64)),  # sottovettori PQ (deve dividere 1536): codice da PQ_M byte
+        "pq_nbits": int(os.getenv("PQ_NBITS", 8)),
+        "rerank": int(os.getenv("RERANK_FACTOR", 4)),  # candidati riordinati con distanza esatta = RERANK_FACTOR * k
+    }
     
     # Quality Control
     ENABLE_ADAPTIVE_QUALITY = os.getenv("ENABLE_ADAPTIVE_QUALITY", "true").lower() == "true"
@@ -2,9 +2,10 @@ import os
 import json
 import logging
 import re
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from openai import OpenAI
+from config import config
+from rag.loader import extract_text, load_documents
 
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
@@ -14,18 +15,15 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 client = OpenAI()
 MODEL = "gpt-4o"
-DOCUMENTS_FOLDER = "data/documents"
+DOCUMENTS_FOLDER = os.path.join(config.BASE_DIR, "documents")
 OUTPUT_PATH = os.path.join(DOCUMENTS_FOLDER, "metadata.json")
+TEXT_CACHE_DIR = os.path.join(config.BASE_DIR, "cache", "texts")
 
 
 def extract_text_from_file(filepath):
     try:
-        if filepath.endswith(".txt") or filepath.endswith(".md"):
-            with open(filepath, "r", encoding="utf-8") as f:
-                return f.read()
-        elif filepath.endswith(".pdf"):
-            reader = PdfReader(filepath)
-            return "\n".join([page.extract_text() or "" for page in reader.pages])
+        if filepath.endswith((".txt", ".md", ".pdf")):
+            return extract_text(filepath)
     except Exception as e:
         logger.warning(f"Impossibile leggere {filepath}: {e}")
     return ""
@@ -75,26 +73,33 @@ def generate_metadata(text):
         return None
 
 
-def scan_and_generate_metadata():
+def scan_and_generate_metadata(progress=None):
+    """Genera metadata.json; progress(fase, fatti, totale), se indicata, segue l'avanzamento (lavori admin)"""
+    progress = progress or (lambda stage=None, done=None, total=None: None)
+    progress("metadati")
     metadata = {}
     count = 0
+    relpaths = []
     for root, _, files in os.walk(DOCUMENTS_FOLDER):
         for file in files:
-            if not file.lower().endswith((".txt", ".md", ".pdf")):
-                continue
-            path = os.path.join(root, file)
-            rel_path = get_relative_path(path)
-            logger.info(f"Elaborazione: {rel_path}")
-            text = extract_text_from_file(path)
-            if not text.strip():
-                continue
-            meta = generate_metadata(text)
-            if meta:
-                metadata[rel_path] = meta
-                count += 1
+            if file.lower().endswith((".txt", ".md", ".pdf")):
+                relpaths.append(get_relative_path(os.path.join(root, file)))
+    # Testo dei PDF già estratto da ingest.py (cache per hash del file), gli altri in parallelo
+    texts, _ = load_documents(DOCUMENTS_FOLDER, relpaths, cache_dir=TEXT_CACHE_DIR,
+                              max_workers=config.INGEST_WORKERS)
+    for i, (rel_path, text) in enumerate(texts):
+        progress("metadati", i, len(texts))
+        logger.info(f"Elaborazione: {rel_path}")
+        if not text.strip():
+            continue
+        meta = generate_metadata(text)
+        if meta:
+            metadata[rel_path] = meta
+            count += 1
     with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2, ensure_ascii=False)
     logger.info(f"✅ Metadati generati per {count} documenti in {OUTPUT_PATH}")
+    return {"documents": count}
 
 
 if __name__ == "__main__":
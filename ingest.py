@@ -1,15 +1,26 @@
 import os
 import glob
+import argparse
+import itertools
 import json
 import logging
-import requests
-from bs4 import BeautifulSoup
-from PyPDF2 import PdfReader
+import time
 from openai import OpenAI
 from dotenv import load_dotenv
-from rag.vectorstore import save_faiss_index
-import numpy as np
-import tiktoken
+from rag.vectorstore import save_faiss_index, update_faiss_index
+from rag.generations import current_generation, publish_generation, resolve_index_path, verify_generation
+from rag.chunkstore import ChunkStore
+from rag.sources import (chunk_ids_by_source, file_entry, metadata_sha256, read_sources, scan_changes,
+                         text_sha256, write_sources)
+from rag.dedup import MinHashDeduplicator
+from rag.embedding_cache import ChunkEmbeddingStore
+from rag.embedder import EmbeddingDriver, openai_embed_fn
+from rag.loader import load_documents
+from rag.pipeline import VectorBuffer, run_pipeline
+from rag.chunker import CHUNKER_VERSION, chunk_texts, get_encoding
+from rag.web import fetch_pages, read_urls
+from rag.html_text import EXTRACTOR_VERSION, PARSER, extract_main_text
+from config import config
 
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
@@ -24,72 +35,152 @@ CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 IS_PRODUCTION = os.getenv("FLASK_ENV") != "development"
 BASE_DIR = "/data" if IS_PRODUCTION else "data"
-CHUNK_LOG = os.path.join(BASE_DIR, "documents", "chunks.jsonl")
-METADATA_PATH = "data/documents/metadata.json"
-
-
-def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
-    encoding = tiktoken.get_encoding("cl100k_base")
-    tokens = encoding.encode(text)
-    chunks = []
-    for i in range(0, len(tokens), size - overlap):
-        chunk = tokens[i:i + size]
-        chunks.append(encoding.decode(chunk))
-    return chunks
-
-
-def load_txt_files(folder: str):
-    return _load_generic_files(folder, "*.txt")
-
-
-def load_md_files(folder: str):
-    return _load_generic_files(folder, "*.md")
-
-
-def load_pdf_files(folder: str):
-    texts = []
-    for filepath in glob.glob(os.path.join(folder, "**", "*.pdf"), recursive=True):
-        try:
-            reader = PdfReader(filepath)
-            content = "\n".join([page.extract_text() or "" for page in reader.pages])
-            relpath = os.path.relpath(filepath, folder).replace("\\", "/")
-            texts.append((relpath, content))
-        except Exception as e:
-            logger.warning(f"Errore durante la lettura PDF {filepath}: {e}")
+DOCUMENTS_DIR = os.path.join(BASE_DIR, "documents")  # la stessa cartella degli upload del pannello admin
+CHUNK_LOG = os.path.join(DOCUMENTS_DIR, "chunks.jsonl")
+METADATA_PATH = os.path.join(DOCUMENTS_DIR, "metadata.json")
+EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, "cache", "chunk_embeddings")
+TEXT_CACHE_DIR = os.path.join(BASE_DIR, "cache", "texts")
+WEB_CACHE_DIR = os.path.join(BASE_DIR, "cache", "web")
+URLS_FILE = os.path.join(BASE_DIR, "urls.txt")  # pagine web gestite dal pannello admin
+DOCUMENT_PATTERNS = ("*.txt", "*.md", "*.pdf")
+INDEX_ADD_BATCH_SIZE = 4096  # vettori aggiunti all'indice FAISS per blocco
+
+
+def load_files(relpaths):
+    """
+    Carica i documenti locali indicati; i PDF vengono estratti in parallelo e il testo
+    riusato da generate_metadata.py e dalle esecuzioni successive.
+    """
+    texts, report = load_documents(DOCUMENTS_DIR, relpaths, cache_dir=TEXT_CACHE_DIR,
+                                   max_workers=config.INGEST_WORKERS)
+    for entry in report:
+        if entry["error"] is None:
+            origin = "cache" if entry["cached"] else "estratto"
+            logger.info(f"⏱️ {entry['source']}: {entry['seconds']:.2f}s ({origin}, {entry['chars']} caratteri)")
+    total = sum(entry["seconds"] for entry in report)
+    logger.info(f"📚 Documenti caricati: {len(texts)}/{len(report)} (tempo di estrazione totale: {total:.2f}s)")
     return texts
 
 
-def _load_generic_files(folder: str, pattern: str):
-    texts = []
-    for filepath in glob.glob(os.path.join(folder, "**", pattern), recursive=True):
-        relpath = os.path.relpath(filepath, folder).replace("\\", "/")
-        with open(filepath, "r", encoding="utf-8") as f:
-            texts.append((relpath, f.read()))
-    return texts
+def iter_files(relpaths):
+    """Documenti locali caricati a piccoli gruppi, per la pipeline in streaming"""
+    group = max(1, config.INGEST_WORKERS or os.cpu_count() or 1) * 2
+    for i in range(0, len(relpaths), group):
+        yield from load_files(relpaths[i:i + group])
+
+
+def fetch_web_pages(urls: list):
+    """
+    Scarica le pagine web in parallelo con GET condizionale: le pagine invariate rispondono 304
+    e il corpo viene letto dalla cache locale.
+    """
+    pages = fetch_pages(urls, cache_dir=WEB_CACHE_DIR, max_workers=config.WEB_FETCH_WORKERS,
+                        timeout=(5, config.WEB_FETCH_TIMEOUT))
+    counts = {status: sum(page.status == status for page in pages) for status in ("fetched", "not_modified", "error")}
+    slowest = max((page.seconds for page in pages), default=0.0)
+    logger.info(f"🌐 Pagine web: {counts['fetched']} scaricate, {counts['not_modified']} invariate (304), "
+                f"{counts['error']} non raggiungibili (pagina più lenta: {slowest:.2f}s)")
+    return pages
+
+
+def page_text(url: str, html: str) -> str:
+    """
+    Testo principale della pagina, senza menu, banner dei cookie e footer: registra i token
+    risparmiati rispetto al testo visibile completo.
+    """
+    start = time.perf_counter()
+    extracted = extract_main_text(html)
+    seconds = time.perf_counter() - start
+    encoding = get_encoding()
+    kept = len(encoding.encode(extracted.text, disallowed_special=()))
+    full = len(encoding.encode(extracted.full_text, disallowed_special=()))
+    logger.info(f"🧽 {url}: {full} → {kept} token ({max(0, full - kept)} di boilerplate risparmiati, "
+                f"{PARSER}, {seconds:.2f}s)")
+    return extracted.text
 
 
 def load_web_pages(urls: list):
-    texts = []
-    for idx, url in enumerate(urls):
-        try:
-            response = requests.get(url)
-            soup = BeautifulSoup(response.text, "html.parser")
-            body = soup.get_text()
-            texts.append((f"web_page_{idx}", body))
-        except Exception as e:
-            logger.warning(f"Errore durante lo scraping di {url}: {e}")
-    return texts
-
-
-def embed_chunks(chunks):
-    embeddings = []
-    batch_size = 100
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i + batch_size]
-        result = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
-        vectors = [np.array(record.embedding, dtype=np.float32) for record in result.data]
-        embeddings.extend(vectors)
-    return embeddings
+    """(url, testo) delle pagine raggiungibili"""
+    return list(iter_web_pages(fetch_web_pages(urls)))
+
+
+def iter_web_pages(pages):
+    """Testo delle pagine scaricate, estratto una pagina alla volta per la pipeline in streaming"""
+    for page in pages:
+        if page.html is not None:
+            yield page.url, page_text(page.url, page.html)
+
+
+def chunk_embedder(count_tokens):
+    """
+    Funzione di embedding per i batch della pipeline: richieste concorrenti con limiti di
+    richieste/token al minuto e retry degli errori transitori. Con l'archivio su disco attivo
+    vengono richiesti all'API solo i chunk mai visti con questo modello; ogni batch viene salvato
+    subito, così un'esecuzione interrotta riprende dal punto in cui si era fermata.
+    """
+    driver = EmbeddingDriver(
+        openai_embed_fn(client, EMBEDDING_MODEL),
+        count_tokens,
+        concurrency=config.EMBEDDING_CONCURRENCY,
+        max_batch_tokens=config.EMBEDDING_BATCH_TOKENS,
+        max_batch_items=config.INGEST_BATCH_SIZE,
+        requests_per_minute=config.EMBEDDING_RPM or None,
+        tokens_per_minute=config.EMBEDDING_TPM or None,
+        max_retries=config.EMBEDDING_MAX_RETRIES,
+    )
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return driver.embed, driver, None
+    store = ChunkEmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, dtype=config.EMBEDDING_CACHE_DTYPE)
+    return (lambda batch: store.embed(batch, driver.embed, batch_size=len(batch))), driver, store
+
+
+def no_progress(stage=None, done=None, total=None):
+    """Avanzamento ignorato (esecuzione da riga di comando); vedi rag.jobs.Job.progress"""
+
+
+def run_ingest_pipeline(documents, metadata_index, progress=no_progress, total=None):
+    """
+    Caricamento, chunking, deduplicazione ed embedding in streaming: i vettori sono scritti
+    in un buffer su disco e in memoria restano solo i batch in lavorazione.
+    progress("embedding", documenti elaborati, total) viene chiamata dopo ogni batch.
+    """
+    encoding = get_encoding()
+    count_tokens = lambda chunk: len(encoding.encode(chunk, disallowed_special=()))
+    embed, driver, store = chunk_embedder(count_tokens)
+    os.makedirs(os.path.join(BASE_DIR, "cache"), exist_ok=True)
+    buffer = VectorBuffer(os.path.join(BASE_DIR, "cache", f"ingest_vectors.{os.getpid()}.f32"))
+    try:
+        result = run_pipeline(
+            documents,
+            chunk_documents=lambda texts: chunk_texts(texts, CHUNK_SIZE, CHUNK_OVERLAP, encoding),
+            document_metadata=lambda relpath: document_metadata(relpath, metadata_index),
+            embed_batch=embed,
+            batch_size=config.INGEST_BATCH_SIZE,
+            queue_size=config.INGEST_QUEUE_SIZE,
+            max_batch_tokens=config.EMBEDDING_BATCH_TOKENS,
+            concurrency=config.EMBEDDING_CONCURRENCY,
+            # Rimozione dei quasi duplicati (pagine web e sorgenti sovrapposte) prima degli embedding
+            deduplicator=MinHashDeduplicator(threshold=config.DEDUP_THRESHOLD) if config.DEDUP_ENABLED else None,
+            count_tokens=count_tokens,
+            buffer=buffer,
+            progress=lambda stats: progress("embedding", stats["documents"], total),
+        )
+    except BaseException:
+        buffer.close()
+        raise
+    stats = result.stats
+    logger.info(f"✂️ Documenti elaborati: {stats['documents']}, chunk: {stats['chunks']}")
+    if config.DEDUP_ENABLED:
+        logger.info(f"🧹 Chunk quasi duplicati rimossi: {stats['duplicates']} "
+                    f"(token di embedding risparmiati: {stats['duplicate_tokens']})")
+    requests = driver.stats
+    logger.info(f"📡 Richieste di embedding: {requests['requests']} ({requests['tokens']} token), "
+                f"ripetute: {requests['retries']}, attesa per i limiti: {requests['throttled_seconds']:.1f}s")
+    if store is not None:
+        cache = store.stats()
+        logger.info(f"🧠 Embedding dei chunk: {cache['misses']} calcolati, {cache['hits']} letti dall'archivio "
+                    f"({cache['entries']} in archivio)")
+    return result
 
 
 def load_metadata(metadata_path):
@@ -99,54 +190,272 @@ def load_metadata(metadata_path):
     return {}
 
 
-if __name__ == "__main__":
-    logger.info("📥 Caricamento documenti da cartella e web...")
-
-    texts = (
-        load_txt_files("data/documents") +
-        load_md_files("data/documents") +
-        load_pdf_files("data/documents")
-    )
-
-    urls = [
-        "https://www.visitrimini.com/en/events/"
-    ]
-    texts += load_web_pages(urls)
-
-    logger.info(f"📄 Documenti totali trovati: {len(texts)}")
+def document_metadata(relpath, metadata_index):
+    meta_entry = metadata_index.get(relpath, {})
+    return {
+        "source": relpath,
+        "description": meta_entry.get("description", ""),
+        "tags": meta_entry.get("tags", [])
+    }
+
+
+def list_documents(folder: str):
+    """Percorsi relativi dei documenti indicizzabili (txt, md, pdf)"""
+    relpaths = []
+    for pattern in DOCUMENT_PATTERNS:
+        for filepath in glob.glob(os.path.join(folder, "**", pattern), recursive=True):
+            relpaths.append(os.path.relpath(filepath, folder).replace("\\", "/"))
+    return relpaths
+
+
+def chunking_params():
+    """Parametri che determinano chunk ed embedding: se cambiano serve una reindicizzazione completa"""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunker": CHUNKER_VERSION,
+        "html_extractor": EXTRACTOR_VERSION,
+        "embedding_model": EMBEDDING_MODEL,
+        "dedup_threshold": config.DEDUP_THRESHOLD if config.DEDUP_ENABLED else None,
+        "index_type": config.INDEX_TYPE,
+        "metric": config.INDEX_PARAMS.get("metric", "l2"),
+    }
+
+
+def with_source_entries(documents, entries, page_hashes=None):
+    """
+    Inoltra i documenti (relpath, testo) registrando in entries la voce del manifest di ciascuno:
+    file locali per stat e hash, pagine web per hash del testo e del corpo HTML (page_hashes).
+    """
+    page_hashes = page_hashes or {}
+    for relpath, content in documents:
+        if os.path.isfile(os.path.join(DOCUMENTS_DIR, relpath)):
+            entries[relpath] = file_entry(DOCUMENTS_DIR, relpath)
+        else:
+            entries[relpath] = {"size": len(content.encode("utf-8")), "mtime": None, "sha256": text_sha256(content),
+                                "body_sha256": page_hashes.get(relpath)}
+        yield relpath, content
+
+
+def write_chunk_log(chunks, metadata):
+    count = 0
+    with open(CHUNK_LOG, "w", encoding="utf-8") as out:
+        for chunk, meta in zip(chunks, metadata):
+            if meta is None:  # chunk rimosso da un aggiornamento incrementale
+                continue
+            out.write(json.dumps({
+                "text": chunk,
+                "source": meta.get("source"),
+                "description": meta.get("description"),
+                "tags": meta.get("tags")
+            }) + "\n")
+            count += 1
+    return count
+
+
+def apply_changes(documents, remove_sources, unchanged, write_manifest=True, page_hashes=None,
+                  progress=no_progress, total=None):
+    """
+    Pubblica una nuova generazione a partire da quella attiva: calcola gli embedding solo dei
+    documenti in documents (total, se noto, è il loro numero) e rimuove i chunk dei documenti in
+    remove_sources. I documenti invariati mantengono chunk ed embedding; ne vengono aggiornati solo
+    i metadati (metadata.json), con la loro impronta nel manifest.
+    """
+    metadata_index = load_metadata(METADATA_PATH)
+    entries = {}
+    progress("embedding", 0, total)
+    result = run_ingest_pipeline(with_source_entries(documents, entries, page_hashes), metadata_index,
+                                 progress, total)
+
+    source_path = resolve_index_path(INDEX_PATH)
+    metadata_updates = {relpath: document_metadata(relpath, metadata_index) for relpath in unchanged}
+    changes = {}
+
+    def save(path):
+        changes["added"], changes["removed"] = update_faiss_index(
+            source_path, path, result.vectors.array(), result.texts, result.metadata,
+            remove_sources=remove_sources, metadata_updates=metadata_updates, token_counts=result.token_counts,
+            compact_ratio=config.INDEX_COMPACT_TOMBSTONE_RATIO
+        )
+        if write_manifest:
+            documents = {relpath: dict(entry, metadata_sha256=metadata_sha256(metadata_updates[relpath]))
+                         for relpath, entry in unchanged.items()}
+            added_ids = chunk_ids_by_source(result.metadata, changes["added"])
+            for relpath, entry in entries.items():
+                documents[relpath] = dict(entry, chunk_ids=added_ids.get(relpath, []),
+                                          metadata_sha256=metadata_sha256(document_metadata(relpath, metadata_index)))
+            write_sources(path, chunking_params(), documents)
+
+    try:
+        progress("indice")  # ultimo punto di annullamento: la generazione viene pubblicata per intero
+        generation = publish_generation(INDEX_PATH, save, keep=config.INDEX_KEEP_GENERATIONS)
+    finally:
+        result.vectors.close()
+    logger.info(f"🔁 Aggiornamento incrementale: {len(changes['added'])} chunk aggiunti, "
+                f"{len(changes['removed'])} rimossi (generazione: {generation}).")
+
+    store = ChunkStore.open(resolve_index_path(INDEX_PATH), mmap_mode=False)
+    write_chunk_log(store.texts, store.metadata)
+    return changes
+
+
+def update_index(add_paths, remove_paths, progress=no_progress):
+    """
+    Aggiornamento incrementale dell'indice: calcola gli embedding solo dei documenti aggiunti
+    e rimuove i chunk dei documenti eliminati, senza rielaborare il resto del corpus.
+    Un documento già indicizzato e aggiunto di nuovo sostituisce la versione precedente.
+    """
+    missing = [relpath for relpath in add_paths if not os.path.isfile(os.path.join(DOCUMENTS_DIR, relpath))]
+    if missing:
+        raise FileNotFoundError(f"Documenti non trovati in {DOCUMENTS_DIR}: {', '.join(missing)}")
+    replaced = set(add_paths) | set(remove_paths)
+    sources = read_sources(resolve_index_path(INDEX_PATH))
+    # Senza manifest (indice precedente) non lo si crea parziale: il prossimo run completo lo scriverà
+    unchanged = {
+        relpath: entry for relpath, entry in (sources or {}).get("documents", {}).items() if relpath not in replaced
+    }
+    return apply_changes(iter_files(list(add_paths)), replaced, unchanged, write_manifest=sources is not None,
+                         progress=progress, total=len(add_paths))
+
+
+def ingest_incremental(progress=no_progress):
+    """
+    Ingestione incrementale guidata dal manifest dei documenti: rielabora solo i documenti
+    aggiunti, modificati o rimossi dall'ultima indicizzazione. Se sono cambiati solo i metadati
+    (metadata.json) pubblica una generazione con i chunk esistenti e i metadati aggiornati.
+    Senza manifest o con parametri di chunking diversi esegue una reindicizzazione completa.
+    """
+    progress("scansione")
+    current = resolve_index_path(INDEX_PATH)
+    sources = read_sources(current) if os.path.exists(current) else None
+    if sources is None or sources.get("params") != chunking_params():
+        logger.info("📥 Manifest dei documenti assente o parametri cambiati: reindicizzazione completa")
+        return ingest_all(progress)
+
+    previous = sources["documents"]
+    previous_files = {relpath: entry for relpath, entry in previous.items() if entry.get("mtime") is not None}
+    previous_pages = {relpath: entry for relpath, entry in previous.items() if entry.get("mtime") is None}
+    added, changed, removed, unchanged = scan_changes(DOCUMENTS_DIR, list_documents(DOCUMENTS_DIR), previous_files)
+
+    file_paths = list(added) + list(changed)
+    pages, page_hashes = [], {}
+    urls = read_urls(URLS_FILE)
+    progress("pagine web", 0, len(urls))
+    for page in fetch_web_pages(urls):
+        prev = previous_pages.pop(page.url, None)
+        if page.html is None:
+            # Pagina non raggiungibile in questo run: si mantengono i chunk dell'ultima versione scaricata
+            if prev is not None:
+                unchanged[page.url] = prev
+            continue
+        if prev is not None and prev.get("body_sha256") == page.sha256:
+            # Corpo identico (tipicamente 304): nessuna estrazione, chunking o embedding
+            unchanged[page.url] = prev
+            continue
+        body = page_text(page.url, page.html)
+        if prev is not None and prev["sha256"] == text_sha256(body):
+            unchanged[page.url] = dict(prev, body_sha256=page.sha256)
+            continue
+        (changed if prev is not None else added)[page.url] = None
+        pages.append((page.url, body))
+        page_hashes[page.url] = page.sha256
+    # Pagine tolte dall'elenco in urls.txt: i loro chunk vengono rimossi
+    removed = list(removed) + list(previous_pages)
 
     metadata_index = load_metadata(METADATA_PATH)
+    retagged = [relpath for relpath, entry in unchanged.items()
+                if entry.get("metadata_sha256") != metadata_sha256(document_metadata(relpath, metadata_index))]
 
-    chunks = []
-    metadata = []
+    logger.info(f"📄 Documenti aggiunti: {len(added)}, modificati: {len(changed)}, "
+                f"rimossi: {len(removed)}, invariati: {len(unchanged)} (metadati aggiornati: {len(retagged)})")
+    if not (added or changed or removed or retagged):
+        logger.info("✅ Nessun documento modificato: indice invariato")
+        return {"added": [], "removed": []}
 
-    for relpath, content in texts:
-        logger.info(f"Elaborazione: {relpath}")
-        doc_chunks = chunk_text(content)
-        chunks.extend(doc_chunks)
+    return apply_changes(itertools.chain(iter_files(file_paths), pages), set(changed) | set(removed), unchanged,
+                         page_hashes=page_hashes, progress=progress, total=len(file_paths) + len(pages))
 
-        meta_entry = metadata_index.get(relpath, {})
-        meta_base = {
-            "source": relpath,
-            "description": meta_entry.get("description", ""),
-            "tags": meta_entry.get("tags", [])
-        }
-        metadata.extend([meta_base] * len(doc_chunks))
 
-    logger.info(f"✂️ Totale chunk generati: {len(chunks)}")
+def ingest_all(progress=no_progress):
+    """Reindicizzazione completa: documenti locali e pagine web"""
+    logger.info("📥 Caricamento documenti da cartella e web...")
+    progress("scansione")
+
+    relpaths = list_documents(DOCUMENTS_DIR)
+    urls = read_urls(URLS_FILE)
+    logger.info(f"📄 Documenti locali trovati: {len(relpaths)}, pagine web: {len(urls)}")
 
-    vectors = embed_chunks(chunks)
-    save_faiss_index(vectors, chunks, metadata, INDEX_PATH)
+    metadata_index = load_metadata(METADATA_PATH)
 
-    logger.info("💾 Indicizzazione completata e salvata in FAISS.")
+    # Documenti caricati, suddivisi e inviati agli embedding in streaming
+    entries = {}
+    progress("pagine web", 0, len(urls))
+    pages = fetch_web_pages(urls)
+    page_hashes = {page.url: page.sha256 for page in pages}
+    documents = itertools.chain(iter_files(relpaths), iter_web_pages(pages))
+    total = len(relpaths) + sum(page.html is not None for page in pages)
+    progress("embedding", 0, total)
+    result = run_ingest_pipeline(with_source_entries(documents, entries, page_hashes), metadata_index,
+                                 progress, total)
+    chunks, metadata = result.texts, result.metadata
+
+    chunk_ids = chunk_ids_by_source(metadata, range(len(chunks)))
+    documents = {
+        relpath: dict(entry, chunk_ids=chunk_ids.get(relpath, []),
+                      metadata_sha256=metadata_sha256(document_metadata(relpath, metadata_index)))
+        for relpath, entry in entries.items()
+    }
+
+    def save(path):
+        save_faiss_index(result.vectors.array(), chunks, metadata, path,
+                         index_type=config.INDEX_TYPE, index_params=config.INDEX_PARAMS,
+                         add_batch_size=INDEX_ADD_BATCH_SIZE, token_counts=result.token_counts)
+        write_sources(path, chunking_params(), documents)
+
+    # Nuova generazione dell'indice: i processi in esecuzione la caricano senza riavvio
+    try:
+        progress("indice")
+        generation = publish_generation(INDEX_PATH, save, keep=config.INDEX_KEEP_GENERATIONS)
+    finally:
+        result.vectors.close()
+
+    logger.info(f"💾 Indicizzazione completata e salvata in FAISS (tipo: {config.INDEX_TYPE}, generazione: {generation}).")
+
+    write_chunk_log(chunks, metadata)
+
+    print(f"✅ Salvati {len(chunks)} chunk in {CHUNK_LOG}")
+    return {"chunks": len(chunks), "generation": generation}
+
+
+def verify_index():
+    """Verifica completa (dimensioni e checksum sha256) della generazione attiva dell'indice"""
+    generation = current_generation(INDEX_PATH)
+    if generation is None:
+        raise SystemExit(f"❌ Nessuna generazione attiva per {INDEX_PATH}")
+    try:
+        verify_generation(os.path.dirname(resolve_index_path(INDEX_PATH)), checksums=True)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    logger.info(f"✅ Generazione {generation} integra")
 
-    with open(CHUNK_LOG, "w", encoding="utf-8") as out:
-        for chunk, meta in zip(chunks, metadata):
-            out.write(json.dumps({
-                "text": chunk,
-                "source": meta.get("source"),
-                "description": meta.get("description"),
-                "tags": meta.get("tags")
-            }) + "\n")
 
-    print(f"✅ Salvati {len(chunks)} chunk in {CHUNK_LOG}")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indicizzazione dei documenti")
+    parser.add_argument("--add", nargs="+", default=[], metavar="PATH",
+                        help=f"Documenti (relativi a {DOCUMENTS_DIR}) da aggiungere o aggiornare senza reindicizzare tutto")
+    parser.add_argument("--remove", nargs="+", default=[], metavar="PATH",
+                        help="Documenti da rimuovere dall'indice")
+    parser.add_argument("--full", action="store_true",
+                        help="Reindicizza tutti i documenti ignorando il manifest")
+    parser.add_argument("--verify", action="store_true",
+                        help="Verifica i checksum della generazione attiva dell'indice, senza indicizzare")
+    args = parser.parse_args()
+
+    if args.verify:
+        verify_index()
+    elif args.add or args.remove:
+        update_index(args.add, args.remove)
+    elif args.full:
+        ingest_all()
+    else:
+        ingest_incremental()
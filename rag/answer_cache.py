@@ -0,0 +1,114 @@
+"""
+Cache semantica delle risposte di /ask.
+
+Le domande già risposte (risposte accettate, non di fallback) sono memorizzate in un piccolo
+indice FAISS a prodotto interno sui loro embedding normalizzati. Una nuova domanda abbastanza
+simile (es. "wifi password?" / "qual è il codice del wi-fi") riceve la risposta precedente
+senza chiamare il modello di chat.
+
+Una domanda che differisce solo per un numero o un codice ("keybox Hb 3" / "Hb 4", numeri
+di camera) ha un embedding quasi identico: la risposta viene riusata solo se anche gli
+identificativi delle due domande coincidono (query_identifiers).
+
+Ogni voce registra lingua e generazione dell'indice con cui è stata prodotta: quando la
+generazione attiva cambia (reindicizzazione) la cache viene svuotata.
+"""
+import threading
+from itertools import count
+from typing import Any, Dict, Optional
+import faiss
+import numpy as np
+from .query_cache import query_identifiers
+
+class SemanticAnswerCache:
+    """Indice FAISS (coseno) delle domande passate con le relative risposte"""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 2000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.generation: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._index: Optional[faiss.IndexIDMap2] = None
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalized(vector: np.ndarray) -> np.ndarray:
+        vector = np.array(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _check_generation(self, generation: Optional[str]) -> None:
+        """Svuota la cache se l'indice dei documenti è cambiato (con il lock acquisito)"""
+        if generation != self.generation:
+            self._index = None
+            self._entries.clear()
+            self.generation = generation
+
+    def lookup(self, question: str, vector: np.ndarray, lang: str, generation: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Voce in cache per la domanda più simile sopra soglia, nella stessa lingua e con gli stessi identificativi"""
+        query = self._normalized(vector)
+        identifiers = query_identifiers(question)
+        with self._lock:
+            self._check_generation(generation)
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+            # Più candidati che risposte attese: varianti con altri identificativi hanno score quasi uguali
+            scores, ids = self._index.search(query, min(16, self._index.ntotal))
+            for score, entry_id in zip(scores[0].tolist(), ids[0].tolist()):
+                if score < self.threshold:
+                    break
+                entry = self._entries.get(entry_id)
+                if entry is not None and entry["lang"] == lang and entry["identifiers"] == identifiers:
+                    self.hits += 1
+                    return dict(entry, similarity=score)
+            self.misses += 1
+            return None
+
+    def add(self, question: str, vector: np.ndarray, answer: str, lang: str,
+            generation: Optional[str], overlap: Optional[float] = None) -> None:
+        """Memorizza una risposta accettata per la domanda"""
+        query = self._normalized(vector)
+        with self._lock:
+            if generation != self.generation:
+                if self._entries:
+                    return  # risposta prodotta con una generazione non più attiva
+                self.generation = generation
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(query.shape[1]))
+            if len(self._entries) >= self.max_entries:
+                # Rimuove la voce più vecchia (gli id sono crescenti)
+                oldest = min(self._entries)
+                self._index.remove_ids(np.array([oldest], dtype=np.int64))
+                del self._entries[oldest]
+            entry_id = next(self._ids)
+            self._index.add_with_ids(query, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "question": question,
+                "identifiers": query_identifiers(question),
+                "answer": answer,
+                "lang": lang,
+                "generation": generation,
+                "overlap": overlap,
+            }
+
+    def clear(self) -> None:
+        """Svuota la cache"""
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di hit/miss dall'avvio del processo"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "generation": self.generation,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
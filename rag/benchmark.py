@@ -0,0 +1,171 @@
+"""
+Benchmark dei tipi di indice FAISS: recall@k rispetto alla ricerca esatta (flat),
+latenza di ricerca p50/p99 per singola query, throughput in modalità batch e
+memoria dei dati scansionati (per gli indici quantizzati solo i codici compressi).
+
+Uso:
+    python -m rag.benchmark --index rag/index.faiss
+    python -m rag.benchmark --synthetic 50000 --ef-search 16 32 64 --nprobe 4 8 16
+    python -m rag.benchmark --synthetic 50000 --quantized sq8 pq --rerank 1 4 8
+"""
+import argparse
+import time
+from typing import Dict, List, Any, Optional
+import faiss
+import numpy as np
+from .chunkstore import DELETED_DOC_ID, ChunkStore, has_chunk_store
+from .generations import resolve_index_path
+from .vectorstore import (build_faiss_index, apply_search_params, index_memory_bytes, recall_at_k,
+                          reconstruct_vectors)
+
+def load_index_vectors(index_path: str) -> np.ndarray:
+    """
+    Ricostruisce i vettori dei chunk presenti in un indice salvato, per id: dopo gli aggiornamenti
+    incrementali gli id non sono contigui e i chunk rimossi (anche come tombstone) vengono esclusi.
+    """
+    path = resolve_index_path(index_path)
+    index = faiss.read_index(path)
+    if has_chunk_store(path):
+        ids = np.flatnonzero(ChunkStore.open(path).doc_ids != DELETED_DOC_ID)
+    elif isinstance(index, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(index.id_map)
+    else:
+        ids = np.arange(index.ntotal)
+    return reconstruct_vectors(index, ids)
+
+def synthetic_vectors(n: int, dim: int = 1536, seed: int = 0) -> np.ndarray:
+    """Genera vettori casuali normalizzati per stimare il comportamento su corpus più grandi"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def sample_queries(vectors: np.ndarray, n_queries: int, noise: float = 0.05, seed: int = 1) -> np.ndarray:
+    """Crea query perturbando vettori del corpus (simula domande vicine a un chunk)"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + noise * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    return np.ascontiguousarray(queries, dtype=np.float32)
+
+def measure(index: faiss.Index, queries: np.ndarray, k: int) -> Dict[str, Any]:
+    """Esegue una query alla volta (come /ask) e misura la latenza"""
+    timings = []
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, I = index.search(q.reshape(1, -1), k)
+        timings.append((time.perf_counter() - start) * 1000)
+        ids[i] = I[0]
+    timings = np.array(timings)
+
+    # Stesse query in un'unica chiamata multi-query (come search_batch)
+    start = time.perf_counter()
+    index.search(queries, k)
+    batch_s = time.perf_counter() - start
+    return {
+        "ids": ids,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "batch_qps": len(queries) / batch_s if batch_s > 0 else float("inf"),
+    }
+
+def run_benchmark(vectors: np.ndarray, queries: np.ndarray, k: int = 5,
+                  ef_search: Optional[List[int]] = None,
+                  nprobe: Optional[List[int]] = None,
+                  hnsw_m: int = 32, nlist: Optional[int] = None,
+                  quantized: Optional[List[str]] = None,
+                  rerank: Optional[List[int]] = None,
+                  pq_m: int = 64) -> List[Dict[str, Any]]:
+    """Confronta flat, HNSW, IVF-Flat e gli indici quantizzati sugli stessi vettori e query"""
+    k = min(k, len(vectors))
+    rows = []
+
+    start = time.perf_counter()
+    flat, _ = build_faiss_index(vectors, "flat")
+    build_s = time.perf_counter() - start
+    baseline = measure(flat, queries, k)
+    rows.append({"index_type": "flat", "setting": "-", "build_s": build_s, "mem_mb": index_memory_bytes(flat) / 1e6,
+                 "recall": 1.0, "p50_ms": baseline["p50_ms"], "p99_ms": baseline["p99_ms"],
+                 "batch_qps": baseline["batch_qps"]})
+
+    start = time.perf_counter()
+    hnsw, hnsw_params = build_faiss_index(vectors, "hnsw", {"M": hnsw_m})
+    build_s = time.perf_counter() - start
+    for ef in ef_search or [hnsw_params["efSearch"]]:
+        apply_search_params(hnsw, {"efSearch": max(ef, k)})
+        result = measure(hnsw, queries, k)
+        rows.append({"index_type": "hnsw", "setting": f"M={hnsw_m} efSearch={ef}", "build_s": build_s,
+                     "mem_mb": index_memory_bytes(hnsw) / 1e6,
+                     "recall": recall_at_k(result["ids"], baseline["ids"], k),
+                     "p50_ms": result["p50_ms"], "p99_ms": result["p99_ms"],
+                     "batch_qps": result["batch_qps"]})
+
+    start = time.perf_counter()
+    ivf, ivf_params = build_faiss_index(vectors, "ivf", {"nlist": nlist})
+    build_s = time.perf_counter() - start
+    for probe in nprobe or [ivf_params["nprobe"]]:
+        probe = min(probe, ivf_params["nlist"])
+        apply_search_params(ivf, {"nprobe": probe})
+        result = measure(ivf, queries, k)
+        rows.append({"index_type": "ivf", "setting": f"nlist={ivf_params['nlist']} nprobe={probe}", "build_s": build_s,
+                     "mem_mb": index_memory_bytes(ivf) / 1e6,
+                     "recall": recall_at_k(result["ids"], baseline["ids"], k),
+                     "p50_ms": result["p50_ms"], "p99_ms": result["p99_ms"],
+                     "batch_qps": result["batch_qps"]})
+
+    for index_type in quantized or []:
+        if index_type == "pq" and vectors.shape[1] % pq_m != 0:
+            print(f"⚠️ pq ignorato: pq_m={pq_m} non divide la dimensione {vectors.shape[1]}")
+            continue
+        start = time.perf_counter()
+        quant, quant_params = build_faiss_index(vectors, index_type, {"pq_m": pq_m, "rerank": max(rerank or [4])})
+        build_s = time.perf_counter() - start
+        for factor in rerank or [quant_params["rerank"]]:
+            # rerank=1 equivale a usare solo i codici compressi
+            apply_search_params(quant, {"rerank": max(factor, 1)})
+            result = measure(quant, queries, k)
+            rows.append({"index_type": index_type, "setting": f"rerank={factor}", "build_s": build_s,
+                         "mem_mb": index_memory_bytes(quant) / 1e6,
+                         "recall": recall_at_k(result["ids"], baseline["ids"], k),
+                         "p50_ms": result["p50_ms"], "p99_ms": result["p99_ms"],
+                         "batch_qps": result["batch_qps"]})
+
+    return rows
+
+def print_report(rows: List[Dict[str, Any]], n_vectors: int, k: int) -> None:
+    """Stampa i risultati in forma tabellare"""
+    print(f"📊 Benchmark indici FAISS — {n_vectors} vettori, recall@{k}")
+    print(f"{'tipo':<6} {'impostazione':<28} {'build(s)':>9} {'mem(MB)':>8} {'recall':>7} {'p50(ms)':>8} {'p99(ms)':>8} {'batch q/s':>10}")
+    for row in rows:
+        print(f"{row['index_type']:<6} {row['setting']:<28} {row['build_s']:>9.2f} {row['mem_mb']:>8.1f} "
+              f"{row['recall']:>7.3f} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['batch_qps']:>10.0f}")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark recall/latenza degli indici FAISS")
+    parser.add_argument("--index", default="rag/index.faiss", help="Indice da cui ricostruire i vettori")
+    parser.add_argument("--synthetic", type=int, default=0, help="Usa N vettori casuali invece dell'indice")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimensione dei vettori sintetici")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--quantized", nargs="*", default=["sq8", "sqfp16", "pq"],
+                        help="Indici quantizzati da confrontare (sq8, sqfp16, pq)")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--pq-m", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = load_index_vectors(args.index)
+    queries = sample_queries(vectors, args.queries)
+    rows = run_benchmark(vectors, queries, k=args.k, ef_search=args.ef_search,
+                         nprobe=args.nprobe, hnsw_m=args.hnsw_m, nlist=args.nlist,
+                         quantized=args.quantized, rerank=args.rerank, pq_m=args.pq_m)
+    print_report(rows, len(vectors), min(args.k, len(vectors)))
+
+if __name__ == "__main__":
+    main()
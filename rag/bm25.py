@@ -0,0 +1,129 @@
+"""
+Indice lessicale BM25 in memoria, costruito in fase di ingest dai testi dei chunk.
+
+La struttura è un indice invertito in formato CSR (array compatti invece di dict di dict):
+    term_offsets  int64[V + 1]  le posting del termine t sono in [term_offsets[t], term_offsets[t + 1])
+    posting_ids   int32[nnz]    id dei chunk che contengono il termine
+    posting_w     float32[nnz]  peso BM25 della posting (tf saturato e normalizzato per lunghezza)
+    idf           float32[V]
+Il vocabolario è salvato come blob UTF-8 separato da "\\n".
+Una query somma idf * peso sulle posting dei suoi termini: pochi microsecondi, nessuna chiamata API.
+"""
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+BM25_SUFFIX = ".bm25.npz"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Parole funzionali italiane (e le più comuni inglesi): compaiono in quasi ogni chunk, quindi nella
+# query non indicano pertinenza. Restano nell'indice, vengono ignorate solo in ricerca.
+STOPWORDS = frozenset("""
+a ad agli ai al alla alle allo anche che chi ci come con cosa da dal dalla dalle dei del della delle dello
+di dove e ed è gli ha hanno ho i il in io la le lo ma mi ne nei nel nella nelle no non o per più quale
+quali quando se si sono su sul sulla tra un una uno vi
+an and are can do does how is it of on or the to what where when which with you
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizzazione minimale: parole e numeri in minuscolo (es. 'Hb 3' -> ['hb', '3'])"""
+    return TOKEN_RE.findall(text.lower())
+
+def query_terms(query: str) -> List[str]:
+    """Termini di ricerca della query, senza stopword"""
+    return [t for t in tokenize(query) if t not in STOPWORDS]
+
+class BM25Index:
+    """Indice invertito BM25 su array NumPy"""
+
+    def __init__(self, vocab: Dict[str, int], term_offsets: np.ndarray, posting_ids: np.ndarray,
+                 posting_w: np.ndarray, idf: np.ndarray, n_docs: int):
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.posting_ids = posting_ids
+        self.posting_w = posting_w
+        self.idf = idf
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, texts: Sequence[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Costruisce l'indice dai testi dei chunk (l'id di un chunk è la sua posizione)"""
+        vocab: Dict[str, int] = {}
+        rows: List[Tuple[int, int, int]] = []  # (term_id, chunk_id, tf)
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for chunk_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[chunk_id] = sum(counts.values())
+            for term, tf in counts.items():
+                rows.append((vocab.setdefault(term, len(vocab)), chunk_id, tf))
+
+        n_docs = len(texts)
+        if not rows:
+            return cls({}, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                       np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32), n_docs)
+
+        postings = np.array(rows, dtype=np.int64)
+        postings = postings[np.lexsort((postings[:, 1], postings[:, 0]))]
+        term_ids, posting_ids, tf = postings[:, 0], postings[:, 1].astype(np.int32), postings[:, 2].astype(np.float32)
+
+        df = np.bincount(term_ids, minlength=len(vocab))
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=term_offsets[1:])
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        avgdl = float(doc_len.mean()) or 1.0
+        norm = k1 * (1 - b + b * doc_len[posting_ids] / avgdl)
+        posting_w = (tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+        return cls(vocab, term_offsets, posting_ids, posting_w, idf, n_docs)
+
+    def save(self, path: str) -> None:
+        """Salva l'indice accanto all'indice FAISS (<path>.bm25.npz)"""
+        terms = sorted(self.vocab, key=self.vocab.get)
+        vocab_blob = np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8)
+        with open(path + BM25_SUFFIX, "wb") as f:
+            np.savez(f, vocab=vocab_blob, term_offsets=self.term_offsets, posting_ids=self.posting_ids,
+                     posting_w=self.posting_w, idf=self.idf, n_docs=np.array([self.n_docs], dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Carica l'indice BM25 se presente, altrimenti None"""
+        if not os.path.exists(path + BM25_SUFFIX):
+            return None
+        with np.load(path + BM25_SUFFIX) as data:
+            blob = data["vocab"].tobytes().decode("utf-8")
+            terms = blob.split("\n") if blob else []
+            return cls({term: i for i, term in enumerate(terms)}, data["term_offsets"], data["posting_ids"],
+                       data["posting_w"], data["idf"], int(data["n_docs"][0]))
+
+    def search(self, query: str, top_k: int = 5,
+               id_bitmap: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Restituisce id e punteggi dei top_k chunk (solo quelli con almeno un termine non stopword in comune)"""
+        term_ids = {self.vocab[t] for t in query_terms(query) if t in self.vocab}
+        if not term_ids or top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for t in term_ids:
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            scores[self.posting_ids[start:end]] += self.idf[t] * self.posting_w[start:end]
+        if id_bitmap is not None:
+            allowed = np.unpackbits(id_bitmap, count=self.n_docs, bitorder="little").astype(bool)
+            scores[~allowed] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return order.astype(np.int64), scores[order]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Combina più classifiche di id con Reciprocal Rank Fusion: score(id) = somma 1 / (k + rank).
+    Restituisce le coppie (id, score) in ordine decrescente.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[int(chunk_id)] = fused.get(int(chunk_id), 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,149 @@
+"""
+Suddivisione dei documenti in chunk per numero di token.
+
+    - un solo encoder tiktoken per processo, con la lunghezza in byte di ogni token calcolata una volta
+    - encode_batch su più documenti insieme (tiktoken usa più thread)
+    - i chunk sono porzioni del testo originale, ritagliate per offset di carattere: nessuna
+      decodifica dei token e nessun carattere multi-byte spezzato
+    - il taglio cade preferibilmente prima di un titolo markdown, altrimenti a fine frase o
+      almeno tra due parole, purché il chunk abbia almeno metà della dimensione richiesta
+    - ogni chunk riporta il numero di token del proprio testo, spazi iniziali e finali esclusi
+      (per il budget del prompt)
+"""
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import tiktoken
+
+ENCODING_NAME = "cl100k_base"
+# Cambia quando cambiano i confini dei chunk: fa parte dei parametri del manifest dei documenti
+CHUNKER_VERSION = 3
+
+_HEADING_RE = re.compile(r"^#{1,6}[ \t]", re.MULTILINE)
+_SENTENCE_END_RE = re.compile(r"[.!?…:;](?=\s)|\n[ \t]*\n")
+_SPACE_RE = re.compile(r"\s+")
+
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_token_lengths: Dict[str, np.ndarray] = {}
+_lock = threading.Lock()
+
+def get_encoding(name: str = ENCODING_NAME) -> tiktoken.Encoding:
+    """Encoder tiktoken condiviso (creato alla prima richiesta)"""
+    with _lock:
+        if name not in _encodings:
+            _encodings[name] = tiktoken.get_encoding(name)
+        return _encodings[name]
+
+def token_byte_lengths(encoding: tiktoken.Encoding) -> np.ndarray:
+    """Lunghezza in byte UTF-8 di ogni token del vocabolario"""
+    with _lock:
+        lengths = _token_lengths.get(encoding.name)
+        if lengths is None:
+            lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+            for token in range(encoding.n_vocab):
+                try:
+                    lengths[token] = len(encoding.decode_single_token_bytes(token))
+                except KeyError:
+                    pass  # id non assegnato nel vocabolario
+            _token_lengths[encoding.name] = lengths
+        return lengths
+
+class Chunk:
+    """Porzione di un documento: testo, numero di token e posizione (caratteri) nel documento"""
+
+    __slots__ = ("text", "tokens", "start", "end")
+
+    def __init__(self, text: str, tokens: int, start: int, end: int):
+        self.text = text
+        self.tokens = tokens
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return f"Chunk(tokens={self.tokens}, start={self.start}, end={self.end})"
+
+def _token_char_starts(text: str, tokens: Sequence[int], lengths: np.ndarray) -> np.ndarray:
+    """
+    Offset di carattere dell'inizio di ogni token (n + 1 valori, l'ultimo è len(text)).
+    Un token che inizia a metà di un carattere multi-byte viene spostato all'inizio del
+    carattere successivo, così ogni taglio cade su un confine di carattere.
+    """
+    encoded = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    # chars_before[b] = numero di caratteri che iniziano prima del byte b
+    chars_before = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum((encoded & 0xC0) != 0x80, out=chars_before[1:])
+    byte_starts = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(lengths[np.asarray(tokens, dtype=np.int64)], out=byte_starts[1:])
+    return chars_before[byte_starts]
+
+def _split(text: str, tokens: Sequence[int], lengths: np.ndarray, size: int, overlap: int) -> List[Chunk]:
+    n = len(tokens)
+    if n == 0:
+        return []
+    char_starts = _token_char_starts(text, tokens, lengths)
+    # Confini preferiti, come indice del primo token che li segue. Tra due parole si taglia
+    # all'inizio dello spazio: negli encoding GPT lo spazio appartiene al token della parola successiva
+    headings = np.searchsorted(char_starts, [m.start() for m in _HEADING_RE.finditer(text)])
+    sentences = np.searchsorted(char_starts, [m.end() for m in _SENTENCE_END_RE.finditer(text)])
+    words = np.searchsorted(char_starts, [m.start() for m in _SPACE_RE.finditer(text)])
+    headings = np.unique(headings[(headings > 0) & (headings < n)])
+    sentences = np.unique(sentences[(sentences > 0) & (sentences < n)])
+    words = np.unique(words[(words > 0) & (words < n)])
+
+    chunks: List[Chunk] = []
+    start = 0
+    while start < n:
+        end = min(start + size, n)
+        at_heading = False
+        if end < n:
+            low = start + max(1, size // 2)
+            candidates = headings[(headings >= low) & (headings <= end)]
+            if len(candidates):
+                end, at_heading = int(candidates[-1]), True
+            else:
+                for boundaries in (sentences, words):
+                    candidates = boundaries[(boundaries >= low) & (boundaries <= end)]
+                    if len(candidates):
+                        end = int(candidates[-1])
+                        break
+        piece = text[char_starts[start]:char_starts[end]]
+        stripped = piece.strip()
+        if stripped:
+            lead = len(piece) - len(piece.lstrip())
+            chunk_start = int(char_starts[start]) + lead
+            chunks.append(Chunk(stripped, end - start, chunk_start, chunk_start + len(stripped)))
+        if end >= n:
+            break
+        if at_heading or overlap <= 0:
+            start = end  # nessuna sovrapposizione oltre un titolo
+        else:
+            # Sovrapposizione di al più `overlap` token, dall'inizio di una frase o di una parola
+            start = max(end - overlap, start + 1)
+            for boundaries in (sentences, words):
+                candidates = boundaries[(boundaries >= start) & (boundaries < end)]
+                if len(candidates):
+                    start = int(candidates[0])
+                    break
+    return chunks
+
+def chunk_texts(texts: Sequence[str], size: int = 500, overlap: int = 50,
+                encoding: Optional[tiktoken.Encoding] = None) -> List[List[Chunk]]:
+    """Chunk di più documenti, con una sola chiamata encode_batch"""
+    if overlap >= size:
+        raise ValueError(f"overlap ({overlap}) deve essere minore di size ({size})")
+    encoding = encoding or get_encoding()
+    lengths = token_byte_lengths(encoding)
+    # disallowed_special=(): testo come "<|endoftext|>" nei documenti è trattato come testo normale
+    encoded = encoding.encode_batch(list(texts), disallowed_special=())
+    chunked = [_split(text, tokens, lengths, size, overlap) for text, tokens in zip(texts, encoded)]
+    # Token del testo memorizzato (senza gli spazi rimossi ai bordi): è quello che entra nel prompt
+    pieces = [chunk for chunks in chunked for chunk in chunks]
+    for chunk, tokens in zip(pieces, encoding.encode_batch([c.text for c in pieces], disallowed_special=())):
+        chunk.tokens = len(tokens)
+    return chunked
+
+def chunk_text(text: str, size: int = 500, overlap: int = 50,
+               encoding: Optional[tiktoken.Encoding] = None) -> List[Chunk]:
+    """Chunk di un singolo documento"""
+    return chunk_texts([text], size, overlap, encoding)[0]
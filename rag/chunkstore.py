@@ -0,0 +1,152 @@
+"""
+Archivio colonnare dei chunk, affiancato all'indice FAISS.
+
+Formato su disco (prefisso = percorso dell'indice):
+    <prefisso>.texts.bin    blob UTF-8 con i testi concatenati
+    <prefisso>.offsets.npy  int64[n + 1], il chunk i occupa blob[offsets[i]:offsets[i + 1]]
+    <prefisso>.docs.json    tabella dei documenti (source, description, tags), una riga per documento
+    <prefisso>.doc_ids.npy  int32[n], documento di appartenenza di ogni chunk (-1 = chunk rimosso)
+    <prefisso>.tokens.npy   int32[n], token di ogni chunk (facoltativo, -1 = non noto)
+
+Blob e array sono mappati in memoria: all'avvio non viene decodificato nessun testo,
+la ricerca decodifica solo i k chunk restituiti.
+
+L'indice di riga di un chunk è anche il suo id nell'indice FAISS e non cambia mai: i chunk
+rimossi da un aggiornamento incrementale restano come righe vuote con metadati None.
+"""
+import json
+import mmap
+import os
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+TEXTS_SUFFIX = ".texts.bin"
+OFFSETS_SUFFIX = ".offsets.npy"
+DOCS_SUFFIX = ".docs.json"
+DOC_IDS_SUFFIX = ".doc_ids.npy"
+TOKENS_SUFFIX = ".tokens.npy"
+CHUNK_STORE_SUFFIXES = (TEXTS_SUFFIX, OFFSETS_SUFFIX, DOCS_SUFFIX, DOC_IDS_SUFFIX)
+DELETED_DOC_ID = -1
+
+def has_chunk_store(path: str) -> bool:
+    """Verifica se accanto all'indice esiste l'archivio colonnare"""
+    return all(os.path.exists(path + suffix) for suffix in CHUNK_STORE_SUFFIXES)
+
+def write_chunk_store(path: str, texts: List[str], metadata: List[Optional[Dict[str, Any]]],
+                      token_counts: Optional[Sequence] = None) -> None:
+    """Scrive testi e metadati nel formato colonnare (metadati None = chunk rimosso)"""
+    if len(texts) != len(metadata):
+        raise ValueError(f"Numero di testi ({len(texts)}) e metadati ({len(metadata)}) diverso")
+    if token_counts is not None and len(token_counts) != len(texts):
+        raise ValueError(f"Numero di testi ({len(texts)}) e conteggi di token ({len(token_counts)}) diverso")
+
+    # Tabella documenti: i metadati identici (stesso documento) sono memorizzati una sola volta
+    docs: List[Dict[str, Any]] = []
+    doc_keys: Dict[str, int] = {}
+    doc_ids = np.empty(len(metadata), dtype=np.int32)
+    for i, meta in enumerate(metadata):
+        if meta is None:
+            doc_ids[i] = DELETED_DOC_ID
+            continue
+        key = json.dumps(meta, sort_keys=True, ensure_ascii=False)
+        if key not in doc_keys:
+            doc_keys[key] = len(docs)
+            docs.append(meta)
+        doc_ids[i] = doc_keys[key]
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(path + TEXTS_SUFFIX, "wb") as f:
+        for i, text in enumerate(texts):
+            encoded = text.encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+
+    np.save(path + OFFSETS_SUFFIX, offsets)
+    np.save(path + DOC_IDS_SUFFIX, doc_ids)
+    if token_counts is not None:
+        np.save(path + TOKENS_SUFFIX, np.asarray(token_counts, dtype=np.int32))
+    with open(path + DOCS_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
+
+class LazyColumn(Sequence):
+    """Vista in sola lettura che risolve gli elementi solo quando vengono letti"""
+
+    def __init__(self, getter: Callable[[int], Any], length: int):
+        self._getter = getter
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._getter(j) for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return self._getter(i)
+
+class ChunkStore:
+    """Accesso lazy ai chunk memorizzati in formato colonnare"""
+
+    def __init__(self, blob, offsets: np.ndarray, docs: List[Dict[str, Any]], doc_ids: np.ndarray,
+                 token_counts: Optional[np.ndarray] = None):
+        self._blob = blob
+        self._offsets = offsets
+        self._docs = docs
+        self._doc_ids = doc_ids
+        self._token_counts = token_counts
+        self.texts = LazyColumn(self.get_text, len(doc_ids))
+        self.metadata = LazyColumn(self.get_metadata, len(doc_ids))
+
+    @classmethod
+    def open(cls, path: str, mmap_mode: bool = True) -> "ChunkStore":
+        """Apre l'archivio; con mmap_mode=True blob e array non vengono copiati in memoria"""
+        with open(path + TEXTS_SUFFIX, "rb") as f:
+            if mmap_mode and os.fstat(f.fileno()).st_size > 0:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                blob = f.read()
+        np_mode = "r" if mmap_mode else None
+        offsets = np.load(path + OFFSETS_SUFFIX, mmap_mode=np_mode)
+        doc_ids = np.load(path + DOC_IDS_SUFFIX, mmap_mode=np_mode)
+        with open(path + DOCS_SUFFIX, "r", encoding="utf-8") as f:
+            docs = json.load(f)
+        token_counts = np.load(path + TOKENS_SUFFIX, mmap_mode=np_mode) if os.path.exists(path + TOKENS_SUFFIX) else None
+        return cls(blob, offsets, docs, doc_ids, token_counts)
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def get_text(self, i: int) -> str:
+        """Decodifica il testo del chunk i"""
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def get_metadata(self, i: int) -> Optional[Dict[str, Any]]:
+        """Restituisce i metadati del documento a cui appartiene il chunk i (None se rimosso)"""
+        doc_id = int(self._doc_ids[i])
+        return None if doc_id == DELETED_DOC_ID else self._docs[doc_id]
+
+    def get_tokens(self, i: int) -> Optional[int]:
+        """Numero di token del chunk i (None se non registrato)"""
+        if self._token_counts is None or self._token_counts[i] < 0:
+            return None
+        return int(self._token_counts[i])
+
+    @property
+    def token_counts(self) -> Optional[np.ndarray]:
+        """Token di ogni chunk (-1 = non noto), None per gli archivi che non li registrano"""
+        return self._token_counts
+
+    @property
+    def docs(self) -> List[Dict[str, Any]]:
+        """Tabella dei documenti"""
+        return self._docs
+
+    @property
+    def doc_ids(self) -> np.ndarray:
+        """Documento di appartenenza di ogni chunk"""
+        return self._doc_ids
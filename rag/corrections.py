@@ -0,0 +1,103 @@
+"""
+Correzioni dell'amministratore (corrections.jsonl) tenute in memoria.
+
+Il file viene riletto solo quando cambiano mtime, inode o dimensione (controllo con os.stat,
+nessuna lettura per richiesta). La ricerca avviene in due passi:
+    1. testo normalizzato della domanda (maiuscole, spazi, punteggiatura finale)
+    2. similarità coseno tra l'embedding della domanda e quelli delle domande corrette,
+       così una correzione vale anche per le parafrasi; numeri e codici delle due domande
+       devono coincidere ("keybox Hb 3" non riceve la correzione di "keybox Hb 4")
+Gli embedding delle correzioni sono calcolati alla prima ricerca semantica dopo un ricaricamento,
+con una sola chiamata embed(domande) per tutte le correzioni.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .query_cache import normalize_query, query_identifiers
+
+logger = logging.getLogger(__name__)
+
+class CorrectionsIndex:
+    """Indice in memoria delle correzioni, per testo normalizzato e per embedding"""
+
+    def __init__(self, path: str, embed: Optional[Callable[[List[str]], np.ndarray]] = None, threshold: float = 0.92):
+        self.path = path
+        self.embed = embed
+        self.threshold = threshold
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._by_text: Dict[str, str] = {}
+        self._queries: List[str] = []
+        self._answers: List[str] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def reload_if_changed(self) -> bool:
+        """Rilegge il file se è cambiato dall'ultimo caricamento"""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return False
+        corrections: Dict[str, Tuple[str, str]] = {}
+        if signature is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line.strip())
+                        corrections[normalize_query(item["query"])] = (item["query"], item["corrected_answer"])
+                    except Exception:
+                        continue
+        with self._lock:
+            self._by_text = {key: answer for key, (_, answer) in corrections.items()}
+            self._queries = [query for query, _ in corrections.values()]
+            self._answers = [answer for _, answer in corrections.values()]
+            self._vectors = None
+            self._signature = signature
+        return True
+
+    def _correction_vectors(self) -> Tuple[Optional[np.ndarray], List[str], List[str]]:
+        """
+        Embedding normalizzati delle domande corrette (calcolati una volta per versione del file),
+        restituiti insieme a domande e risposte della stessa versione.
+        """
+        with self._lock:
+            if self._vectors is None and self._queries and self.embed is not None:
+                vectors = np.array(self.embed(self._queries), dtype=np.float32).reshape(len(self._queries), -1)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+                self._vectors = vectors
+            return self._vectors, self._queries, self._answers
+
+    def lookup(self, query: str, query_vector: Optional[np.ndarray] = None) -> Optional[str]:
+        """Risposta corretta per la domanda: prima per testo normalizzato, poi per similarità"""
+        self.reload_if_changed()
+        answer = self._by_text.get(normalize_query(query))
+        if answer is not None or query_vector is None:
+            return answer
+        try:
+            vectors, queries, answers = self._correction_vectors()
+        except Exception as e:
+            logger.warning(f"Embedding delle correzioni non disponibili: {e}")
+            return None
+        if vectors is None:
+            return None
+        q = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        scores = vectors @ (q / (np.linalg.norm(q) + 1e-12))
+        identifiers = query_identifiers(query)
+        for best in np.argsort(-scores).tolist():
+            if scores[best] < self.threshold:
+                break
+            if query_identifiers(queries[best]) == identifiers:
+                logger.info(f"Correzione applicata per similarità ({scores[best]:.3f}): {queries[best]}")
+                return answers[best]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._answers)
@@ -0,0 +1,72 @@
+"""
+Eliminazione dei chunk quasi duplicati prima del calcolo degli embedding (MinHash + LSH).
+
+Ogni chunk è rappresentato dall'insieme dei suoi shingle di parole; la firma MinHash ne
+stima la similarità di Jaccard. Le firme sono divise in bande (LSH): solo i chunk che
+condividono almeno una banda vengono confrontati, quindi il costo resta lineare nel numero
+di chunk. Il primo chunk di ogni gruppo di quasi duplicati viene mantenuto.
+"""
+import re
+import zlib
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+_PRIME = np.uint64(4294967311)  # primo > 2^32: (a * x + b) resta entro uint64 con x, a, b < 2^32
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+class MinHashDeduplicator:
+    """Indice LSH incrementale di firme MinHash"""
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 8,
+                 shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm deve essere un multiplo di bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Hash (crc32) degli shingle di parole del testo"""
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < self.shingle_size:
+            grams = [" ".join(words)]
+        else:
+            grams = [" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+        return np.array(sorted({zlib.crc32(g.encode("utf-8")) for g in grams}), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash: per ogni permutazione il minimo di (a * h + b) mod p sugli shingle"""
+        hashes = self.shingles(text)
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def add(self, text: str) -> bool:
+        """Aggiunge il testo; restituisce False se è un quasi duplicato di un testo già visto"""
+        signature = self.signature(text)
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+        candidates = set()
+        for band, key in enumerate(band_keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return False
+
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(band_keys):
+            self._buckets[band].setdefault(key, []).append(position)
+        return True
+
+def deduplicate_chunks(chunks: Sequence[str], threshold: float = 0.85) -> Tuple[List[int], List[int]]:
+    """Restituisce gli indici dei chunk da mantenere e quelli scartati come quasi duplicati"""
+    deduplicator = MinHashDeduplicator(threshold=threshold)
+    kept, removed = [], []
+    for i, chunk in enumerate(chunks):
+        (kept if deduplicator.add(chunk) else removed).append(i)
+    return kept, removed
@@ -0,0 +1,171 @@
+"""
+Richieste di embedding concorrenti e rispettose dei limiti di frequenza (ingestione).
+
+    - batch costruiti per numero di token (tiktoken) oltre che per numero di testi
+    - limiti di richieste e token al minuto con due token bucket condivisi tra i thread
+    - fino a `concurrency` richieste in volo (ThreadPoolExecutor)
+    - errori transitori (rete, 408/409/429, 5xx) ripetuti con backoff esponenziale e jitter,
+      rispettando l'header Retry-After quando presente
+
+embed_fn riceve una lista di testi e restituisce i vettori nello stesso ordine: per l'API
+OpenAI (o un server compatibile, anche locale) si usa openai_embed_fn.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+import openai
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token bucket con ricarica continua: `per_minute` unità al minuto, picco pari a un minuto"""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Attende finché sono disponibili `amount` unità e le consuma; restituisce i secondi attesi"""
+        amount = min(float(amount), self.capacity)  # una richiesta più grande del picco attende il bucket pieno
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+def token_batches(token_counts: Sequence[int], max_tokens: int, max_items: int) -> List[List[int]]:
+    """Indici dei testi raggruppati in batch di al più max_tokens token e max_items testi"""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    tokens = 0
+    for i, n in enumerate(token_counts):
+        if current and (tokens + n > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(i)
+        tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+# Connessione e timeout: del client OpenAI (anche APITimeoutError) e della libreria standard
+_TRANSIENT_ERRORS = (openai.APIConnectionError, ConnectionError, TimeoutError)
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Errori transitori: connessione/timeout e risposte HTTP 408, 409, 429 e 5xx. Gli altri errori
+    (es. TypeError o KeyError di un bug nel codice) non vengono ripetuti.
+    """
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status in (408, 409, 429) or status >= 500)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def openai_embed_fn(client, model: str) -> Callable[[List[str]], np.ndarray]:
+    """Funzione di embedding sull'API OpenAI (o compatibile) senza retry interni del client"""
+    client = client.with_options(max_retries=0)
+
+    def embed(texts: List[str]) -> np.ndarray:
+        result = client.embeddings.create(input=texts, model=model)
+        data = sorted(result.data, key=lambda record: record.index)
+        return np.array([record.embedding for record in data], dtype=np.float32)
+    return embed
+
+class EmbeddingDriver:
+    """Esegue le richieste di embedding con limiti di frequenza, retry e concorrenza"""
+
+    def __init__(self, embed_fn: Callable[[List[str]], np.ndarray], count_tokens: Callable[[str], int],
+                 concurrency: int = 4, max_batch_tokens: int = 20000, max_batch_items: int = 512,
+                 requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 6, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic):
+        self.embed_fn = embed_fn
+        self.count_tokens = count_tokens
+        self.concurrency = max(1, concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self._requests = TokenBucket(requests_per_minute, clock=clock, sleep=sleep) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute, clock=clock, sleep=sleep) if tokens_per_minute else None
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "tokens": 0, "throttled_seconds": 0.0}
+
+    def embed_batch(self, texts: List[str], tokens: Optional[int] = None) -> np.ndarray:
+        """Una richiesta (già dimensionata) con attesa dei limiti e retry degli errori transitori"""
+        if tokens is None:
+            tokens = sum(self.count_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            throttled = 0.0
+            if self._requests is not None:
+                throttled += self._requests.acquire(1)
+            if self._tokens is not None:
+                throttled += self._tokens.acquire(tokens)
+            try:
+                vectors = np.asarray(self.embed_fn(texts), dtype=np.float32)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                # Full jitter: attesa casuale fino al backoff esponenziale (o almeno Retry-After)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0.0)
+                logger.warning(f"Embedding non riuscito ({e}), nuovo tentativo tra {delay:.1f}s")
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                    self.stats["throttled_seconds"] += throttled
+                self._sleep(delay)
+                attempt += 1
+                continue
+            with self._stats_lock:
+                self.stats["requests"] += 1
+                self.stats["tokens"] += tokens
+                self.stats["throttled_seconds"] += throttled
+            return vectors
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embedding di tutti i testi, in batch per token con fino a `concurrency` richieste in volo"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        counts = [self.count_tokens(text) for text in texts]
+        batches = [(rows, sum(counts[i] for i in rows))
+                   for rows in token_batches(counts, self.max_batch_tokens, self.max_batch_items)]
+
+        def run(batch):
+            rows, n_tokens = batch
+            return self.embed_batch([texts[i] for i in rows], tokens=n_tokens)
+
+        if self.concurrency == 1 or len(batches) == 1:
+            results = [run(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches)),
+                                    thread_name_prefix="embedding") as pool:
+                results = list(pool.map(run, batches))
+        return np.vstack(results)
@@ -0,0 +1,162 @@
+"""
+Archivio su disco degli embedding dei chunk usato dall'ingestione.
+
+La chiave è (modello di embedding, sha256 del testo del chunk): una reindicizzazione con gli
+stessi chunk (o ripresa dopo un'interruzione) chiede all'API solo i vettori mancanti.
+
+Struttura (<BASE_DIR>/cache/chunk_embeddings/<modello>/):
+    meta.json     modello, dimensione e tipo delle righe (float32 o float16)
+    vectors.bin   righe dei vettori, solo in append
+    keys.txt      hash dei chunk, una riga per vettore nello stesso ordine
+
+I vettori vengono scritti prima delle chiavi: all'apertura si considerano valide solo le righe
+presenti in entrambi i file, quindi un'interruzione a metà scrittura perde al più l'ultimo batch.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+
+DTYPES = ("float32", "float16")
+
+def chunk_hash(text: str) -> str:
+    """Chiave del chunk nell'archivio"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ChunkEmbeddingStore:
+    """Embedding dei chunk per hash del testo, in un file di righe a sola aggiunta"""
+
+    def __init__(self, root: str, model: str, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Tipo non supportato per l'archivio degli embedding: {dtype} (ammessi: {', '.join(DTYPES)})")
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model))
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._open()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open(self) -> None:
+        """Carica l'indice delle chiavi e scarta le righe scritte solo in parte"""
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if meta is None or meta.get("model") != self.model or meta.get("dtype") != self.dtype.name:
+            # Archivio assente o di un altro formato: si riparte da zero
+            for name in ("vectors.bin", "keys.txt", "meta.json"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            return
+        self.dim = int(meta["dim"])
+
+        lines: List[str] = []
+        if os.path.exists(self._file("keys.txt")):
+            with open(self._file("keys.txt"), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        keys = [line[:-1] for line in lines if line.endswith("\n")]
+        row_bytes = self.dim * self.dtype.itemsize
+        stored_rows = os.path.getsize(self._file("vectors.bin")) // row_bytes if os.path.exists(self._file("vectors.bin")) else 0
+        valid = min(len(keys), stored_rows)
+        with open(self._file("vectors.bin"), "ab") as f:
+            f.truncate(valid * row_bytes)
+        if valid < len(lines):
+            # Ultima scrittura interrotta: si tengono solo le righe complete in entrambi i file
+            keys = keys[:valid]
+            with open(self._file("keys.txt"), "w", encoding="utf-8") as f:
+                f.writelines(k + "\n" for k in keys)
+        self._rows = {key: row for row, key in enumerate(keys)}
+
+    def _matrix(self) -> np.ndarray:
+        """Vettori su disco mappati in memoria (con il lock acquisito)"""
+        if self._vectors is None:
+            self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r",
+                                      shape=(len(self._rows), self.dim))
+        return self._vectors
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def missing(self, keys: Sequence[str]) -> List[str]:
+        """Chiavi non presenti nell'archivio, senza ripetizioni e nell'ordine dato"""
+        return [key for key in dict.fromkeys(keys) if key not in self._rows]
+
+    def add(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        """Aggiunge i vettori dei chunk indicati (le chiavi già presenti vengono ignorate)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self.dim, "dtype": self.dtype.name}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensione degli embedding {vectors.shape[1]} diversa da quella dell'archivio ({self.dim})")
+            seen = set(self._rows)
+            new = []
+            for i, key in enumerate(keys):
+                if key not in seen:
+                    seen.add(key)
+                    new.append(i)
+            if not new:
+                return
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(vectors[new].astype(self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._file("keys.txt"), "a", encoding="utf-8") as f:
+                f.writelines(keys[i] + "\n" for i in new)
+                f.flush()
+                os.fsync(f.fileno())
+            for i in new:
+                self._rows[keys[i]] = len(self._rows)
+            self._vectors = None
+
+    def get(self, keys: Sequence[str]) -> np.ndarray:
+        """Vettori float32 dei chunk indicati, tutti già presenti nell'archivio"""
+        with self._lock:
+            if not keys:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            rows = [self._rows[key] for key in keys]
+            return np.asarray(self._matrix()[rows], dtype=np.float32)
+
+    def embed(self, texts: Sequence[str], embed_batch: Callable[[List[str]], np.ndarray],
+              batch_size: int = 100) -> np.ndarray:
+        """
+        Embedding dei testi: quelli già in archivio vengono letti da disco, gli altri calcolati
+        con embed_batch a gruppi di batch_size e salvati subito (ripresa dopo un'interruzione).
+        """
+        keys = [chunk_hash(text) for text in texts]
+        missing = self.missing(keys)
+        with self._lock:
+            self.hits += len(set(keys)) - len(missing)
+            self.misses += len(missing)
+        text_by_key = dict(zip(keys, texts))
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            self.add(batch, embed_batch([text_by_key[key] for key in batch]))
+        return self.get(keys)
+
+    def stats(self) -> Dict[str, object]:
+        """Contatori dell'archivio"""
+        return {
+            "model": self.model,
+            "dtype": self.dtype.name,
+            "entries": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,93 @@
+"""
+Filtri sui metadati dei chunk (source e tags) per la ricerca vettoriale.
+
+Per ogni source e per ogni tag viene precalcolata una bitmap degli id dei chunk
+(un bit per chunk, ordine dei bit compatibile con faiss.IDSelectorBitmap).
+Un filtro combina le bitmap e viene passato a FAISS come IDSelector: i chunk esclusi
+non vengono nemmeno valutati, quindi il top-k è calcolato solo sui candidati ammessi.
+I chunk rimossi (metadati None) non sono mai ammessi: la bitmap `live` li esclude anche
+dalle ricerche senza filtro sugli indici che non supportano la rimozione (HNSW).
+
+Formato del filtro:
+    {"source": "keyboxes/"}                       prefisso del percorso (o lista di prefissi, in OR)
+    {"tags": ["parcheggio", "accesso"]}           almeno uno dei tag (case insensitive)
+    {"source": ["docs/"], "tags": ["parcheggio"]} source e tags sono combinati in AND
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Union
+import numpy as np
+
+FILTER_KEYS = ("source", "tags")
+
+def ids_to_bitmap(ids: Sequence[int], n: int) -> np.ndarray:
+    """Converte una lista di id in una bitmap compatta (uint8, bit meno significativo per primo)"""
+    bits = np.zeros(n, dtype=np.uint8)
+    bits[np.asarray(ids, dtype=np.int64)] = 1
+    return np.packbits(bits, bitorder="little")
+
+def bitmap_count(bitmap: np.ndarray) -> int:
+    """Numero di id presenti nella bitmap"""
+    return int(np.unpackbits(bitmap).sum())
+
+def validate_filters(filters: Any) -> Optional[Dict[str, List[str]]]:
+    """Normalizza un filtro ricevuto dall'esterno (ValueError se non valido)"""
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("Il filtro deve essere un oggetto con chiavi 'source' e/o 'tags'")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Chiavi di filtro non supportate: {', '.join(sorted(unknown))}")
+    normalized = {}
+    for key in FILTER_KEYS:
+        value = filters.get(key)
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else value
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"Il filtro '{key}' deve essere una stringa o una lista di stringhe")
+        normalized[key] = values
+    return normalized or None
+
+class MetadataFilterIndex:
+    """Bitmap precalcolate per source e tag di una generazione dell'indice"""
+
+    def __init__(self, metadata: Sequence[Dict[str, Any]]):
+        self.size = len(metadata)
+        source_ids: Dict[str, List[int]] = defaultdict(list)
+        tag_ids: Dict[str, List[int]] = defaultdict(list)
+        live_ids: List[int] = []
+        for i, meta in enumerate(metadata):
+            if meta is None:
+                continue
+            live_ids.append(i)
+            source_ids[meta.get("source") or ""].append(i)
+            for tag in meta.get("tags") or []:
+                tag_ids[tag.lower()].append(i)
+        self.sources = {source: ids_to_bitmap(ids, self.size) for source, ids in source_ids.items()}
+        self.tags = {tag: ids_to_bitmap(ids, self.size) for tag, ids in tag_ids.items()}
+        self.live = ids_to_bitmap(live_ids, self.size)
+
+    def _union(self, bitmaps: List[np.ndarray]) -> np.ndarray:
+        result = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for bitmap in bitmaps:
+            np.bitwise_or(result, bitmap, out=result)
+        return result
+
+    def bitmap(self, filters: Optional[Dict[str, Union[str, List[str]]]]) -> Optional[np.ndarray]:
+        """Bitmap dei chunk ammessi dal filtro, None se il filtro è vuoto"""
+        filters = validate_filters(filters)
+        if filters is None:
+            return None
+        result = None
+        if "source" in filters:
+            prefixes = filters["source"]
+            result = self._union([
+                bitmap for source, bitmap in self.sources.items()
+                if any(source == p or source.startswith(p) for p in prefixes)
+            ])
+        if "tags" in filters:
+            wanted = [tag.lower() for tag in filters["tags"]]
+            tags = self._union([self.tags[tag] for tag in wanted if tag in self.tags])
+            result = tags if result is None else np.bitwise_and(result, tags)
+        return result
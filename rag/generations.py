@@ -0,0 +1,164 @@
+"""
+Generazioni versionate dell'indice.
+
+Ogni reindicizzazione scrive una nuova generazione in una directory separata:
+    <dir indice>/generations/gen-000001/index.faiss (+ file accessori)
+    <dir indice>/generations/gen-000001/MANIFEST.json  (checksum sha256 di ogni file)
+    <dir indice>/generations/CURRENT                  (nome della generazione attiva)
+
+La generazione viene scritta in una directory temporanea e resa visibile solo quando è
+completa, aggiornando CURRENT con una sostituzione atomica: i processi in esecuzione non
+vedono mai un indice scritto a metà. File e directory della generazione vengono scritti su
+disco (fsync) prima di aggiornare CURRENT, così anche dopo un crash CURRENT non punta mai a
+una generazione con file troncati.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+GENERATIONS_DIR = "generations"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "MANIFEST.json"
+GENERATION_PREFIX = "gen-"
+
+def generations_root(index_path: str) -> str:
+    """Directory che contiene le generazioni dell'indice"""
+    return os.path.join(os.path.dirname(index_path) or ".", GENERATIONS_DIR)
+
+def current_pointer_path(index_path: str) -> str:
+    """Percorso del file che indica la generazione attiva"""
+    return os.path.join(generations_root(index_path), CURRENT_FILE)
+
+def current_generation(index_path: str) -> Optional[str]:
+    """Nome della generazione attiva, None se l'indice non è versionato"""
+    try:
+        with open(current_pointer_path(index_path), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        return name or None
+    except FileNotFoundError:
+        return None
+
+def generation_index_path(index_path: str, generation: str) -> str:
+    """Percorso del file indice all'interno di una generazione"""
+    return os.path.join(generations_root(index_path), generation, os.path.basename(index_path))
+
+def resolve_index_path(index_path: str) -> str:
+    """
+    Restituisce il file indice da caricare: quello della generazione attiva se presente,
+    altrimenti il percorso originale (layout non versionato).
+    """
+    generation = current_generation(index_path)
+    if generation is None:
+        return index_path
+    return generation_index_path(index_path, generation)
+
+def file_sha256(path: str) -> str:
+    """Checksum sha256 di un file, letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(generation_dir: str) -> Dict[str, Any]:
+    """Legge il manifest di una generazione"""
+    with open(os.path.join(generation_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def verify_generation(generation_dir: str, checksums: bool = True) -> None:
+    """
+    Verifica presenza e dimensioni dei file di una generazione e, con checksums, anche lo
+    sha256 (rilegge tutti i file: al caricamento basta il controllo delle dimensioni).
+    ValueError se non coincidono.
+    """
+    manifest = read_manifest(generation_dir)
+    for name, info in manifest["files"].items():
+        path = os.path.join(generation_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != info["size"]:
+            raise ValueError(f"File mancante o incompleto nella generazione {manifest['generation']}: {name}")
+        if checksums and file_sha256(path) != info["sha256"]:
+            raise ValueError(f"Checksum non valido nella generazione {manifest['generation']}: {name}")
+
+def _fsync_file(path: str) -> None:
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+def _fsync_dir(path: str) -> None:
+    """Rende persistenti le voci della directory (file creati, rinominati)"""
+    if os.name == "nt":  # le directory non si possono aprire su Windows
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _next_generation_number(root: str) -> int:
+    numbers = [0]
+    for name in os.listdir(root):
+        if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit():
+            numbers.append(int(name[len(GENERATION_PREFIX):]))
+    return max(numbers) + 1
+
+def publish_generation(index_path: str, save_fn: Callable[[str], None], keep: int = 2) -> str:
+    """
+    Scrive una nuova generazione con save_fn(percorso_indice) e la rende attiva.
+    Mantiene le ultime `keep` generazioni, così i processi che stanno ancora
+    servendo una generazione precedente possono completare le richieste in corso.
+    """
+    root = generations_root(index_path)
+    os.makedirs(root, exist_ok=True)
+    generation = f"{GENERATION_PREFIX}{_next_generation_number(root):06d}"
+    tmp_dir = os.path.join(root, generation + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        save_fn(os.path.join(tmp_dir, os.path.basename(index_path)))
+        files = {}
+        for name in sorted(os.listdir(tmp_dir)):
+            path = os.path.join(tmp_dir, name)
+            _fsync_file(path)
+            files[name] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "generation": generation,
+                "created_at": datetime.utcnow().isoformat(),
+                "index_file": os.path.basename(index_path),
+                "files": files
+            }, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(tmp_dir)
+        os.rename(tmp_dir, os.path.join(root, generation))
+        _fsync_dir(root)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Attivazione atomica della nuova generazione
+    pointer_tmp = current_pointer_path(index_path) + ".tmp"
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, current_pointer_path(index_path))
+    _fsync_dir(root)
+
+    prune_generations(index_path, keep=keep)
+    return generation
+
+def prune_generations(index_path: str, keep: int = 2) -> None:
+    """Elimina le generazioni più vecchie, conservando sempre quella attiva"""
+    root = generations_root(index_path)
+    active = current_generation(index_path)
+    names = sorted(
+        name for name in os.listdir(root)
+        if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit()
+    )
+    for name in names[:-max(keep, 1)]:
+        if name != active:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
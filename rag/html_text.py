@@ -0,0 +1,201 @@
+"""
+Estrazione del testo principale dalle pagine web, prima del chunking.
+
+    - con lxml installato l'albero viene costruito e visitato direttamente con lxml.html
+      (decine di volte più veloce di BeautifulSoup), altrimenti BeautifulSoup con html.parser
+    - rimozione del boilerplate: script/stili, nav/header/footer/aside, banner dei cookie,
+      menu e condivisioni social (per tag, ruolo ARIA, id e classi intere: "sidebar" sì,
+      "no-sidebar" no) e blocchi di soli link brevi
+    - contenuto principale: <main>, role="main" o gli <article> della pagina, altrimenti <body>;
+      i contenitori principali e i loro antenati non vengono mai rimossi
+    - se dopo la rimozione non resta nulla si usa il testo visibile completo
+    - titoli h1-h6 resi come titoli markdown (il chunker preferisce tagliare prima di un titolo)
+    - spazi normalizzati: un blocco per riga, nessuna riga vuota ripetuta
+
+Insieme al testo principale si restituisce il testo visibile completo (quello che dava
+get_text), per misurare i token risparmiati.
+"""
+import importlib.util
+import re
+from typing import Callable, Dict, List, Optional
+from bs4 import BeautifulSoup, CData, NavigableString
+
+PARSER = "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+# Cambia quando cambia il testo estratto: fa parte dei parametri del manifest dei documenti
+EXTRACTOR_VERSION = 2
+
+_NOT_TEXT = ("script", "style", "noscript", "template", "svg", "iframe", "canvas", "head")
+_BOILERPLATE_TAGS = ("nav", "aside", "footer", "header", "form", "button", "select", "dialog")
+_BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alertdialog"}
+# Un id o una classe intera: parola chiave con al più un qualificatore prima e uno dopo
+# ("cookie-banner", "site-footer", "share-buttons"); "no-sidebar" o "nav-open" non sono boilerplate
+_BOILERPLATE_RE = re.compile(
+    r"(?:(?:site|page|main|top|bottom|global|primary|secondary|mobile|cookie|social|post|entry)[-_])?"
+    r"(?:cookies?|consent|gdpr|privacy-banner|banner|newsletter|social|share|sharing|breadcrumbs?|"
+    r"main-menu|mega-menu|site-menu|mobile-menu|navbar|nav|footer|sidebar|popup|modal|overlay|advert|ads|skip-link)"
+    r"(?:[-_](?:bar|banner|box|buttons?|container|wrapper|wrap|inner|links?|icons?|list|menu|nav|notice|"
+    r"area|widget|popup|modal|overlay|left|right))?",
+    re.IGNORECASE,
+)
+_BLOCK_TAGS = ("p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "td", "th",
+               "dl", "dt", "dd", "blockquote", "pre", "figure", "figcaption", "address", "br", "hr")
+_HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+_LANDMARKS = ("html", "body", "main", "article")
+_LINK_LIST_TAGS = ("ul", "ol", "div", "section", "table")
+_SPACES_RE = re.compile(r"[ \t\r\f\v\u00a0\u200b]+")
+
+class HtmlText:
+    """Testo principale della pagina e testo visibile completo (per i token risparmiati)"""
+
+    __slots__ = ("text", "full_text")
+
+    def __init__(self, text: str, full_text: str):
+        self.text = text
+        self.full_text = full_text
+
+def normalize_whitespace(text: str) -> str:
+    """Spazi consecutivi ridotti a uno, righe senza spazi ai lati, al più una riga vuota tra i blocchi"""
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    out: List[str] = []
+    for line in lines:
+        if line or (out and out[-1]):
+            out.append(line)
+    return "\n".join(out).strip()
+
+def _is_boilerplate(name: str, get: Callable[[str], Optional[str]], in_article: Callable[[], bool]) -> bool:
+    """get restituisce l'attributo indicato come stringa (classi separate da spazi)"""
+    if name in _BOILERPLATE_TAGS:
+        # L'intestazione di un articolo (titolo, data) fa parte del contenuto
+        return not (name == "header" and in_article())
+    if get("role") in _BOILERPLATE_ROLES or get("aria-hidden") == "true":
+        return True
+    names = f"{get('id') or ''} {get('class') or ''}".split()
+    return any(_BOILERPLATE_RE.fullmatch(token) for token in names)
+
+def _is_link_list(link_texts: List[str], text: str) -> bool:
+    """Blocco fatto quasi solo di link brevi (menu senza classi riconoscibili)"""
+    if len(link_texts) < 5:
+        return False
+    link_chars = sum(len(" ".join(t.split())) for t in link_texts)
+    return link_chars >= 0.8 * len(" ".join(text.split())) and link_chars / len(link_texts) < 30
+
+def _open(name: str, parts: List[str]) -> Optional[str]:
+    """Apre un blocco o un titolo; restituisce il testo di chiusura"""
+    if name in _HEADINGS:
+        parts.append("\n\n" + "#" * int(name[1]) + " ")
+        return "\n\n"
+    if name in _BLOCK_TAGS:
+        parts.append("\n")
+        return "\n"
+    return None
+
+# Visite dell'albero in una sola passata (senza modificarlo): i sottoalberi di boilerplate
+# vengono saltati, i blocchi vanno a capo e i titoli diventano titoli markdown.
+
+def _render_lxml(root, drop_link_lists: bool, keep: Dict[int, object]) -> str:
+    parts: List[str] = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):  # coda di un elemento o chiusura di un blocco
+            parts.append(node)
+            continue
+        name = node.tag
+        if not isinstance(name, str) or name in _NOT_TEXT:  # commenti e istruzioni
+            continue
+        in_article = lambda: next(node.iterancestors("article", "main"), None) is not None
+        protected = node is root or name in _LANDMARKS or id(node) in keep
+        if not protected and _is_boilerplate(name, node.get, in_article):
+            continue
+        if drop_link_lists and not protected and name in _LINK_LIST_TAGS and _is_link_list(
+                [a.text_content() for a in node.iter("a")], node.text_content()):
+            continue
+        close = _open(name, parts)
+        if close:
+            stack.append(close)
+        if node.text:
+            parts.append(node.text)
+        for child in reversed(node):
+            if child.tail:
+                stack.append(child.tail)
+            stack.append(child)
+    return normalize_whitespace("".join(parts))
+
+def _render_soup(root, drop_link_lists: bool, keep: Dict[int, object]) -> str:
+    parts: List[str] = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple):  # chiusura di un blocco
+            parts.append(node[0])
+            continue
+        if isinstance(node, NavigableString):
+            if type(node) in (NavigableString, CData):  # niente commenti, doctype, script
+                parts.append(node)
+            continue
+        name = node.name
+        if name in _NOT_TEXT:
+            continue
+        get = lambda attr: " ".join(node.get(attr)) if attr == "class" and node.get(attr) else node.get(attr)
+        in_article = lambda: node.find_parent(["article", "main"]) is not None
+        protected = node is root or name in _LANDMARKS or id(node) in keep
+        if not protected and _is_boilerplate(name, get, in_article):
+            continue
+        if drop_link_lists and not protected and name in _LINK_LIST_TAGS and _is_link_list(
+                [a.get_text() for a in node.find_all("a")], node.get_text()):
+            continue
+        close = _open(name, parts)
+        if close:
+            stack.append((close,))
+        stack.extend(reversed(node.contents))
+    return normalize_whitespace("".join(parts))
+
+def _protected(containers: List, parents: Callable[[object], object]) -> Dict[int, object]:
+    """Contenitori principali e loro antenati, per id (i nodi restano referenziati finché serve)"""
+    keep: Dict[int, object] = {}
+    for tag in containers:
+        keep[id(tag)] = tag
+        for parent in parents(tag):
+            keep[id(parent)] = parent
+    return keep
+
+def _main_text(landmarks: List, containers: List, body, full_text: str, render: Callable[..., str],
+               parents: Callable[[object], object]) -> str:
+    keep = _protected(containers, parents)
+    # Senza annidamenti: un <article> dentro <main> è già compreso nel suo contenitore
+    landmark_ids = {id(tag) for tag in landmarks}
+    roots = [tag for tag in landmarks if not any(id(parent) in landmark_ids for parent in parents(tag))]
+    texts = [render(root, False, keep) for root in roots]
+    if sum(len(text) for text in texts) < 0.25 * len(full_text):
+        # Nessun contenitore principale (o quasi vuoto): tutta la pagina, senza gli elenchi di link
+        texts = [render(body, True, keep)]
+    # Tutto scambiato per boilerplate: meglio il testo completo che una pagina vuota
+    return "\n\n".join(text for text in texts if text) or full_text
+
+def extract_main_text(html: str, parser: str = PARSER) -> HtmlText:
+    """Testo principale di una pagina HTML, con il boilerplate rimosso"""
+    if parser == "lxml":
+        import lxml.html
+        from lxml import etree
+        try:
+            # Una dichiarazione <?xml encoding=...?> non è ammessa in una stringa unicode
+            document = lxml.html.document_fromstring(html.encode("utf-8"),
+                                                     parser=lxml.html.HTMLParser(encoding="utf-8"))
+        except etree.ParserError:  # documento vuoto
+            return HtmlText("", "")
+        etree.strip_elements(document, *_NOT_TEXT, with_tail=False)
+        body = document.find("body")
+        body = body if body is not None else document
+        full_text = normalize_whitespace(body.text_content())
+        mains, roles, articles = (list(document.iter("main")), document.xpath("//*[@role='main']"),
+                                  list(document.iter("article")))
+        text = _main_text(mains or roles or articles, mains + roles + articles, body, full_text, _render_lxml,
+                          lambda tag: tag.iterancestors())
+    else:
+        soup = BeautifulSoup(html, parser)
+        body = soup.body or soup
+        full_text = normalize_whitespace(body.get_text())
+        mains, roles, articles = soup.find_all("main"), soup.find_all(attrs={"role": "main"}), soup.find_all("article")
+        text = _main_text(mains or roles or articles, mains + roles + articles, body, full_text, _render_soup,
+                          lambda tag: tag.parents)
+    return HtmlText(text, full_text)
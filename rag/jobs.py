@@ -0,0 +1,163 @@
+"""
+Lavori in background del pannello admin (reindicizzazione, metadati), eseguiti nel processo
+del server in un thread: la richiesta HTTP restituisce subito l'id del lavoro e lo stato si
+interroga a parte (fase, avanzamento, tempo stimato).
+
+Un solo lavoro alla volta: l'avvio di un secondo lavoro mentre il primo è in corso viene
+rifiutato con JobBusy. L'annullamento è cooperativo: il lavoro si interrompe al successivo
+aggiornamento dell'avanzamento (job.progress) sollevando JobCancelled.
+"""
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, SUCCEEDED, FAILED, CANCELLED = "pending", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobBusy(Exception):
+    """Un altro lavoro è già in corso"""
+
+    def __init__(self, job: "Job"):
+        super().__init__(f"Lavoro già in corso: {job.kind} ({job.id})")
+        self.job = job
+
+class JobCancelled(Exception):
+    """Sollevata dentro il lavoro quando ne è stato richiesto l'annullamento"""
+
+class Job:
+    """Stato di un lavoro: fase corrente, avanzamento (done/total), esito"""
+
+    def __init__(self, kind: str, clock: Callable[[], float] = time.time):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = PENDING
+        self.stage: Optional[str] = None
+        self.done: Optional[int] = None
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = clock()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._stage_started: Optional[float] = None
+        self._clock = clock
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(f"Lavoro {self.id} annullato")
+
+    def progress(self, stage: Optional[str] = None, done: Optional[int] = None, total: Optional[int] = None) -> None:
+        """Aggiorna fase e avanzamento (chiamata dal lavoro); è anche il punto di annullamento"""
+        with self._lock:
+            if stage is not None and stage != self.stage:
+                self.stage = stage
+                self._stage_started = self._clock()
+                self.done, self.total = None, None
+            if done is not None:
+                self.done = done
+            if total is not None:
+                self.total = total
+        self.check_cancelled()
+
+    def eta_seconds(self) -> Optional[float]:
+        """Tempo stimato per completare la fase corrente, in base alla velocità finora"""
+        with self._lock:
+            if self.status != RUNNING or not self.done or not self.total or self._stage_started is None:
+                return None
+            elapsed = self._clock() - self._stage_started
+            return max(0.0, elapsed / self.done * (self.total - self.done))
+
+    def to_dict(self) -> Dict[str, Any]:
+        eta = self.eta_seconds()
+        with self._lock:
+            end = self.finished_at if self.finished_at is not None else self._clock()
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "percent": round(100.0 * self.done / self.total, 1) if self.done is not None and self.total else None,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "elapsed_seconds": round(end - self.started_at, 1) if self.started_at is not None else None,
+                "cancel_requested": self._cancel.is_set(),
+                "result": self.result,
+                "error": self.error,
+            }
+
+class JobRunner:
+    """Esegue un lavoro alla volta in un thread e conserva lo stato degli ultimi `history` lavori"""
+
+    def __init__(self, history: int = 20, clock: Callable[[], float] = time.time):
+        self.history = history
+        self._clock = clock
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._current: Optional[Job] = None
+        self._lock = threading.Lock()
+        self._threads = itertools.count(1)
+
+    def start(self, kind: str, fn: Callable[[Job], Any]) -> Job:
+        """Avvia fn(job) in background; solleva JobBusy se un altro lavoro è in corso"""
+        with self._lock:
+            if self._current is not None:
+                raise JobBusy(self._current)
+            job = Job(kind, clock=self._clock)
+            self._current = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        thread = threading.Thread(target=self._run, args=(job, fn), daemon=True,
+                                  name=f"job-{kind}-{next(self._threads)}")
+        thread.start()
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        with job._lock:
+            job.status = RUNNING
+            job.started_at = self._clock()
+        try:
+            result = fn(job)
+            status, error = SUCCEEDED, None
+        except JobCancelled:
+            result, status, error = None, CANCELLED, None
+            logger.info(f"Lavoro {job.kind} ({job.id}) annullato")
+        except Exception as e:
+            result, status, error = None, FAILED, str(e)
+            logger.exception(f"Lavoro {job.kind} ({job.id}) non riuscito")
+        # Esito e fine del lavoro visibili insieme: chi lo vede terminato può avviarne un altro
+        with self._lock, job._lock:
+            job.result, job.status, job.error = result, status, error
+            job.finished_at = self._clock()
+            self._current = None
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def current(self) -> Optional[Job]:
+        """Lavoro in corso, se presente"""
+        return self._current
+
+    def jobs(self) -> List[Job]:
+        """Ultimi lavori, dal più recente"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Richiede l'annullamento del lavoro (se ancora in corso); None se l'id non esiste"""
+        job = self._jobs.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            job._cancel.set()
+        return job
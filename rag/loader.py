@@ -0,0 +1,126 @@
+"""
+Caricamento dei documenti (txt, md, pdf) per ingestione e generazione dei metadati.
+
+L'estrazione del testo dai PDF (PyPDF2, CPU-bound) avviene in parallelo in un
+ProcessPoolExecutor con un numero limitato di processi, avviati senza fork (il caricamento
+gira anche nei lavori in background del server multithread: un processo figlio creato con fork
+erediterebbe i lock tenuti dagli altri thread, es. logging, OpenMP, SQLite). Il testo estratto viene salvato in
+<BASE_DIR>/cache/texts/<sha256 del file>.txt: ingest.py e generate_metadata.py lo condividono
+e un PDF non modificato non viene più riletto. Per ogni file si registra il tempo di estrazione.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .generations import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# forkserver dove disponibile (i processi partono da un server già avviato), altrimenti spawn
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+def extract_text(path: str) -> str:
+    """Testo di un documento txt, md o pdf"""
+    if path.lower().endswith(".pdf"):
+        from PyPDF2 import PdfReader
+        reader = PdfReader(path)
+        return "\n".join([page.extract_text() or "" for page in reader.pages])
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _extract_timed(path: str) -> Tuple[Optional[str], float, Optional[str]]:
+    """Estrazione eseguita nei processi di lavoro: (testo, secondi, errore)"""
+    start = time.perf_counter()
+    try:
+        text, error = extract_text(path), None
+    except Exception as e:
+        text, error = None, str(e)
+    return text, time.perf_counter() - start, error
+
+class TextCache:
+    """Testo estratto dai PDF, indicizzato per hash del contenuto del file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.path, f"{digest}.txt")
+
+    def get(self, digest: str) -> Optional[str]:
+        try:
+            with open(self._file(digest), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest: str, text: str) -> None:
+        # Scrittura atomica: ingest e generate_metadata possono girare insieme
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f"{self._file(digest)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, self._file(digest))
+
+def load_documents(folder: str, relpaths: Sequence[str], cache_dir: Optional[str] = None,
+                   max_workers: int = 0) -> Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]:
+    """
+    Carica i documenti indicati (relativi a folder), nello stesso ordine.
+    Restituisce i (relpath, testo) leggibili e il resoconto per file
+    {"source", "seconds", "cached", "chars", "error"}.
+    max_workers = 0 usa un processo per CPU.
+    """
+    cache = TextCache(cache_dir) if cache_dir else None
+    texts: Dict[str, Optional[str]] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    to_extract: List[str] = []
+    digests: Dict[str, str] = {}
+
+    for relpath in relpaths:
+        path = os.path.join(folder, relpath)
+        if not relpath.lower().endswith(".pdf"):
+            text, seconds, error = _extract_timed(path)
+            texts[relpath] = text
+            report[relpath] = {"source": relpath, "seconds": seconds, "cached": False, "error": error}
+            continue
+        if cache is not None:
+            start = time.perf_counter()
+            try:
+                digests[relpath] = file_sha256(path)
+            except OSError as e:
+                texts[relpath] = None
+                report[relpath] = {"source": relpath, "seconds": 0.0, "cached": False, "error": str(e)}
+                continue
+            text = cache.get(digests[relpath])
+            if text is not None:
+                texts[relpath] = text
+                report[relpath] = {"source": relpath, "seconds": time.perf_counter() - start,
+                                   "cached": True, "error": None}
+                continue
+        to_extract.append(relpath)
+
+    workers = min(max_workers or os.cpu_count() or 1, len(to_extract))
+    paths = [os.path.join(folder, relpath) for relpath in to_extract]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(_START_METHOD)) as pool:
+            results = list(pool.map(_extract_timed, paths))
+    else:
+        results = [_extract_timed(path) for path in paths]
+
+    for relpath, (text, seconds, error) in zip(to_extract, results):
+        texts[relpath] = text
+        report[relpath] = {"source": relpath, "seconds": seconds, "cached": False, "error": error}
+        if text is not None and cache is not None:
+            cache.put(digests[relpath], text)
+
+    loaded = []
+    for relpath in relpaths:
+        entry = report[relpath]
+        text = texts[relpath]
+        entry["chars"] = len(text) if text is not None else 0
+        if text is None:
+            logger.warning(f"Errore durante la lettura di {os.path.join(folder, relpath)}: {entry['error']}")
+        else:
+            loaded.append((relpath, text))
+    return loaded, [report[relpath] for relpath in relpaths]
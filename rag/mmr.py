@@ -0,0 +1,48 @@
+"""
+Diversificazione dei risultati con Maximal Marginal Relevance (MMR).
+
+I chunk consecutivi di uno stesso documento si sovrappongono (CHUNK_OVERLAP token), quindi
+il top-k per sola similarità contiene spesso finestre quasi identiche. MMR sceglie i chunk
+uno alla volta massimizzando
+
+    lambda * sim(query, chunk) - (1 - lambda) * max sim(chunk, chunk già scelti)
+
+su un insieme di candidati più ampio, usando i vettori già memorizzati nell'indice
+(nessun embedding aggiuntivo). Un limite opzionale di chunk per documento (source) evita
+che un solo file occupi tutto il contesto.
+"""
+from typing import List, Optional, Sequence
+import numpy as np
+
+def mmr_select(query_vector: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.7,
+               sources: Optional[Sequence[str]] = None, per_source_cap: int = 0) -> List[int]:
+    """Posizioni (in vectors) dei k candidati scelti, in ordine di selezione"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) == 0 or k <= 0:
+        return []
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    query = query / (np.linalg.norm(query) + 1e-12)
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T  # pochi candidati: matrice piccola, calcolata una sola volta
+    source_ids = None
+    if sources is not None and per_source_cap > 0:
+        _, source_ids = np.unique(np.asarray(sources, dtype=object).astype(str), return_inverse=True)
+        per_source = np.zeros(source_ids.max() + 1, dtype=np.int64)
+
+    available = np.ones(len(vectors), dtype=bool)
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    selected: List[int] = []
+    while len(selected) < k and available.any():
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        redundancy = similarity[best] if not selected else np.maximum(redundancy, similarity[best])
+        selected.append(best)
+        available[best] = False
+        if source_ids is not None:
+            per_source[source_ids[best]] += 1
+            if per_source[source_ids[best]] >= per_source_cap:
+                available &= source_ids != source_ids[best]
+    return selected
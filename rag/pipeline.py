@@ -0,0 +1,206 @@
+"""
+Pipeline di ingestione in streaming: caricamento → chunking → embedding → accumulo dei vettori.
+
+Un thread produttore legge i documenti a piccoli gruppi, li divide in chunk, scarta i quasi
+duplicati e consegna batch di chunk (per numero di chunk e di token) su una coda limitata; il
+thread principale invia gli embedding di fino a `concurrency` batch in parallelo e li scrive,
+nell'ordine originale, in un VectorBuffer. Mentre si attende l'API il produttore prepara i batch
+successivi, ma non più di queue_size alla volta: la memoria usata dipende dalla dimensione dei
+batch, non dal numero di documenti.
+
+Il VectorBuffer su file (np.memmap) tiene i vettori su disco; l'indice FAISS li legge poi a
+blocchi (build_faiss_index con add_batch_size), senza copie dell'intera matrice.
+"""
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+class VectorBuffer:
+    """Matrice float32 che cresce per raddoppio, in memoria o su file (np.memmap)"""
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 1024):
+        self.path = path
+        self.capacity = capacity
+        self.dim: Optional[int] = None
+        self._size = 0
+        self._data: Optional[np.ndarray] = None
+
+    def _allocate(self, capacity: int) -> None:
+        if self.path is None:
+            data = np.empty((capacity, self.dim), dtype=np.float32)
+            if self._data is not None:
+                data[:self._size] = self._data[:self._size]
+        else:
+            if self._data is not None:
+                self._data.flush()
+                del self._data
+            with open(self.path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+            data = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._data = data
+        self.capacity = capacity
+
+    def append(self, vectors: np.ndarray) -> None:
+        """Aggiunge un blocco di vettori (n x dim)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self._allocate(max(self.capacity, len(vectors)))
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Dimensione dei vettori {vectors.shape[1]} diversa da {self.dim}")
+        if self._size + len(vectors) > self.capacity:
+            capacity = self.capacity
+            while capacity < self._size + len(vectors):
+                capacity *= 2
+            self._allocate(capacity)
+        self._data[self._size:self._size + len(vectors)] = vectors
+        self._size += len(vectors)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def array(self) -> np.ndarray:
+        """Vista (senza copia) dei vettori aggiunti"""
+        if self._data is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._data[:self._size]
+
+    def close(self) -> None:
+        """Libera il buffer ed elimina il file"""
+        self._data = None
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+class PipelineResult:
+    """Chunk, metadati, numero di token e vettori prodotti dalla pipeline, nello stesso ordine"""
+
+    def __init__(self, texts: List[str], metadata: List[Dict[str, Any]], token_counts: List[int],
+                 vectors: VectorBuffer, stats: Dict[str, int]):
+        self.texts = texts
+        self.metadata = metadata
+        self.token_counts = token_counts
+        self.vectors = vectors
+        self.stats = stats
+
+_DONE = object()
+
+def run_pipeline(documents: Iterable[Tuple[str, str]],
+                 chunk_documents: Callable[[List[str]], Sequence[Sequence[Any]]],
+                 document_metadata: Callable[[str], Dict[str, Any]],
+                 embed_batch: Callable[[List[str]], np.ndarray],
+                 batch_size: int = 100, queue_size: int = 4, chunk_group: int = 8,
+                 max_batch_tokens: Optional[int] = None, concurrency: int = 1,
+                 deduplicator: Any = None,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 buffer: Optional[VectorBuffer] = None,
+                 progress: Optional[Callable[[Dict[str, int]], None]] = None) -> PipelineResult:
+    """
+    Esegue la pipeline sui documenti (relpath, testo), consumati in modo lazy.
+    chunk_documents riceve i testi di chunk_group documenti alla volta e restituisce, per ognuno,
+    la lista dei chunk: stringhe o oggetti con attributi text e tokens (rag.chunker.Chunk).
+    deduplicator (es. MinHashDeduplicator) scarta i chunk quasi duplicati prima degli embedding;
+    count_tokens misura i token dei chunk senza conteggio (token risparmiati, max_batch_tokens); concurrency è il numero di batch inviati a embed_batch in parallelo.
+    progress riceve le statistiche dopo ogni batch di embedding: un'eccezione sollevata da
+    progress (es. annullamento del lavoro) ferma la pipeline.
+    """
+    buffer = buffer if buffer is not None else VectorBuffer()
+    batches: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    stats = {"documents": 0, "chunks": 0, "duplicates": 0, "duplicate_tokens": 0}
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def chunk_groups():
+        group: List[Tuple[str, str]] = []
+        for document in documents:
+            group.append(document)
+            if len(group) >= chunk_group:
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def produce() -> None:
+        batch: List[Tuple[str, Dict[str, Any], int]] = []
+        batch_tokens = 0
+        try:
+            for group in chunk_groups():
+                for (relpath, _), chunks in zip(group, chunk_documents([text for _, text in group])):
+                    stats["documents"] += 1
+                    meta = document_metadata(relpath)
+                    for chunk in chunks:
+                        if isinstance(chunk, str):
+                            text = chunk
+                            tokens = count_tokens(chunk) if count_tokens is not None else 0
+                        else:
+                            text, tokens = chunk.text, chunk.tokens
+                        if deduplicator is not None and not deduplicator.add(text):
+                            stats["duplicates"] += 1
+                            stats["duplicate_tokens"] += tokens
+                            continue
+                        if batch and max_batch_tokens and batch_tokens + tokens > max_batch_tokens:
+                            if not put(batch):
+                                return
+                            batch, batch_tokens = [], 0
+                        batch.append((text, meta, tokens))
+                        batch_tokens += tokens
+                        if len(batch) >= batch_size:
+                            if not put(batch):
+                                return
+                            batch, batch_tokens = [], 0
+            if batch and not put(batch):
+                return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+    producer.start()
+    texts: List[str] = []
+    metadata: List[Dict[str, Any]] = []
+    token_counts: List[int] = []
+    pending: "deque[Tuple[Any, List[Tuple[str, Dict[str, Any], int]]]]" = deque()
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embedding")
+
+    def collect() -> None:
+        # I batch vengono accodati nell'ordine di invio, qualunque sia l'ordine di completamento
+        future, item = pending.popleft()
+        buffer.append(future.result())
+        texts.extend(chunk for chunk, _, _ in item)
+        metadata.extend(meta for _, meta, _ in item)
+        token_counts.extend(tokens for _, _, tokens in item)
+        stats["chunks"] += len(item)
+        if progress is not None:
+            progress(stats)
+
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            pending.append((executor.submit(embed_batch, [chunk for chunk, _, _ in item]), item))
+            if len(pending) >= max(1, concurrency):
+                collect()
+        while pending:
+            collect()
+    finally:
+        # In caso di errore il produttore si ferma alla prossima consegna
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        producer.join()
+    return PipelineResult(texts, metadata, token_counts, buffer, stats)
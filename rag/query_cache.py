@@ -0,0 +1,150 @@
+"""
+Cache a due livelli degli embedding delle domande (/ask).
+
+    1. LRU in memoria del processo (nessun I/O)
+    2. SQLite su disco (<BASE_DIR>/cache/query_embeddings.sqlite), condiviso tra worker e riavvii
+
+La chiave è (modello di embedding, testo normalizzato): maiuscole, spazi e punteggiatura finale
+non generano una nuova chiamata API. Quando EMBEDDING_MODEL cambia, le voci degli altri
+modelli vengono eliminate all'apertura del database.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+_SPACES_RE = re.compile(r"\s+")
+# Prefisso breve separato dal numero ("hb 3", "app-12") e parole che contengono cifre
+_PREFIX_RE = re.compile(r"\b([^\W\d_]{1,3})[ \-](?=\d)")
+_IDENTIFIER_RE = re.compile(r"\w*\d\w*")
+
+def normalize_query(text: str) -> str:
+    """Forma canonica della domanda: Unicode NFKC, minuscolo, spazi compattati, senza punteggiatura finale"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACES_RE.sub(" ", text).strip().rstrip("?!.;: ")
+
+def query_identifiers(text: str) -> frozenset:
+    """
+    Numeri e codici della domanda ("codice keybox Hb 3" → {"hb3"}, "camera 12" → {"12"}).
+    Domande che differiscono solo per un identificativo hanno embedding quasi uguali: una
+    risposta memorizzata vale per un'altra domanda solo se gli identificativi coincidono.
+    """
+    return frozenset(_IDENTIFIER_RE.findall(_PREFIX_RE.sub(r"\1", normalize_query(text))))
+
+class QueryEmbeddingCache:
+    """LRU in memoria + archivio SQLite degli embedding delle domande"""
+
+    def __init__(self, path: Optional[str], model: str, max_entries: int = 1024):
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Connessione aperta alla prima richiesta (con il lock già acquisito)"""
+        if self._conn is None and self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (model, query))"
+            )
+            # Invalidazione: gli embedding di altri modelli non sono confrontabili con quelli attuali
+            conn.execute("DELETE FROM query_embeddings WHERE model != ?", (self.model,))
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Embedding in cache per la domanda, None se assente"""
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits_memory += 1
+                return vector
+            try:
+                db = self._db()
+                row = db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?", (self.model, key)
+                ).fetchone() if db is not None else None
+            except sqlite3.Error as e:
+                # La cache su disco non deve mai bloccare una richiesta: si procede come miss
+                logger.warning(f"Cache embedding non disponibile: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector)
+            self.hits_disk += 1
+            return vector
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        """Salva l'embedding della domanda in entrambi i livelli"""
+        key = normalize_query(text)
+        vector = np.ascontiguousarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._remember(key, vector)
+            try:
+                db = self._db()
+                if db is not None:
+                    db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (model, query, vector, created_at) VALUES (?, ?, ?, ?)",
+                        (self.model, key, vector.tobytes(), time.time())
+                    )
+                    db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Impossibile salvare l'embedding in cache: {e}")
+
+    def get_or_compute(self, text: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Restituisce l'embedding in cache o lo calcola con compute(text) e lo memorizza"""
+        vector = self.get(text)
+        if vector is None:
+            vector = np.asarray(compute(text), dtype=np.float32).reshape(-1)
+            self.put(text, vector)
+        return vector
+
+    def get_or_compute_many(self, texts: List[str], compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Come get_or_compute per più testi: i miss sono calcolati con una sola chiamata compute(miss)"""
+        vectors = [self.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = np.asarray(compute([texts[i] for i in missing]), dtype=np.float32)
+            for i, vector in zip(missing, computed):
+                self.put(texts[i], vector)
+                vectors[i] = vector
+        return np.array(vectors, dtype=np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di hit/miss dall'avvio del processo"""
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "model": self.model,
+            "entries_memory": len(self._lru),
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+        }
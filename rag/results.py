@@ -0,0 +1,67 @@
+"""
+Tipo compatto per i risultati della ricerca.
+
+Un SearchResult contiene solo id del chunk, distanza e punteggio; testo e metadati
+vengono letti dall'archivio dei chunk alla prima richiesta. Per compatibilità con il
+codice che usa i dizionari, supporta anche result["text"], result["meta"], result["distance"].
+"""
+from typing import Any, Dict, Optional, Sequence
+
+def distance_to_score(distance: float, inner_product: bool) -> float:
+    """
+    Converte la distanza FAISS in similarità coseno.
+    Per gli indici a prodotto interno su vettori normalizzati la distanza è già il coseno;
+    per L2 su vettori unitari (come gli embedding OpenAI) vale ||a - b||^2 = 2 - 2 cos.
+    """
+    return float(distance) if inner_product else 1.0 - float(distance) / 2.0
+
+class SearchResult:
+    """Risultato di ricerca con testo e metadati risolti in modo lazy"""
+
+    __slots__ = ("id", "distance", "score", "rrf", "_texts", "_metadata", "_text", "_meta")
+
+    def __init__(self, chunk_id: int, distance: Optional[float], score: Optional[float],
+                 texts: Sequence[str], metadata: Sequence[Dict[str, Any]]):
+        self.id = chunk_id
+        self.distance = distance
+        self.score = score
+        self.rrf: Optional[float] = None
+        self._texts = texts
+        self._metadata = metadata
+        self._text: Optional[str] = None
+        self._meta: Optional[Dict[str, Any]] = None
+
+    @property
+    def text(self) -> str:
+        """Testo del chunk (decodificato alla prima lettura)"""
+        if self._text is None:
+            self._text = self._texts[self.id]
+        return self._text
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        """Metadati del documento di appartenenza"""
+        if self._meta is None:
+            self._meta = self._metadata[self.id]
+        return self._meta
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in ("id", "distance", "score", "rrf", "text", "meta"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("id", "distance", "score", "text", "meta") or (key == "rrf" and self.rrf is not None)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Rappresentazione serializzabile (log, API)"""
+        data = {"id": self.id, "text": self.text, "meta": self.meta, "distance": self.distance, "score": self.score}
+        if self.rrf is not None:
+            data["rrf"] = self.rrf
+        return data
+
+    def __repr__(self) -> str:
+        return f"SearchResult(id={self.id}, distance={self.distance}, score={self.score})"
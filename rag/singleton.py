@@ -1,11 +1,137 @@
+import logging
+import os
 import threading
-from typing import Optional, Tuple, List, Dict, Any
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple, List, Dict, Any, Iterator
 import faiss
 import numpy as np
-from .vectorstore import load_faiss_index
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .filters import MetadataFilterIndex
+from .mmr import mmr_select
+from .generations import current_generation, resolve_index_path, verify_generation
+from .results import SearchResult
+from .chunkstore import CHUNK_STORE_SUFFIXES
+from .vectorstore import load_faiss_index, load_index_params, reconstruct_vectors, search_faiss, search_faiss_batch
+
+logger = logging.getLogger(__name__)
+
+def _rss_bytes() -> Optional[int]:
+    """Memoria residente del processo (Linux), None se non disponibile"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class IndexGeneration:
+    """Una generazione caricata dell'indice, con il numero di lettori che la stanno usando"""
+    
+    def __init__(self, index: faiss.Index, texts, metadata, path: str, generation: Optional[str] = None,
+                 bm25: Optional[BM25Index] = None, tombstones: int = 0):
+        self.index = index
+        self.texts = texts
+        self.metadata = metadata
+        self.bm25 = bm25
+        # Chunk rimossi i cui vettori sono ancora nell'indice (HNSW): esclusi con la bitmap live
+        self.tombstones = tombstones
+        self.path = path
+        self.generation = generation
+        self.readers = 0
+        self.retired = False
+        self._filter_index: Optional[MetadataFilterIndex] = None
+        self._filter_lock = threading.Lock()
+        self._vectors_lock = threading.Lock()
+    
+    def is_loaded(self) -> bool:
+        """Verifica se la generazione contiene dati"""
+        return self.index is not None and len(self.texts) > 0
+    
+    def filter_index(self) -> MetadataFilterIndex:
+        """Bitmap per source/tag, calcolate alla prima ricerca filtrata"""
+        if self._filter_index is None:
+            with self._filter_lock:
+                if self._filter_index is None:
+                    self._filter_index = MetadataFilterIndex(self.metadata)
+        return self._filter_index
+    
+    def _id_bitmap(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if filters:
+            return self.filter_index().bitmap(filters)
+        return self.filter_index().live if self.tombstones else None
+    
+    def search(self, query_vector: np.ndarray, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+               min_score: Optional[float] = None) -> List[SearchResult]:
+        """Ricerca singola su questa generazione, opzionalmente filtrata per source/tags"""
+        if not self.is_loaded():
+            return []
+        return search_faiss(self.index, self.texts, self.metadata, query_vector, top_k,
+                            id_bitmap=self._id_bitmap(filters), min_score=min_score)
+    
+    def search_batch(self, query_vectors: np.ndarray, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                     min_score: Optional[float] = None) -> List[List[SearchResult]]:
+        """Ricerca multi-query su questa generazione"""
+        if not self.is_loaded():
+            n_queries = 1 if query_vectors.ndim == 1 else len(query_vectors)
+            return [[] for _ in range(n_queries)]
+        return search_faiss_batch(self.index, self.texts, self.metadata, query_vectors, top_k,
+                                  id_bitmap=self._id_bitmap(filters), min_score=min_score)
+    
+    def search_hybrid(self, query_vector: np.ndarray, query_text: str, top_k: int = 5,
+                      filters: Optional[Dict[str, Any]] = None, pool_factor: int = 4,
+                      rrf_k: int = 60, min_score: Optional[float] = None) -> List[SearchResult]:
+        """
+        Ricerca ibrida: vettoriale (FAISS) + lessicale (BM25), combinate con Reciprocal Rank Fusion.
+        min_score è la soglia di pertinenza della domanda: senza almeno un risultato vettoriale
+        sopra soglia non si restituisce nulla, nemmeno i chunk trovati solo da BM25.
+        """
+        if not self.is_loaded():
+            return []
+        id_bitmap = self._id_bitmap(filters)
+        pool = top_k * max(pool_factor, 1)
+        dense = search_faiss(self.index, self.texts, self.metadata, query_vector, pool,
+                             id_bitmap=id_bitmap, min_score=min_score)
+        if not dense and min_score is not None:
+            return []
+        if self.bm25 is None or not query_text:
+            return dense[:top_k]
+        
+        lexical_ids, _ = self.bm25.search(query_text, pool, id_bitmap=id_bitmap)
+        fused = reciprocal_rank_fusion([[r.id for r in dense], lexical_ids.tolist()], k=rrf_k)
+        by_id = {r.id: r for r in dense}
+        results = []
+        for chunk_id, score in fused[:top_k]:
+            # I chunk trovati solo dalla ricerca lessicale non hanno distanza né similarità vettoriale
+            result = by_id.get(chunk_id) or SearchResult(chunk_id, None, None, self.texts, self.metadata)
+            result.rrf = score
+            results.append(result)
+        return results
+    
+    def diversify(self, query_vector: np.ndarray, results: List[SearchResult], top_k: int = 5,
+                  lambda_mult: float = 0.7, per_source_cap: int = 0) -> List[SearchResult]:
+        """Sceglie top_k risultati diversi tra i candidati con MMR sui vettori memorizzati nell'indice"""
+        if len(results) <= top_k and per_source_cap <= 0:
+            return results
+        with self._vectors_lock:
+            vectors = reconstruct_vectors(self.index, [r.id for r in results])
+        sources = [(r.meta or {}).get("source", "") for r in results]
+        picks = mmr_select(query_vector, vectors, top_k, lambda_mult, sources, per_source_cap)
+        return [results[i] for i in picks]
+    
+    def close(self) -> None:
+        """Rilascia indice e chunk: la memoria (o la mappatura) viene liberata dal garbage collector"""
+        self.index = None
+        self.texts = []
+        self.metadata = []
+        self.bm25 = None
+        self._filter_index = None
 
 class FAISSIndexSingleton:
-    """Singleton per gestire l'indice FAISS in modo thread-safe"""
+    """
+    Registro dell'indice FAISS condiviso da route e script (una sola copia per processo).
+    Con configure() l'indice viene caricato al primo utilizzo; in produzione un errore di
+    caricamento lascia un indice vuoto (le ricerche restituiscono []) invece di bloccare l'app.
+    """
     
     _instance = None
     _lock = threading.Lock()
@@ -20,56 +146,204 @@ class FAISSIndexSingleton:
     
     def __init__(self):
         if not self._initialized:
-            self._index = None
-            self._texts = []
-            self._metadata = []
+            self._current: Optional[IndexGeneration] = None
+            self._index_path = None
+            self._mmap = False
+            self._reload_interval = 5.0
+            self._last_check = 0.0
+            self._reload_lock = threading.Lock()
+            self._degrade = False
+            self._load_attempted = False
+            self._load_stats: Dict[str, Any] = {}
             self._initialized = True
     
-    def load_index(self, index_path: str) -> bool:
-        """Carica l'indice FAISS"""
+    def configure(self, index_path: str, mmap: bool = False, reload_interval: Optional[float] = None,
+                  degrade: bool = False) -> None:
+        """Registra l'indice da usare senza caricarlo: il caricamento avviene alla prima richiesta"""
+        self._index_path = index_path
+        self._mmap = mmap
+        if reload_interval is not None:
+            self._reload_interval = reload_interval
+        self._degrade = degrade
+        self._load_attempted = False
+    
+    def ensure_loaded(self) -> bool:
+        """Carica l'indice configurato se non è ancora stato caricato"""
+        if self._current is not None or self._index_path is None or self._load_attempted:
+            return self.is_loaded()
+        with self._reload_lock:
+            if self._current is not None or self._load_attempted:
+                return self.is_loaded()
+            if self.load_index(self._index_path, mmap=self._mmap):
+                self._load_attempted = True
+                return True
+            if not self._degrade:
+                raise RuntimeError(f"Impossibile caricare l'indice FAISS: {self._index_path}")
+            self._load_attempted = True
+            # Indice vuoto: le ricerche restituiscono [] e una nuova generazione viene caricata appena pubblicata
+            logger.warning(f"Indice FAISS non disponibile ({self._index_path}): utilizzo indice vuoto come fallback")
+            self._swap(IndexGeneration(None, [], [], self._index_path))
+            return False
+    
+    def load_index(self, index_path: str, mmap: bool = False, reload_interval: Optional[float] = None,
+                   verify: bool = False) -> bool:
+        """
+        Carica l'indice FAISS (una sola copia per processo, opzionalmente mappata in memoria).
+        Dei file della generazione si controllano presenza e dimensioni; con verify anche i
+        checksum (lettura completa dei file, annulla il vantaggio del caricamento mmap).
+        """
+        start, rss_before = time.perf_counter(), _rss_bytes()
         try:
-            self._index, self._texts, self._metadata = load_faiss_index(index_path)
-            return True
+            generation = current_generation(index_path)
+            path = resolve_index_path(index_path)
+            if generation is not None:
+                verify_generation(os.path.dirname(path), checksums=verify)
+            index, texts, metadata = load_faiss_index(path, mmap=mmap)
+            bm25 = BM25Index.load(path)
+            tombstones = int(load_index_params(path).get("tombstones", 0))
         except Exception as e:
             print(f"Errore nel caricamento dell'indice: {e}")
             return False
+        
+        self._index_path = index_path
+        self._mmap = mmap
+        if reload_interval is not None:
+            self._reload_interval = reload_interval
+        self._swap(IndexGeneration(index, texts, metadata, path, generation, bm25=bm25, tombstones=tombstones))
+        
+        rss_after = _rss_bytes()
+        files = [path] + [path + suffix for suffix in CHUNK_STORE_SUFFIXES]
+        self._load_stats = {
+            "generation": generation,
+            "path": path,
+            "mmap": mmap,
+            "chunks": len(texts),
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "files_mb": round(sum(os.path.getsize(f) for f in files if os.path.exists(f)) / 1e6, 2),
+            "rss_delta_mb": round((rss_after - rss_before) / 1e6, 2) if rss_before and rss_after else None,
+        }
+        logger.info(f"Indice FAISS caricato: {self._load_stats}")
+        return True
+    
+    def _swap(self, new_generation: IndexGeneration) -> None:
+        """Sostituzione RCU: i nuovi lettori vedono la nuova generazione, la vecchia
+        viene rilasciata quando l'ultimo lettore ha finito"""
+        with self._lock:
+            old, self._current = self._current, new_generation
+            if old is not None:
+                old.retired = True
+                if old.readers == 0:
+                    old.close()
+    
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """Carica la generazione attiva su disco se diversa da quella in memoria"""
+        if self._index_path is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_check < self._reload_interval:
+            return False
+        self._last_check = now
+        
+        generation = current_generation(self._index_path)
+        current = self._current
+        if generation is None or (current is not None and current.generation == generation):
+            return False
+        # Un solo caricamento alla volta; nel frattempo le richieste usano la generazione precedente
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            return self.load_index(self._index_path, mmap=self._mmap)
+        finally:
+            self._reload_lock.release()
+    
+    def acquire(self) -> Optional[IndexGeneration]:
+        """Restituisce la generazione corrente registrando un lettore (da rilasciare con release)"""
+        self.ensure_loaded()
+        self.reload_if_changed()
+        with self._lock:
+            generation = self._current
+            if generation is not None:
+                generation.readers += 1
+            return generation
+    
+    def release(self, generation: Optional[IndexGeneration]) -> None:
+        """Rilascia un lettore; una generazione sostituita viene liberata all'ultimo rilascio"""
+        if generation is None:
+            return
+        with self._lock:
+            generation.readers -= 1
+            if generation.retired and generation.readers == 0:
+                generation.close()
+    
+    @contextmanager
+    def reader(self) -> Iterator[Optional[IndexGeneration]]:
+        """Context manager per usare la generazione corrente"""
+        generation = self.acquire()
+        try:
+            yield generation
+        finally:
+            self.release(generation)
     
     def get_index(self) -> Optional[faiss.Index]:
         """Restituisce l'indice FAISS"""
-        return self._index
+        self.ensure_loaded()
+        return self._current.index if self._current is not None else None
     
     def get_texts(self) -> List[str]:
         """Restituisce i testi"""
-        return self._texts
+        self.ensure_loaded()
+        return self._current.texts if self._current is not None else []
     
     def get_metadata(self) -> List[Dict[str, Any]]:
         """Restituisce i metadati"""
-        return self._metadata
+        self.ensure_loaded()
+        return self._current.metadata if self._current is not None else []
+    
+    def get_index_path(self) -> Optional[str]:
+        """Restituisce il percorso dell'indice caricato"""
+        return self._index_path
+    
+    def get_generation(self) -> Optional[str]:
+        """Restituisce il nome della generazione caricata (None per indici non versionati)"""
+        return self._current.generation if self._current is not None else None
     
     def is_loaded(self) -> bool:
         """Verifica se l'indice è caricato"""
-        return self._index is not None and len(self._texts) > 0
+        return self._current is not None and self._current.is_loaded()
     
-    def search(self, query_vector: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+    def stats(self) -> Dict[str, Any]:
+        """Stato del registro: ultimo caricamento (tempo, memoria) e generazione attiva"""
+        return dict(
+            self._load_stats,
+            loaded=self.is_loaded(),
+            active_generation=self.get_generation(),
+            index_path=self._index_path
+        )
+    
+    def search(self, query_vector: np.ndarray, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+               min_score: Optional[float] = None) -> List[SearchResult]:
         """Esegue una ricerca nell'indice"""
-        if not self.is_loaded():
-            return []
-        
         try:
-            if self._index is not None:
-                D, I = self._index.search(query_vector, top_k)
-                results = []
-                for i in I[0]:
-                    if i < len(self._texts):
-                        results.append({
-                            "text": self._texts[i],
-                            "meta": self._metadata[i] if i < len(self._metadata) else {}
-                        })
-                return results
-            return []
+            with self.reader() as generation:
+                if generation is None:
+                    return []
+                return generation.search(query_vector, top_k, filters, min_score=min_score)
         except Exception as e:
             print(f"Errore nella ricerca: {e}")
             return []
+    
+    def search_batch(self, query_vectors: np.ndarray, top_k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                     min_score: Optional[float] = None) -> List[List[SearchResult]]:
+        """Esegue più ricerche in un'unica chiamata FAISS (una lista di risultati per riga)"""
+        n_queries = 1 if query_vectors.ndim == 1 else len(query_vectors)
+        try:
+            with self.reader() as generation:
+                if generation is None:
+                    return [[] for _ in range(n_queries)]
+                return generation.search_batch(query_vectors, top_k, filters, min_score=min_score)
+        except Exception as e:
+            print(f"Errore nella ricerca: {e}")
+            return [[] for _ in range(n_queries)]
 
 # Istanza globale
 faiss_singleton = FAISSIndexSingleton() 
\ No newline at end of file
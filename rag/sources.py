@@ -0,0 +1,93 @@
+"""
+Manifest dei documenti indicizzati, per l'ingestione incrementale.
+
+Salvato accanto all'indice (<percorso indice>.sources.json, quindi dentro ogni generazione):
+    {
+      "params": {"chunk_size": 500, "chunk_overlap": 50, "embedding_model": "...", ...},
+      "documents": {
+        "guida/wifi.md": {"size": 812, "mtime": 1718000000000000000, "sha256": "...",
+                          "metadata_sha256": "...", "chunk_ids": [0, 1]},
+        "https://www.visitrimini.com/en/events/":
+                         {"size": 5230, "mtime": null, "sha256": "...", "body_sha256": "...",
+                          "metadata_sha256": "...", "chunk_ids": [2, 3, 4]}
+      }
+    }
+
+Un file con stessa dimensione e mtime non viene nemmeno letto; se sono cambiati si confronta
+l'hash del contenuto. Per le pagine web si confronta prima l'hash del corpo HTML (body_sha256),
+poi quello del testo estratto. Solo i documenti aggiunti, modificati o rimossi vengono rielaborati;
+se cambiano solo i metadati (metadata.json, impronta in metadata_sha256) si aggiornano i chunk
+esistenti senza ricalcolare gli embedding.
+I parametri di chunking e il modello di embedding fanno parte del manifest: se cambiano,
+i chunk esistenti non sono più validi e serve una reindicizzazione completa.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .generations import file_sha256
+
+SOURCES_SUFFIX = ".sources.json"
+
+def text_sha256(text: str) -> str:
+    """Hash del contenuto di un documento già estratto (es. pagine web)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def metadata_sha256(meta: Dict[str, Any]) -> str:
+    """Impronta dei metadati di un documento (descrizione e tag applicati ai suoi chunk)"""
+    return text_sha256(json.dumps(meta, sort_keys=True, ensure_ascii=False))
+
+def file_entry(folder: str, relpath: str) -> Dict[str, Any]:
+    """Voce del manifest per un file: dimensione, mtime e hash del contenuto"""
+    path = os.path.join(folder, relpath)
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": file_sha256(path)}
+
+def read_sources(index_path: str) -> Optional[Dict[str, Any]]:
+    """Manifest dei documenti dell'indice, None se assente (indici creati prima del manifest)"""
+    try:
+        with open(index_path + SOURCES_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_sources(index_path: str, params: Dict[str, Any], documents: Dict[str, Dict[str, Any]]) -> None:
+    """Scrive il manifest dei documenti accanto all'indice"""
+    with open(index_path + SOURCES_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "documents": documents}, f, indent=2, ensure_ascii=False)
+
+def chunk_ids_by_source(metadata: Sequence[Dict[str, Any]], ids: Iterable[int]) -> Dict[str, List[int]]:
+    """Raggruppa gli id dei chunk per documento di appartenenza"""
+    grouped: Dict[str, List[int]] = {}
+    for meta, chunk_id in zip(metadata, ids):
+        grouped.setdefault(meta["source"], []).append(int(chunk_id))
+    return grouped
+
+def scan_changes(folder: str, relpaths: Iterable[str], previous: Dict[str, Dict[str, Any]]
+                 ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]], List[str], Dict[str, Dict[str, Any]]]:
+    """
+    Confronta i file presenti con il manifest precedente.
+    Restituisce (aggiunti, modificati, rimossi, invariati); le voci dei file aggiunti e modificati
+    non hanno ancora chunk_ids, quelle dei file invariati mantengono i chunk esistenti.
+    """
+    added: Dict[str, Dict[str, Any]] = {}
+    changed: Dict[str, Dict[str, Any]] = {}
+    unchanged: Dict[str, Dict[str, Any]] = {}
+    seen = set()
+    for relpath in relpaths:
+        seen.add(relpath)
+        prev = previous.get(relpath)
+        st = os.stat(os.path.join(folder, relpath))
+        if prev is not None and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns:
+            unchanged[relpath] = prev
+            continue
+        entry = file_entry(folder, relpath)
+        if prev is not None and prev["sha256"] == entry["sha256"]:
+            # Solo mtime cambiato (es. file copiato): nessuna rielaborazione
+            unchanged[relpath] = dict(prev, mtime=entry["mtime"])
+        elif prev is not None:
+            changed[relpath] = entry
+        else:
+            added[relpath] = entry
+    removed = [relpath for relpath in previous if relpath not in seen]
+    return added, changed, removed, unchanged
@@ -1,43 +1,455 @@
+import json
+import logging
+import math
+import os
 import faiss
 import pickle
 import numpy as np
+from .bm25 import BM25Index
+from .chunkstore import ChunkStore, has_chunk_store, write_chunk_store
+from .results import SearchResult, distance_to_score
 
-def save_faiss_index(embeddings, texts, metadata, path):
+logger = logging.getLogger(__name__)
+
+# Tipi di indice supportati e parametri di default.
+# sq8/sqfp16/pq comprimono i vettori; con rerank > 0 i migliori rerank*k candidati
+# vengono riordinati con la distanza esatta sui vettori originali (IndexRefineFlat).
+INDEX_TYPES = ("flat", "hnsw", "ivf", "sq8", "sqfp16", "pq")
+QUANTIZED_INDEX_TYPES = ("sq8", "sqfp16", "pq")
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "ivf": {"nlist": None, "nprobe": 8},
+    "sq8": {"rerank": 4},
+    "sqfp16": {"rerank": 4},
+    "pq": {"pq_m": 64, "pq_nbits": 8, "rerank": 4},
+}
+# Metrica comune a tutti i tipi: l2 oppure cosine (prodotto interno su vettori normalizzati)
+METRICS = ("l2", "cosine")
+PARAMS_SUFFIX = ".params.json"
+
+def _normalized(vectors):
+    """Copia dei vettori normalizzata a norma unitaria (per la metrica cosine)"""
+    vectors = np.array(vectors, dtype=np.float32, copy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def _resolve_params(index_type, index_params, n_vectors):
+    """
+    Unisce i parametri richiesti con i default del tipo di indice.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo di indice non supportato: {index_type} (ammessi: {', '.join(INDEX_TYPES)})")
+    params = dict(DEFAULT_INDEX_PARAMS[index_type], metric="l2")
+    # Ignora i parametri che non riguardano il tipo scelto (es. nprobe per HNSW)
+    params.update({k: v for k, v in (index_params or {}).items() if k in params and v is not None})
+    if params["metric"] not in METRICS:
+        raise ValueError(f"Metrica non supportata: {params['metric']} (ammesse: {', '.join(METRICS)})")
+    if index_type == "ivf":
+        # Regola empirica FAISS: ~4*sqrt(n) liste, almeno 39 punti di training per lista
+        if not params.get("nlist"):
+            params["nlist"] = int(4 * math.sqrt(n_vectors))
+        params["nlist"] = max(1, min(int(params["nlist"]), n_vectors // 39 or 1))
+        params["nprobe"] = max(1, min(int(params["nprobe"]), params["nlist"]))
+    if index_type == "pq":
+        # Il training di PQ richiede almeno 2^nbits vettori
+        params["pq_nbits"] = max(1, min(int(params["pq_nbits"]), int(math.log2(max(n_vectors, 2)))))
+    return params
+
+def _training_sample(embeddings, index_type, params, seed=0):
+    """
+    Vettori per il training: tutti se pochi, altrimenti un campione casuale grande quanto
+    FAISS ne userebbe comunque (256 punti per centroide), letto solo per le righe scelte.
+    """
+    n = len(embeddings)
+    if index_type == "ivf":
+        limit = 256 * int(params["nlist"])
+    elif index_type == "pq":
+        limit = 256 * 2 ** int(params["pq_nbits"])
+    else:
+        limit = 65536
+    if n > limit:
+        rows = np.sort(np.random.default_rng(seed).choice(n, size=limit, replace=False))
+        sample = np.ascontiguousarray(embeddings[rows], dtype=np.float32)
+    else:
+        sample = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return _normalized(sample) if params["metric"] == "cosine" else sample
+
+def build_faiss_index(embeddings, index_type="flat", index_params=None, ids=None, add_batch_size=None):
+    """
+    Costruisce un indice FAISS del tipo richiesto (flat, hnsw, ivf, sq8, sqfp16, pq).
+    Con ids i vettori sono aggiunti con quegli id (stabili, quindi rimovibili o aggiungibili in
+    seguito senza ricostruire l'indice): gli indici IVF li memorizzano direttamente, gli altri
+    sono avvolti in un IndexIDMap2.
+    Con add_batch_size i vettori (anche np.memmap) sono aggiunti a blocchi: in memoria resta solo
+    l'indice più un blocco, senza copie dell'intera matrice.
+    Restituisce l'indice e i parametri effettivamente usati.
+    """
+    n, dim = embeddings.shape
+    params = _resolve_params(index_type, index_params, n)
+    metric = faiss.METRIC_INNER_PRODUCT if params["metric"] == "cosine" else faiss.METRIC_L2
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(params["M"]), metric)
+        index.hnsw.efConstruction = int(params["efConstruction"])
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlat(dim, metric)
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], metric)
+        index.train(_training_sample(embeddings, index_type, params))
+    elif index_type in QUANTIZED_INDEX_TYPES:
+        if index_type == "pq":
+            if dim % int(params["pq_m"]) != 0:
+                raise ValueError(f"pq_m={params['pq_m']} deve dividere la dimensione dei vettori ({dim})")
+            # PQ in una sola lista IVF: stessi codici di IndexPQ, ma con supporto agli IDSelector
+            index = faiss.IndexIVFPQ(faiss.IndexFlat(dim, metric), dim, 1,
+                                     int(params["pq_m"]), int(params["pq_nbits"]), metric)
+        else:
+            qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+            index = faiss.IndexScalarQuantizer(dim, qtype, metric)
+        if params.get("rerank"):
+            index = faiss.IndexRefineFlat(index)
+        index.train(_training_sample(embeddings, index_type, params))
+    else:
+        index = faiss.IndexFlat(dim, metric)
+
+    if ids is not None:
+        ids = np.asarray(ids, dtype=np.int64)
+        # IndexIDMap su IVF restituirebbe id errati dopo remove_ids (IVF non rinumera le liste)
+        if not isinstance(index, faiss.IndexIVF):
+            index = faiss.IndexIDMap2(index)
+    step = add_batch_size or max(n, 1)
+    for start in range(0, n, step):
+        batch = np.ascontiguousarray(embeddings[start:start + step], dtype=np.float32)
+        if params["metric"] == "cosine":
+            batch = _normalized(batch)
+        if ids is None:
+            index.add(batch)
+        else:
+            index.add_with_ids(batch, ids[start:start + step])
+    apply_search_params(index, params)
+    return index, params
+
+def unwrap_id_map(index):
+    """Indice sottostante a un IndexIDMap (l'indice stesso se non è avvolto)"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def reconstruct_vectors(index, ids):
+    """
+    Vettori memorizzati nell'indice per gli id dei chunk (esatti per flat, HNSW e indici con
+    riordinamento, approssimati per SQ/PQ). Gli indici IVF ricevono una direct map alla prima chiamata.
+    """
+    base = unwrap_id_map(index)
+    if isinstance(base, faiss.IndexIVF) and base.direct_map.type == faiss.DirectMap.NoMap:
+        # Hashtable: gli id non sono contigui dopo le rimozioni incrementali
+        base.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+def apply_search_params(index, params):
+    """
+    Applica all'indice i parametri di ricerca (efSearch per HNSW, nprobe per IVF,
+    rerank per gli indici quantizzati con riordinamento esatto).
+    """
+    index = unwrap_id_map(index)
+    if params.get("efSearch") is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(params["efSearch"])
+    if params.get("nprobe") is not None and hasattr(index, "nprobe"):
+        index.nprobe = int(params["nprobe"])
+    if params.get("rerank") and hasattr(index, "k_factor"):
+        index.k_factor = float(params["rerank"])
+
+def make_search_params(index, selector):
+    """
+    Parametri di ricerca con un IDSelector, mantenendo le impostazioni correnti dell'indice
+    (efSearch, nprobe, rerank), che altrimenti tornerebbero ai default di FAISS.
+    """
+    if isinstance(index, faiss.IndexRefine):
+        base_params = make_search_params(faiss.downcast_index(index.base_index), selector)
+        return faiss.IndexRefineSearchParameters(k_factor=index.k_factor, base_index_params=base_params)
+    if isinstance(index, faiss.IndexIDMap):
+        # IndexIDMap traduce da sé il selettore sugli id esterni
+        return make_search_params(faiss.downcast_index(index.index), selector)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if hasattr(index, "nprobe"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+def index_memory_bytes(index):
+    """
+    Memoria occupata dai dati scansionati a ogni ricerca.
+    Per gli indici con riordinamento conta solo l'indice compresso: i vettori esatti
+    vengono letti solo per i candidati (e con mmap restano su disco).
+    """
+    index = unwrap_id_map(index)
+    if isinstance(index, faiss.IndexRefine):
+        index = index.base_index
+    return int(faiss.serialize_index(index).nbytes)
+
+def recall_at_k(approx_ids, exact_ids, k):
+    """
+    Frazione media dei k vicini esatti ritrovati da un indice approssimato.
+    """
+    hits = 0
+    for approx, exact in zip(approx_ids[:, :k], exact_ids[:, :k]):
+        hits += len(set(approx.tolist()) & set(exact.tolist()))
+    return hits / float(k * len(exact_ids))
+
+def exact_knn(embeddings, queries, k, metric_type=faiss.METRIC_L2, batch_size=16384):
+    """
+    Id dei k vicini esatti delle query, per forza bruta sui vettori letti a blocchi di
+    batch_size righe (anche da np.memmap): in memoria resta un solo blocco, mai la matrice intera.
+    Con METRIC_INNER_PRODUCT i vettori sono normalizzati blocco per blocco (metrica cosine).
+    """
+    best_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_i = np.full((len(queries), k), -1, dtype=np.int64)
+    query_norms = (queries ** 2).sum(axis=1, keepdims=True)
+    for start in range(0, len(embeddings), batch_size):
+        batch = np.ascontiguousarray(embeddings[start:start + batch_size], dtype=np.float32)
+        if metric_type == faiss.METRIC_INNER_PRODUCT:
+            distances = -(queries @ _normalized(batch).T)
+        else:
+            distances = query_norms - 2 * (queries @ batch.T) + (batch ** 2).sum(axis=1)
+        ids = np.broadcast_to(np.arange(start, start + len(batch), dtype=np.int64), distances.shape)
+        all_d, all_i = np.hstack([best_d, distances]), np.hstack([best_i, ids])
+        top = np.argsort(all_d, axis=1, kind="stable")[:, :k]
+        best_d, best_i = np.take_along_axis(all_d, top, axis=1), np.take_along_axis(all_i, top, axis=1)
+    return best_i
+
+def quantization_report(index, embeddings, k=5, n_queries=200, seed=0, batch_size=16384):
+    """
+    Confronta un indice quantizzato con la ricerca esatta: memoria risparmiata
+    e recall@k con e senza riordinamento esatto.
+    I vicini esatti sono calcolati a blocchi (exact_knn), senza copie della matrice degli embedding.
+    """
+    n, dim = embeddings.shape
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n, size=min(n_queries, n), replace=False))
+    queries = np.array(embeddings[rows], dtype=np.float32)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        queries = _normalized(queries)
+    queries = queries + 0.01 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    expected = exact_knn(embeddings, queries, k, index.metric_type, batch_size)
+    # Gli id esterni coincidono con le posizioni (0..n-1) appena l'indice è costruito
+    base = unwrap_id_map(index)
+    if isinstance(base, faiss.IndexRefine):
+        base = base.base_index
+    _, approx = base.search(queries, k)
+    _, reranked = index.search(queries, k)
+
+    float_bytes = n * dim * 4
+    quantized_bytes = index_memory_bytes(index)
+    return {
+        "float32_mb": round(float_bytes / 1e6, 2),
+        "quantized_mb": round(quantized_bytes / 1e6, 2),
+        "memory_saved_pct": round(100 * (1 - quantized_bytes / float_bytes), 1),
+        "recall_at_k": k,
+        "recall_quantized": round(recall_at_k(approx, expected, k), 4),
+        "recall_reranked": round(recall_at_k(reranked, expected, k), 4),
+    }
+
+def load_index_params(index_path):
+    """
+    Legge i parametri dell'indice salvati accanto al file binario.
+    Gli indici creati prima dell'introduzione del file sono considerati flat.
+    """
+    params_path = index_path + PARAMS_SUFFIX
+    if not os.path.exists(params_path):
+        return {"index_type": "flat", "params": {}}
+    with open(params_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_faiss_index(embeddings, texts, metadata, path, index_type="flat", index_params=None, add_batch_size=None,
+                     token_counts=None):
     """
     Salva un indice FAISS con embeddings e metadati associati.
+    Il tipo di indice e i parametri di costruzione/ricerca sono salvati in <path>.params.json.
+    Una matrice float32 (anche np.memmap) non viene copiata; add_batch_size come in build_faiss_index.
+    token_counts (token di ogni chunk) viene salvato nell'archivio dei chunk.
     """
-    embeddings = np.array(embeddings, dtype=np.float32)
-    dim = embeddings.shape[1]
+    if not isinstance(embeddings, np.ndarray) or embeddings.dtype != np.float32:
+        embeddings = np.array(embeddings, dtype=np.float32)
 
-    # Crea l'indice vettoriale FAISS
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+    # Crea l'indice vettoriale FAISS: gli id dei vettori sono le righe dell'archivio dei chunk
+    index, params = build_faiss_index(embeddings, index_type, index_params, ids=np.arange(len(embeddings)),
+                                      add_batch_size=add_batch_size)
 
     # Salva l'indice binario
     faiss.write_index(index, path)
 
-    # Salva i metadati e i testi in formato pickle
-    with open(path + ".meta.pkl", "wb") as f:
-        pickle.dump({"texts": texts, "metadata": metadata}, f)
+    # Salva tipo e parametri dell'indice
+    info = {
+        "index_type": index_type,
+        "dim": int(embeddings.shape[1]),
+        "ntotal": int(index.ntotal),
+        "params": params
+    }
+    if index_type in QUANTIZED_INDEX_TYPES:
+        info["report"] = quantization_report(index, embeddings)
+        report = info["report"]
+        logger.info(
+            f"Indice {index_type}: {report['quantized_mb']} MB invece di {report['float32_mb']} MB "
+            f"(-{report['memory_saved_pct']}%), recall@{report['recall_at_k']} "
+            f"{report['recall_quantized']} senza riordinamento, {report['recall_reranked']} con riordinamento"
+        )
+    with open(path + PARAMS_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+
+    # Salva testi e metadati nell'archivio colonnare (blob UTF-8 + offset, tabella documenti)
+    write_chunk_store(path, texts, metadata, token_counts)
 
-def load_faiss_index(index_path):
+    # Indice lessicale BM25 per la ricerca ibrida
+    BM25Index.build(texts).save(path)
+
+def read_faiss_index(index_path, mmap=False):
+    """
+    Legge il file binario dell'indice FAISS.
+    Con mmap=True i dati vettoriali sono mappati in memoria in sola lettura invece di essere
+    copiati: le pagine sono condivise tra i processi (page cache) e caricate solo quando servono.
+    """
+    if mmap:
+        try:
+            return faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except (AttributeError, RuntimeError):
+            # Versioni di FAISS senza supporto mmap per questo tipo di indice
+            pass
+    return faiss.read_index(index_path)
+
+def load_faiss_index(index_path, mmap=False):
     """
     Carica un indice FAISS e i relativi metadati associati.
+    Testi e metadati sono restituiti come sequenze lazy se è presente l'archivio colonnare.
     """
-    index = faiss.read_index(index_path)
+    index = read_faiss_index(index_path, mmap=mmap)
+    apply_search_params(index, load_index_params(index_path).get("params", {}))
+    if has_chunk_store(index_path):
+        # Testi e metadati restano su disco e vengono decodificati solo quando letti
+        store = ChunkStore.open(index_path, mmap_mode=mmap)
+        return index, store.texts, store.metadata
+    # Formato precedente: sidecar pickle caricato interamente in memoria
     with open(index_path + ".meta.pkl", "rb") as f:
         meta = pickle.load(f)
     return index, meta["texts"], meta["metadata"]
 
-def search_faiss(index, texts, metadata, query_vector, top_k=5):
+def compact_index(index, info, metadata, tombstones):
+    """
+    Ricostruisce un indice con tombstone (HNSW, indici con riordinamento) usando solo i vettori
+    dei chunk presenti, ricostruiti dall'indice stesso: gli id restano le righe dell'archivio.
+    """
+    live = np.flatnonzero([meta is not None for meta in metadata])
+    logger.info(f"Compattazione dell'indice {info['index_type']}: {tombstones} tombstone su "
+                f"{index.ntotal} vettori, ricostruzione con {len(live)} vettori")
+    vectors = reconstruct_vectors(index, live)
+    compacted, _ = build_faiss_index(vectors, info["index_type"], info.get("params"), ids=live)
+    return compacted
+
+def update_faiss_index(src_path, dst_path, embeddings, texts, metadata, remove_sources=(), metadata_updates=None,
+                       token_counts=None, compact_ratio=None):
+    """
+    Aggiornamento incrementale: copia l'indice in src_path in dst_path rimuovendo i chunk dei
+    documenti in remove_sources e aggiungendo i nuovi chunk (con embedding già calcolati).
+    metadata_updates ({source: metadati}) aggiorna descrizione e tag dei documenti esistenti
+    senza ricalcolarne gli embedding; token_counts sono i token dei nuovi chunk.
+    Gli id dei chunk esistenti non cambiano; i nuovi chunk ricevono id successivi all'ultimo.
+    Quando i tombstone superano la frazione compact_ratio dei vettori, l'indice viene ricostruito
+    con i soli vettori dei chunk presenti, letti dall'indice stesso (stessi id, nessun embedding).
+    Restituisce gli id aggiunti e gli id rimossi.
+    """
+    index = faiss.read_index(src_path)
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF)) or not has_chunk_store(src_path):
+        raise ValueError("Indice senza id stabili dei chunk: eseguire una reindicizzazione completa")
+    info = load_index_params(src_path)
+    store = ChunkStore.open(src_path, mmap_mode=False)
+    all_texts, all_metadata = list(store.texts), list(store.metadata)
+    all_tokens = None
+    if store.token_counts is not None or token_counts is not None:
+        all_tokens = list(store.token_counts) if store.token_counts is not None else [-1] * len(all_texts)
+
+    remove_sources = set(remove_sources)
+    removed = [i for i, meta in enumerate(all_metadata) if meta is not None and meta.get("source") in remove_sources]
+    tombstones = int(info.get("tombstones", 0))
+    if removed:
+        try:
+            index.remove_ids(np.array(removed, dtype=np.int64))
+        except RuntimeError:
+            # HNSW e indici con riordinamento non supportano la rimozione: i vettori restano
+            # nell'indice ma i chunk sono marcati come rimossi ed esclusi in ricerca
+            tombstones += len(removed)
+        for i in removed:
+            all_texts[i] = ""
+            all_metadata[i] = None
+            if all_tokens is not None:
+                all_tokens[i] = 0
+    if metadata_updates:
+        all_metadata = [
+            metadata_updates.get(meta["source"], meta) if meta is not None else None for meta in all_metadata
+        ]
+
+    added = np.arange(len(all_texts), len(all_texts) + len(texts), dtype=np.int64)
+    if len(texts):
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if info.get("params", {}).get("metric") == "cosine":
+            vectors = _normalized(vectors)
+        index.add_with_ids(vectors, added)
+        all_texts.extend(texts)
+        all_metadata.extend(metadata)
+        if all_tokens is not None:
+            all_tokens.extend(token_counts if token_counts is not None else [-1] * len(texts))
+
+    if tombstones and compact_ratio is not None and tombstones > compact_ratio * index.ntotal:
+        index, tombstones = compact_index(index, info, all_metadata, tombstones), 0
+
+    faiss.write_index(index, dst_path)
+    info.update(ntotal=int(index.ntotal), tombstones=tombstones,
+                tombstone_ratio=round(tombstones / index.ntotal, 4) if index.ntotal else 0.0)
+    with open(dst_path + PARAMS_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    write_chunk_store(dst_path, all_texts, all_metadata, all_tokens)
+    # BM25 ricostruito dai testi: nessuna chiamata API, costo trascurabile rispetto agli embedding
+    BM25Index.build(all_texts).save(dst_path)
+    return added.tolist(), removed
+
+def search_faiss_batch(index, texts, metadata, query_vectors, top_k=5, id_bitmap=None, min_score=None):
+    """
+    Esegue più ricerche con una sola chiamata FAISS (matrice di query n x d).
+    Restituisce, per ogni query, la lista dei SearchResult (id, distanza, similarità coseno).
+    Con id_bitmap (vedi rag.filters) vengono valutati solo i chunk ammessi dalla bitmap;
+    con min_score vengono scartati i risultati con similarità inferiore alla soglia.
+    """
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    if query_vectors.ndim == 1:
+        query_vectors = query_vectors.reshape(1, -1)
+    inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    if inner_product:
+        query_vectors = _normalized(query_vectors)
+    if id_bitmap is None:
+        D, I = index.search(query_vectors, top_k)
+    elif not id_bitmap.any():
+        return [[] for _ in range(len(query_vectors))]
+    else:
+        id_bitmap = np.ascontiguousarray(id_bitmap, dtype=np.uint8)
+        selector = faiss.IDSelectorBitmap(len(texts), faiss.swig_ptr(id_bitmap))
+        D, I = index.search(query_vectors, top_k, params=make_search_params(index, selector))
+    batch = []
+    for distances, ids in zip(D, I):
+        results = []
+        for d, i in zip(distances.tolist(), ids.tolist()):
+            # Gli indici approssimati restituiscono -1 se trovano meno di top_k vicini
+            if i < 0:
+                continue
+            score = distance_to_score(d, inner_product)
+            if min_score is not None and score < min_score:
+                continue
+            results.append(SearchResult(i, d, score, texts, metadata))
+        batch.append(results)
+    return batch
+
+def search_faiss(index, texts, metadata, query_vector, top_k=5, id_bitmap=None, min_score=None):
     """
     Esegue una ricerca semantica nell'indice FAISS.
     """
-    D, I = index.search(query_vector, top_k)
-    results = []
-    for i in I[0]:
-        results.append({
-            "text": texts[i],
-            "meta": metadata[i]
-        })
-    return results 
\ No newline at end of file
+    return search_faiss_batch(index, texts, metadata, query_vector, top_k,
+                              id_bitmap=id_bitmap, min_score=min_score)[0]
@@ -0,0 +1,185 @@
+"""
+Download delle pagine web da indicizzare (elenco in <BASE_DIR>/urls.txt, gestito dal pannello admin).
+
+    - una requests.Session condivisa con pool di connessioni (keep-alive) e retry dei 5xx
+    - fino a max_workers download in parallelo, con timeout di connessione e lettura
+    - GET condizionale: ETag e Last-Modified dell'ultimo download vengono rimandati
+      (If-None-Match / If-Modified-Since); con 304 il corpo si legge dalla cache locale
+
+Cache (<BASE_DIR>/cache/web/):
+    pages.json        {url: {"etag", "last_modified", "sha256"}}
+    <sha256>.html     corpo dell'ultima versione scaricata
+
+Ogni pagina riporta l'hash del corpo: l'ingestione lo confronta con quello del manifest dei
+documenti e non rielabora (né ricalcola gli embedding di) una pagina invariata.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "rag-assistant-ingest/1.0"
+
+def read_urls(path: str) -> List[str]:
+    """URL da indicizzare: una per riga, senza righe vuote, commenti (#) e ripetizioni"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+def make_session(pool_size: int = 8, retries: int = 2) -> requests.Session:
+    """Session con pool di connessioni per host e retry (con backoff) degli errori 5xx/429"""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET",), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+class WebPage:
+    """
+    Esito del download di una pagina: status "fetched" (scaricata), "not_modified" (304, corpo
+    dalla cache) o "error" (html None).
+    """
+
+    __slots__ = ("url", "status", "html", "sha256", "seconds", "error")
+
+    def __init__(self, url: str, status: str, html: Optional[str] = None, sha256: Optional[str] = None,
+                 seconds: float = 0.0, error: Optional[str] = None):
+        self.url = url
+        self.status = status
+        self.html = html
+        self.sha256 = sha256
+        self.seconds = seconds
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"WebPage({self.url!r}, status={self.status!r})"
+
+class PageCache:
+    """Validatori HTTP e corpo dell'ultima versione di ogni pagina"""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(os.path.join(path, "pages.json"), "r", encoding="utf-8") as f:
+                self.entries: Dict[str, Dict[str, Optional[str]]] = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def _body_file(self, digest: str) -> str:
+        return os.path.join(self.path, f"{digest}.html")
+
+    def body(self, url: str) -> Optional[str]:
+        """Corpo in cache della pagina, se presente"""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        try:
+            with open(self._body_file(entry["sha256"]), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def headers(self, url: str) -> Dict[str, str]:
+        """Header per il GET condizionale (solo se il corpo è ancora in cache)"""
+        entry = self.entries.get(url)
+        if entry is None or not os.path.exists(self._body_file(entry["sha256"])):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, html: str, digest: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        if not os.path.exists(self._body_file(digest)):
+            tmp = f"{self._body_file(digest)}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp, self._body_file(digest))
+        self.entries[url] = {"etag": etag, "last_modified": last_modified, "sha256": digest}
+
+    def save(self) -> None:
+        """Scrive l'indice della cache ed elimina i corpi non più referenziati"""
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, f"pages.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, "pages.json"))
+        used = {f"{entry['sha256']}.html" for entry in self.entries.values()}
+        for name in os.listdir(self.path):
+            if name.endswith(".html") and name not in used:
+                os.remove(os.path.join(self.path, name))
+
+def _fetch(session: requests.Session, url: str, headers: Dict[str, str],
+           timeout: Union[float, Tuple[float, float]]):
+    """Download di una pagina (eseguito nei thread): (risposta, secondi, errore)"""
+    start = time.perf_counter()
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response, time.perf_counter() - start, None
+    except requests.RequestException as e:
+        return None, time.perf_counter() - start, str(e)
+
+def fetch_pages(urls: Sequence[str], cache_dir: Optional[str] = None, max_workers: int = 8,
+                timeout: Union[float, Tuple[float, float]] = (5, 20),
+                session: Optional[requests.Session] = None) -> List[WebPage]:
+    """
+    Scarica le pagine indicate, nello stesso ordine, con fino a max_workers richieste in parallelo.
+    Con cache_dir le pagine invariate rispondono 304 e il corpo viene letto dalla cache.
+    """
+    cache = PageCache(cache_dir) if cache_dir else None
+    owned = session is None
+    session = session or make_session(pool_size=max(1, max_workers))
+    requests_headers = [cache.headers(url) if cache is not None else {} for url in urls]
+    try:
+        workers = max(1, min(max_workers, len(urls)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="web-fetch") as pool:
+            results = list(pool.map(lambda args: _fetch(session, *args, timeout),
+                                    zip(urls, requests_headers)))
+    finally:
+        if owned:
+            session.close()
+
+    pages = []
+    for url, (response, seconds, error) in zip(urls, results):
+        if response is None:
+            logger.warning(f"Errore durante il download di {url}: {error}")
+            pages.append(WebPage(url, "error", seconds=seconds, error=error))
+        elif response.status_code == 304:
+            html = cache.body(url) if cache is not None else None
+            if html is None:
+                pages.append(WebPage(url, "error", seconds=seconds, error="304 senza una copia in cache"))
+            else:
+                pages.append(WebPage(url, "not_modified", html, cache.entries[url]["sha256"], seconds))
+        else:
+            digest = hashlib.sha256(response.content).hexdigest()
+            if "charset" not in response.headers.get("Content-Type", "").lower():
+                # Senza charset requests assume ISO-8859-1: meglio la codifica rilevata dal contenuto
+                response.encoding = response.apparent_encoding
+            html = response.text
+            if cache is not None:
+                cache.put(url, html, digest, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            pages.append(WebPage(url, "fetched", html, digest, seconds))
+    if cache is not None:
+        # Le pagine non più in elenco escono dalla cache; quelle in errore mantengono l'ultima versione
+        listed = set(urls)
+        cache.entries = {url: entry for url, entry in cache.entries.items() if url in listed}
+        cache.save()
+    return pages
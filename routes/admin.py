@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, jsonify, session
 import json
 import os
-import subprocess
 from werkzeug.utils import secure_filename
 from config import config
+from rag.jobs import FINISHED, SUCCEEDED, JobBusy, JobRunner
+from rag.singleton import faiss_singleton
 
 admin_bp = Blueprint("admin", __name__, template_folder="../templates")
 
@@ -17,6 +18,9 @@ URLS_FILE = os.path.join(BASE_DIR, "urls.txt")
 CHUNKS_FILE = os.path.join(BASE_DIR, "documents", "chunks.jsonl")
 CORRECTIONS_FILE = os.path.join(BASE_DIR, "corrections.jsonl")
 
+# Reindicizzazione e metadati in background, un lavoro alla volta
+job_runner = JobRunner()
+
 # Crea le directory necessarie
 for directory in [os.path.dirname(LOG_FILE), UPLOAD_FOLDER, os.path.dirname(URLS_FILE)]:
     os.makedirs(directory, exist_ok=True)
@@ -76,6 +80,67 @@ def get_chunks():
             print(f"Errore nella lettura del file chunks: {str(e)}")
     return chunks
 
+def _index_summary(changes):
+    """Esito dell'ingestione per lo stato del lavoro: numero di chunk invece degli elenchi di id"""
+    return {key: len(value) if isinstance(value, list) else value for key, value in (changes or {}).items()}
+
+def reindex_job(full=False, metadata=True):
+    """Lavoro di reindicizzazione (ed eventualmente dei metadati) eseguito nel processo del server"""
+    def run(job):
+        # Import locale: ingest e generate_metadata vengono caricati una sola volta, al primo lavoro
+        import ingest
+        result = {}
+        # Prima i metadati: l'indicizzazione applica ai chunk i tag e le descrizioni appena generati
+        if metadata:
+            result["metadata"] = metadata_job(job)
+        changes = ingest.ingest_all(job.progress) if full else ingest.ingest_incremental(job.progress)
+        # Attiva subito la nuova generazione in questo processo (gli altri la rilevano da soli)
+        faiss_singleton.reload_if_changed(force=True)
+        result["index"] = _index_summary(changes)
+        return result
+    return run
+
+def metadata_job(job):
+    """Lavoro di generazione dei metadati dei documenti"""
+    import generate_metadata
+    return generate_metadata.scan_and_generate_metadata(job.progress)
+
+def update_index_incrementally(add=(), remove=()):
+    """
+    Avvia in background l'aggiornamento dell'indice per i soli documenti indicati e lo registra
+    nella sessione: finché il lavoro non termina con successo serve una reindicizzazione.
+    Restituisce il lavoro, None se un altro lavoro è in corso.
+    """
+    def run(job):
+        import ingest
+        changes = ingest.update_index(list(add), list(remove), progress=job.progress)
+        faiss_singleton.reload_if_changed(force=True)
+        return {"index": _index_summary(changes)}
+    try:
+        job = job_runner.start("update", run)
+    except JobBusy as e:
+        print(f"Aggiornamento incrementale dell'indice non avviato: {str(e)}")
+        session['needs_reindex'] = True
+        return None
+    session['index_update_jobs'] = session.get('index_update_jobs', []) + [job.id]
+    return job
+
+def needs_reindex():
+    """
+    Flag di reindicizzazione della sessione, ricavato anche dall'esito degli aggiornamenti
+    incrementali avviati: quelli riusciti non lo richiedono più, quelli non riusciti (o non più
+    nello storico dei lavori) lo rendono permanente fino alla prossima reindicizzazione.
+    """
+    pending = []
+    for job_id in session.get('index_update_jobs', []):
+        job = job_runner.get(job_id)
+        if job is None or (job.status in FINISHED and job.status != SUCCEEDED):
+            session['needs_reindex'] = True
+        elif job.status != SUCCEEDED:
+            pending.append(job_id)
+    session['index_update_jobs'] = pending
+    return session.get('needs_reindex', False) or bool(pending)
+
 def load_corrections():
     corrections = {}
     if os.path.exists(CORRECTIONS_FILE):
@@ -137,7 +202,7 @@ def admin_dashboard():
                          logs=log_entries,
                          documents=get_documents(),
                          links=get_links(),
-                         needs_reindex=session.get('needs_reindex', False),
+                         needs_reindex=needs_reindex(),
                          min_overlap=min_overlap,
                          chunks=get_chunks())
 
@@ -157,9 +222,10 @@ def delete_document():
         if not os.path.exists(file_path) or not os.path.isfile(file_path):
             return jsonify({'error': 'File not found'}), 404
 
-        # Elimina il file
+        # Elimina il file e rimuove i suoi chunk dall'indice
         os.remove(file_path)
-        return jsonify({'message': 'Document deleted successfully'})
+        job = update_index_incrementally(remove=[filename])
+        return jsonify({'message': 'Document deleted successfully', 'job': job.to_dict() if job else None})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -210,7 +276,8 @@ def admin_upload():
             path = os.path.join(UPLOAD_FOLDER, filename)
             uploaded_file.save(path)
             flash(f"File '{filename}' caricato con successo.", "success")
-            session['needs_reindex'] = True
+            # Solo i chunk del nuovo file vengono calcolati e aggiunti all'indice
+            update_index_incrementally(add=[filename])
 
     link = request.form.get("link")
     if link:
@@ -226,19 +293,73 @@ def admin_reindex():
     if not check_auth():
         return jsonify({'error': 'Unauthorized'}), 401
 
+    data = request.get_json(silent=True) or {}
     try:
-        # Esegui la reindicizzazione
-        subprocess.run(["python", "ingest.py"], check=True)
-        
-        # Genera i metadati aggiornati
-        subprocess.run(["python", "generate_metadata.py"], check=True)
-        
-        # Resetta il flag di reindicizzazione
-        session['needs_reindex'] = False
-        
-        return jsonify({'message': 'Reindicizzazione e generazione metadati completate con successo'})
-    except subprocess.CalledProcessError as e:
-        return jsonify({'error': f'Errore durante la reindicizzazione: {str(e)}'}), 500
+        # Reindicizzazione e generazione dei metadati in background: lo stato si legge da /admin/jobs/<id>
+        job = job_runner.start("reindex", reindex_job(full=bool(data.get('full'))))
+    except JobBusy as e:
+        return jsonify({'error': 'Un altro lavoro è già in corso', 'job': e.job.to_dict()}), 409
+
+    # Resetta il flag di reindicizzazione (la reindicizzazione comprende gli aggiornamenti in sospeso)
+    session['needs_reindex'] = False
+    session['index_update_jobs'] = []
+
+    return jsonify({'message': 'Reindicizzazione avviata', 'job': job.to_dict()}), 202
+
+@admin_bp.route("/admin/generate-metadata", methods=["POST"])
+def admin_generate_metadata():
+    if not check_auth():
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        job = job_runner.start("metadata", metadata_job)
+    except JobBusy as e:
+        return jsonify({'error': 'Un altro lavoro è già in corso', 'job': e.job.to_dict()}), 409
+    return jsonify({'message': 'Generazione dei metadati avviata', 'job': job.to_dict()}), 202
+
+@admin_bp.route("/admin/jobs")
+def admin_jobs():
+    if not check_auth():
+        return jsonify({'error': 'Unauthorized'}), 401
+    current = job_runner.current()
+    return jsonify({
+        'current': current.to_dict() if current is not None else None,
+        'jobs': [job.to_dict() for job in job_runner.jobs()],
+    })
+
+@admin_bp.route("/admin/jobs/<job_id>")
+def admin_job_status(job_id):
+    if not check_auth():
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@admin_bp.route("/admin/jobs/<job_id>/cancel", methods=["POST"])
+def admin_job_cancel(job_id):
+    if not check_auth():
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status in FINISHED:
+        return jsonify({'error': 'Il lavoro è già terminato', 'job': job.to_dict()}), 409
+    job_runner.cancel(job_id)
+    return jsonify({'message': 'Annullamento richiesto', 'job': job.to_dict()}), 202
+
+@admin_bp.route("/admin/cache-stats")
+def cache_stats():
+    if not check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    # Import locale: routes.core importa già questo modulo
+    from routes.core import answer_cache, query_cache
+    return jsonify({"query_embeddings": query_cache.stats(), "answers": answer_cache.stats()})
+
+@admin_bp.route("/admin/index-stats")
+def index_stats():
+    if not check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(faiss_singleton.stats())
 
 @admin_bp.route('/admin/get-min-overlap')
 def get_min_overlap():
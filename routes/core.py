@@ -7,28 +7,49 @@ import logging
 import json
 import re
 from datetime import datetime
-from rag.vectorstore import load_faiss_index, search_faiss
+from rag.singleton import faiss_singleton
+from rag.filters import validate_filters
+from rag.query_cache import QueryEmbeddingCache
+from rag.answer_cache import SemanticAnswerCache
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
-from routes.admin import load_corrections
+from rag.corrections import CorrectionsIndex
+from routes.admin import CORRECTIONS_FILE
 
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MODEL = os.getenv("MODEL", "gpt-4o")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
 
 # Configurazione percorsi
 IS_PRODUCTION = os.getenv("FLASK_ENV") != "development"
 BASE_DIR = "/data" if IS_PRODUCTION else "data"
 LOG_PATH = os.path.join(BASE_DIR, "logs", "queries.jsonl")
+QUERY_CACHE_PATH = os.path.join(BASE_DIR, "cache", "query_embeddings.sqlite")
+
+# Cache degli embedding delle domande: LRU nel processo + SQLite condiviso tra worker
+query_cache = QueryEmbeddingCache(
+    QUERY_CACHE_PATH if os.getenv("QUERY_CACHE_PERSIST", "true").lower() == "true" else None,
+    EMBEDDING_MODEL,
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", 1024))
+)
+# Correzioni dell'amministratore in memoria, ricaricate solo quando il file cambia
+corrections_index = CorrectionsIndex(
+    CORRECTIONS_FILE,
+    embed=lambda texts: query_cache.get_or_compute_many(texts, _embed_texts),
+    threshold=float(os.getenv("CORRECTIONS_THRESHOLD", 0.92))
+)
+# Cache semantica delle risposte: domande parafrasate ricevono la risposta già accettata
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", 2000))
+)
 
 logger = logging.getLogger(__name__)
 
 core_bp = Blueprint("core", __name__, template_folder="../templates")
 
-# Carica l'indice FAISS dalla directory dell'applicazione
-faiss_index, texts, metadata = load_faiss_index("rag/index.faiss")
-
 def calculate_overlap(response: str, chunks: List[Dict[str, Any]]) -> float:
     def clean(text: str) -> set:
         return set(re.sub(r"[^\w]", " ", text.lower()).split())
@@ -64,33 +85,107 @@ def ask():
     lang = data.get("lang", "it")
     if not user_query:
         return Response("Messaggio vuoto", status=400, mimetype="text/plain")
+    # Filtro opzionale sui metadati, es. {"source": "keyboxes/"} o {"tags": ["parcheggio"]}
+    try:
+        filters = validate_filters(data.get("filters"))
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
 
-    corrections = load_corrections()
-    if user_query in corrections:
-        return Response(corrections[user_query], mimetype="text/plain")
+    # Correzione per testo normalizzato: nessuna chiamata API
+    correction = corrections_index.lookup(user_query)
+    if correction is not None:
+        return Response(correction, mimetype="text/plain")
 
     history = session.get("history", [])
     recent_turns = "\n".join([f"Utente: {q}\nAssistente: {a}" for q, a in history[-2:]])
     full_query = f"Conversazione fino a ora:\n{recent_turns}\nUtente: {user_query}" if recent_turns else user_query
 
-    query_embedding = client.embeddings.create(
-        input=[full_query],
-        model="text-embedding-ada-002"
-    ).data[0].embedding
-    query_vector = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
-
-    results = search_faiss(faiss_index, texts, metadata, query_vector, top_k=int(os.getenv("TOP_K", 5)))
-    valid_chunks = [r for r in results if len(r["text"].strip()) >= 30]
-
-    if not valid_chunks:
-        logger.warning(f"[FUORI AMBITO] Domanda: {user_query}")
-        _log_interaction(user_query, 0.0, True, answer=None)
-        return Response(
-            "Non sono in grado di rispondere a questa domanda in base alle informazioni disponibili.\n\n"
-            "Non trovi quello che stai cercando? Contattaci qui: [link placeholder]",
-            mimetype="text/plain"
+    query_vector = query_cache.get_or_compute(full_query, _embed_query).reshape(1, -1)
+    if not history:
+        # Correzione per similarità (parafrasi): senza conversazione l'embedding è quello della sola domanda
+        correction = corrections_index.lookup(user_query, query_vector)
+        if correction is not None:
+            return Response(correction, mimetype="text/plain")
+
+    # L'indice è caricato una sola volta da create_app e condiviso tramite il singleton.
+    # La generazione resta acquisita fino alla chiusura della risposta: uno stream in corso
+    # termina sulla generazione con cui ha recuperato i chunk anche se l'indice viene sostituito.
+    index_generation = faiss_singleton.acquire()
+    streaming = False
+    try:
+        # Solo domande senza conversazione né filtri: la risposta dipende dalla sola domanda
+        cacheable = (
+            os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+            and index_generation is not None and not history and not filters
         )
-
+        if cacheable:
+            cached = answer_cache.lookup(user_query, query_vector, lang, index_generation.generation)
+            if cached is not None:
+                logger.info(f"[CACHE] Domanda: {user_query} (simile a: {cached['question']}, {cached['similarity']:.3f})")
+                _log_interaction(user_query, cached["overlap"], False, answer=cached["answer"])
+                history.append((user_query, cached["answer"]))
+                session["history"] = history[-6:]
+                return Response(f"{cached['answer']}\n\n[overlap:{cached['overlap']}]", mimetype="text/plain")
+
+        top_k = int(os.getenv("TOP_K", 5))
+        # Con MMR si recupera un insieme di candidati più ampio, poi ridotto a top_k chunk diversi
+        use_mmr = os.getenv("MMR_ENABLED", "false").lower() == "true"
+        pool_k = top_k * max(int(os.getenv("MMR_POOL_FACTOR", 3)), 1) if use_mmr else top_k
+        # Soglia di similarità coseno: i chunk sotto soglia non entrano nel contesto
+        min_score = float(os.getenv("MIN_SCORE", 0.75))
+        if index_generation is None:
+            results = []
+        elif os.getenv("HYBRID_SEARCH", "true").lower() == "true":
+            # BM25 sulla sola domanda (token esatti come "Hb 3"), FAISS sulla domanda con la conversazione
+            results = index_generation.search_hybrid(
+                query_vector, user_query, top_k=pool_k, filters=filters,
+                pool_factor=int(os.getenv("HYBRID_POOL_FACTOR", 4)),
+                rrf_k=int(os.getenv("HYBRID_RRF_K", 60)),
+                min_score=min_score
+            )
+        else:
+            results = index_generation.search(query_vector, top_k=pool_k, filters=filters, min_score=min_score)
+        if use_mmr and results:
+            results = index_generation.diversify(
+                query_vector, results, top_k=top_k,
+                lambda_mult=float(os.getenv("MMR_LAMBDA", 0.7)),
+                per_source_cap=int(os.getenv("MMR_SOURCE_CAP", 2))
+            )
+        valid_chunks = [r for r in results if r.text.strip()]
+
+        if not valid_chunks:
+            logger.warning(f"[FUORI AMBITO] Domanda: {user_query}")
+            _log_interaction(user_query, 0.0, True, answer=None)
+            return Response(
+                "Non sono in grado di rispondere a questa domanda in base alle informazioni disponibili.\n\n"
+                "Non trovi quello che stai cercando? Contattaci qui: [link placeholder]",
+                mimetype="text/plain"
+            )
+
+        cache_key = (query_vector, index_generation.generation) if cacheable else None
+        response = _stream_answer(user_query, lang, history, valid_chunks, cache_key)
+        response.call_on_close(lambda: faiss_singleton.release(index_generation))
+        streaming = True
+        return response
+    finally:
+        if not streaming:
+            faiss_singleton.release(index_generation)
+
+def _embed_query(text: str) -> np.ndarray:
+    """Embedding della domanda (solo in caso di miss della cache)"""
+    return _embed_texts([text])[0]
+
+def _embed_texts(texts: List[str]) -> np.ndarray:
+    """Embedding di più testi con una sola richiesta all'API"""
+    data = client.embeddings.create(input=texts, model=EMBEDDING_MODEL).data
+    return np.array([record.embedding for record in sorted(data, key=lambda record: record.index)], dtype=np.float32)
+
+def _stream_answer(user_query: str, lang: str, history: List, valid_chunks: List[Dict[str, Any]],
+                   cache_key: Optional[tuple] = None) -> Response:
+    """
+    Costruisce il prompt con i chunk recuperati e restituisce la risposta del modello in streaming.
+    Con cache_key (embedding della domanda, generazione) la risposta accettata entra nella cache semantica.
+    """
     context = "\n---\n".join([r["text"] for r in valid_chunks])
     lang_prompts = {
         'it': "Rispondi sempre in italiano.",
@@ -156,6 +251,8 @@ def ask():
             return
 
         _log_interaction(user_query, overlap_score, False, answer=accumulated)
+        if cache_key is not None:
+            answer_cache.add(user_query, cache_key[0], accumulated, lang, cache_key[1], overlap=overlap_score)
         yield f"\n\n[overlap:{overlap_score}]".encode('utf-8')
 
         if "non sono in grado di rispondere" in accumulated.lower():
@@ -0,0 +1,53 @@
+import numpy as np
+from rag.answer_cache import SemanticAnswerCache
+
+def _vector(seed, dim=16):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+class TestSemanticAnswerCache:
+    """Test per la cache semantica delle risposte"""
+
+    def test_paraphrase_hit_and_threshold(self):
+        cache = SemanticAnswerCache(threshold=0.95)
+        question = _vector(0)
+        cache.add("qual è la password del wifi?", question, "nomastay2024", "it", "gen-000001", overlap=80.0)
+
+        paraphrase = question + 0.01 * _vector(1)
+        hit = cache.lookup("password wifi?", paraphrase, "it", "gen-000001")
+        assert hit["answer"] == "nomastay2024" and hit["similarity"] >= 0.95
+        assert cache.lookup("parcheggio?", _vector(2), "it", "gen-000001") is None
+        assert cache.lookup("wifi password?", paraphrase, "en", "gen-000001") is None
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    def test_new_generation_invalidates(self):
+        cache = SemanticAnswerCache()
+        question = _vector(0)
+        cache.add("parcheggio?", question, "davanti alla houseboat", "it", "gen-000001")
+        assert cache.lookup("parcheggio?", question, "it", "gen-000002") is None
+        assert cache.stats()["entries"] == 0
+
+        # Una risposta prodotta con la generazione precedente non rientra in cache
+        cache.add("wifi?", _vector(3), "x", "it", "gen-000002")
+        cache.add("parcheggio?", question, "vecchia", "it", "gen-000001")
+        assert cache.lookup("parcheggio?", question, "it", "gen-000002") is None
+
+    def test_eviction(self):
+        cache = SemanticAnswerCache(max_entries=2)
+        for seed in range(3):
+            cache.add(f"domanda {seed}", _vector(seed), f"risposta {seed}", "it", None)
+        assert cache.stats()["entries"] == 2
+        assert cache.lookup("domanda 0", _vector(0), "it", None) is None
+        assert cache.lookup("domanda 2", _vector(2), "it", None)["answer"] == "risposta 2"
+
+    def test_identifiers_must_match(self):
+        """Domande che differiscono solo per un codice non condividono la risposta"""
+        cache = SemanticAnswerCache(threshold=0.95)
+        question = _vector(0)
+        cache.add("Qual è il codice della keybox Hb 3?", question, "1234", "it", None)
+        cache.add("Qual è il codice della keybox Hb 4?", question + 0.001 * _vector(1), "5678", "it", None)
+
+        nearby = question + 0.01 * _vector(2)
+        assert cache.lookup("codice keybox hb3", nearby, "it", None)["answer"] == "1234"
+        assert cache.lookup("codice keybox HB-4", nearby, "it", None)["answer"] == "5678"
+        assert cache.lookup("codice keybox Hb 5", nearby, "it", None) is None
+        assert cache.lookup("codice keybox", nearby, "it", None) is None
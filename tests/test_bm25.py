@@ -0,0 +1,80 @@
+import numpy as np
+from rag.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from rag.filters import MetadataFilterIndex
+from rag.singleton import IndexGeneration
+from rag.vectorstore import save_faiss_index, load_faiss_index
+
+TEXTS = [
+    "Il codice della keybox per Hb 3 è 4521.",
+    "Il parcheggio si trova davanti alla houseboat.",
+    "La raccolta differenziata si fa il martedì.",
+    "Codice wifi: nomastay2024. Hb 1 ha il codice 1180.",
+]
+METADATA = [
+    {"source": "keyboxes/keybox_codici.md", "description": "", "tags": ["codici"]},
+    {"source": "docs/guida/parcheggio.md", "description": "", "tags": ["parcheggio"]},
+    {"source": "docs/regole/house_rules.md", "description": "", "tags": ["regole"]},
+    {"source": "docs/guida/wifi.md", "description": "", "tags": ["wifi"]},
+]
+
+class TestBM25:
+    """Test per l'indice lessicale BM25"""
+
+    def test_tokenize(self):
+        assert tokenize("Codice Hb 3?") == ["codice", "hb", "3"]
+
+    def test_exact_tokens_rank_first(self):
+        bm25 = BM25Index.build(TEXTS)
+        ids, scores = bm25.search("codice Hb 3", top_k=3)
+        assert ids[0] == 0
+        assert list(scores) == sorted(scores, reverse=True)
+        assert 2 not in ids  # nessun termine in comune
+
+    def test_stopwords_do_not_match(self):
+        bm25 = BM25Index.build(TEXTS)
+        ids, _ = bm25.search("Chi è il presidente della Francia?", top_k=3)
+        assert len(ids) == 0
+
+    def test_filter_and_roundtrip(self, tmp_path):
+        path = str(tmp_path / "index.faiss")
+        BM25Index.build(TEXTS).save(path)
+        bm25 = BM25Index.load(path)
+        id_bitmap = MetadataFilterIndex(METADATA).bitmap({"tags": ["wifi"]})
+        ids, _ = bm25.search("codice Hb", top_k=3, id_bitmap=id_bitmap)
+        assert ids.tolist() == [3]
+        assert BM25Index.load(str(tmp_path / "mancante.faiss")) is None
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+        assert [chunk_id for chunk_id, _ in fused] == [1, 3, 2]
+
+class TestHybridSearch:
+    """Test per la ricerca ibrida FAISS + BM25"""
+
+    def _generation(self, tmp_path, vectors):
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, TEXTS, METADATA, path)
+        index, texts, metadata = load_faiss_index(path)
+        return IndexGeneration(index, texts, metadata, path, bm25=BM25Index.load(path))
+
+    def test_lexical_hit_is_fused(self, tmp_path):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((len(TEXTS), 8)).astype(np.float32)
+        generation = self._generation(tmp_path, vectors)
+
+        # Il vettore della query è vicino al chunk 2, ma il testo cita esattamente "Hb 3"
+        results = generation.search_hybrid(vectors[2:3], "codice Hb 3", top_k=2, pool_factor=1)
+        ids = [r["id"] for r in results]
+        assert 0 in ids and 2 in ids
+        assert all("rrf" in r for r in results)
+
+    def test_off_topic_query_returns_nothing(self, tmp_path):
+        """Senza risultati vettoriali sopra soglia la domanda è fuori ambito, anche se BM25 trova termini comuni"""
+        vectors = np.eye(len(TEXTS), 8, dtype=np.float32)
+        generation = self._generation(tmp_path, vectors)
+        off_topic = np.zeros((1, 8), dtype=np.float32)
+        off_topic[0, 7] = 1.0
+
+        assert generation.search_hybrid(off_topic, "Qual è il codice della cassaforte?", top_k=3, min_score=0.75) == []
+        results = generation.search_hybrid(vectors[0:1], "codice Hb 3", top_k=3, min_score=0.75)
+        assert results[0]["id"] == 0 and 3 in [r["id"] for r in results]
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+import tiktoken
+from rag.chunker import chunk_text, chunk_texts
+from rag.chunkstore import ChunkStore, write_chunk_store
+
+# Encoding locale a un token per byte: i caratteri accentati occupano due token,
+# quindi i confini dei token cadono anche a metà dei caratteri multi-byte
+BYTES = tiktoken.Encoding(name="test-bytes", pat_str=r"\S+|\s+",
+                          mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+def _gpt_style_encoding():
+    """
+    Encoding con la pre-tokenizzazione dei modelli GPT (" parola" è un solo pezzo, spazio incluso)
+    e poche fusioni BPE: ogni parola del test diventa due token, es. " alfa" + "beto"
+    """
+    ranks = {bytes([i]): i for i in range(256)}
+    for piece in (b" alfa", b"beto", b" betu", b"lla", b" gamb", b"eretto", b" delf", b"ino"):
+        for end in range(2, len(piece) + 1):
+            ranks.setdefault(piece[:end], len(ranks))
+    pat_str = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+    return tiktoken.Encoding(name="test-gpt-style", pat_str=pat_str, mergeable_ranks=ranks, special_tokens={})
+
+GPT_STYLE = _gpt_style_encoding()
+
+DOC = (
+    "# Check-in\nL'arrivo è dalle 15. Il check-out è entro le 10! La città è a due passi.\n\n"
+    "## Wi-Fi\nLa password è nomastay2024. Chiedere alla reception perché può cambiare.\n\n"
+    "## Parcheggio\nÈ disponibile un parcheggio comunale gratuito davanti alla darsena."
+)
+
+class TestChunker:
+    """Test per il chunker a token con ritaglio per offset di carattere"""
+
+    def test_chunks_are_slices_of_the_original(self):
+        chunks = chunk_text(DOC, size=60, overlap=10, encoding=BYTES)
+        assert len(chunks) > 3
+        for chunk in chunks:
+            assert DOC[chunk.start:chunk.end] == chunk.text
+            assert "�" not in chunk.text  # nessun carattere spezzato
+            assert 0 < chunk.tokens <= 60
+
+    def test_prefers_headings_and_sentences(self):
+        chunks = chunk_text(DOC, size=90, overlap=10, encoding=BYTES)
+        assert any(chunk.text.startswith("## ") for chunk in chunks[1:])
+        assert all(chunk.text.endswith((".", "!")) for chunk in chunks)
+
+    def test_overlap_and_token_counts(self):
+        text = " ".join(f"parola{i}" for i in range(200))
+        chunks = chunk_text(text, size=100, overlap=20, encoding=BYTES)
+        for previous, current in zip(chunks, chunks[1:]):
+            assert current.start < previous.end  # sovrapposizione
+            assert current.text.split()[0] in previous.text.split()  # inizia da una parola intera
+        # Il conteggio è quello del testo memorizzato, senza gli spazi rimossi ai bordi
+        assert all(chunk.tokens == len(BYTES.encode(chunk.text)) for chunk in chunks)
+        assert chunks[-1].text.endswith("parola199")
+
+    def test_gpt_style_encoding_cuts_between_words(self):
+        """Con lo spazio incluso nel token della parola successiva il taglio non cade a metà parola"""
+        words = ["alfabeto", "betulla", "gamberetto", "delfino"]
+        text = " ".join(words * 40)
+        chunks = chunk_text(text, size=50, overlap=8, encoding=GPT_STYLE)
+        assert len(chunks) > 3
+        for chunk in chunks:
+            assert set(chunk.text.split()) <= set(words)
+            assert chunk.tokens == len(GPT_STYLE.encode(chunk.text)) <= 50
+
+    def test_batch_matches_single(self):
+        texts = [DOC, "breve", ""]
+        batched = chunk_texts(texts, size=60, overlap=10, encoding=BYTES)
+        assert [[c.text for c in chunks] for chunks in batched] == \
+               [[c.text for c in chunk_text(t, size=60, overlap=10, encoding=BYTES)] for t in texts]
+        assert batched[2] == []
+
+    def test_invalid_overlap(self):
+        with pytest.raises(ValueError):
+            chunk_text(DOC, size=10, overlap=10, encoding=BYTES)
+
+class TestChunkTokenCounts:
+    """Test per i conteggi di token nell'archivio dei chunk"""
+
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / "index.faiss")
+        write_chunk_store(path, ["a", "b"], [{"source": "x"}, None], token_counts=[12, -1])
+        store = ChunkStore.open(path)
+        assert store.get_tokens(0) == 12 and store.get_tokens(1) is None
+        np.testing.assert_array_equal(store.token_counts, [12, -1])
+
+    def test_absent(self, tmp_path):
+        path = str(tmp_path / "index.faiss")
+        write_chunk_store(path, ["a"], [{"source": "x"}])
+        store = ChunkStore.open(path)
+        assert store.token_counts is None and store.get_tokens(0) is None
@@ -0,0 +1,68 @@
+import json
+import os
+import numpy as np
+from rag.corrections import CorrectionsIndex
+
+def _write(path, items):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+class TestCorrectionsIndex:
+    """Test per l'indice in memoria delle correzioni"""
+
+    def test_normalized_text_and_reload(self, tmp_path):
+        path = str(tmp_path / "corrections.jsonl")
+        _write(path, [{"query": "Dove posso parcheggiare?", "corrected_answer": "Davanti alla houseboat."}])
+        index = CorrectionsIndex(path)
+        assert index.lookup("dove posso   parcheggiare") == "Davanti alla houseboat."
+        assert index.reload_if_changed() is False  # file invariato: nessuna rilettura
+
+        _write(path, [{"query": "Dove posso parcheggiare?", "corrected_answer": "Nel parcheggio comunale."}])
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+        assert index.lookup("Dove posso parcheggiare?") == "Nel parcheggio comunale."
+
+    def test_similarity_match(self, tmp_path):
+        path = str(tmp_path / "corrections.jsonl")
+        _write(path, [{"query": "password wifi?", "corrected_answer": "nomastay2024"}])
+        vectors = {"password wifi?": np.array([1.0, 0.0, 0.0], dtype=np.float32)}
+        calls = []
+
+        def embed(texts):
+            calls.append(list(texts))
+            return np.array([vectors[text] for text in texts])
+
+        index = CorrectionsIndex(path, embed=embed, threshold=0.9)
+        assert index.lookup("qual è il codice del wi-fi", np.array([0.98, 0.1, 0.0])) == "nomastay2024"
+        assert index.lookup("orari check-in", np.array([0.0, 1.0, 0.0])) is None
+        assert calls == [["password wifi?"]]  # embedding calcolato una sola volta
+
+    def test_similarity_requires_same_identifiers(self, tmp_path):
+        """La correzione per "keybox Hb 4" non vale per "Hb 3", anche con embedding quasi uguali"""
+        path = str(tmp_path / "corrections.jsonl")
+        _write(path, [{"query": "Codice keybox Hb 4?", "corrected_answer": "5678"}])
+        index = CorrectionsIndex(path, embed=lambda texts: np.array([[1.0, 0.0, 0.0]] * len(texts)), threshold=0.92)
+        nearby = np.array([0.99, 0.05, 0.0])
+        assert index.lookup("qual è il codice della keybox hb4", nearby) == "5678"
+        assert index.lookup("qual è il codice della keybox Hb 3", nearby) is None
+        assert index.lookup("qual è il codice della keybox", nearby) is None
+
+    def test_single_batched_embedding_call(self, tmp_path):
+        """Tutte le domande corrette sono inviate insieme: una chiamata, non una per correzione"""
+        path = str(tmp_path / "corrections.jsonl")
+        topics = ["wifi", "parcheggio", "colazione", "check-in", "check-out", "rifiuti", "animali", "barca"]
+        _write(path, [{"query": f"Info su {topic}?", "corrected_answer": topic} for topic in topics])
+        calls = []
+
+        def embed(texts):
+            calls.append(len(texts))
+            return np.eye(len(texts), 16)
+
+        index = CorrectionsIndex(path, embed=embed, threshold=0.9)
+        assert index.lookup("dove si lasciano i rifiuti", np.eye(8, 16)[5]) == "rifiuti"
+        assert index.lookup("posso portare il cane", np.eye(8, 16)[6]) == "animali"
+        assert calls == [8]
+
+    def test_missing_file(self, tmp_path):
+        index = CorrectionsIndex(str(tmp_path / "mancante.jsonl"))
+        assert index.lookup("qualsiasi domanda") is None and len(index) == 0
@@ -0,0 +1,33 @@
+from rag.dedup import MinHashDeduplicator, deduplicate_chunks
+
+BASE = (
+    "Il check-in è possibile dalle 15 alle 20. Le chiavi si trovano nella keybox accanto alla porta "
+    "della houseboat. Il parcheggio è gratuito davanti al molo e la raccolta differenziata si fa il martedì."
+)
+
+class TestDedup:
+    """Test per l'eliminazione dei chunk quasi duplicati"""
+
+    def test_near_duplicates_removed(self):
+        chunks = [
+            BASE,
+            BASE.replace("martedì", "martedì."),          # differenza di punteggiatura
+            "Ristoranti consigliati: Da Mario in via Roma, La Lanterna sul porto, Osteria del Borgo.",
+            BASE + " Benvenuti!",                          # stesso testo con una parola in più
+            BASE,                                          # duplicato esatto
+        ]
+        kept, removed = deduplicate_chunks(chunks, threshold=0.8)
+        assert kept == [0, 2]
+        assert removed == [1, 3, 4]
+
+    def test_distinct_chunks_kept(self):
+        chunks = [f"La stanza {i} ha il codice {1000 + i} e si trova al piano {i % 3}." for i in range(20)]
+        kept, _ = deduplicate_chunks(chunks)
+        assert len(kept) == 20
+
+    def test_signature_estimates_jaccard(self):
+        deduplicator = MinHashDeduplicator(num_perm=128, bands=16)
+        a = deduplicator.signature(BASE)
+        b = deduplicator.signature("Testo completamente diverso sulle regole della casa e sugli animali.")
+        assert (a == deduplicator.signature(BASE)).all()
+        assert (a == b).mean() < 0.2
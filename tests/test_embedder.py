@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pytest
+from openai import APIConnectionError, OpenAI
+from rag.embedder import EmbeddingDriver, TokenBucket, openai_embed_fn, token_batches
+
+class StubEmbeddingServer:
+    """Server locale compatibile con POST /v1/embeddings: vettore = [lunghezza del testo, 1]"""
+
+    def __init__(self, fail_first=0, status=429, delay=0.05):
+        self.fail_first = fail_first
+        self.status = status
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append(body["input"])
+                    failing = len(stub.requests) <= stub.fail_first
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.in_flight -= 1
+                if failing:
+                    payload = json.dumps({"error": {"message": "rate limit", "type": "requests"}}).encode()
+                    self.send_response(stub.status)
+                    self.send_header("Retry-After", "0")
+                else:
+                    data = [{"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]}
+                            for i, text in enumerate(body["input"])]
+                    payload = json.dumps({"object": "list", "data": data, "model": body["model"],
+                                          "usage": {"prompt_tokens": 1, "total_tokens": 1}}).encode()
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client(self):
+        return OpenAI(base_url=f"http://127.0.0.1:{self.server.server_port}/v1", api_key="test")
+
+def _count(text):
+    return len(text.split())
+
+class TestTokenBatches:
+    """Test per la suddivisione in batch per numero di token"""
+
+    def test_limits(self):
+        assert token_batches([3, 3, 3, 9, 1], max_tokens=6, max_items=10) == [[0, 1], [2], [3], [4]]
+        assert token_batches([1] * 5, max_tokens=100, max_items=2) == [[0, 1], [2, 3], [4]]
+
+class TestTokenBucket:
+    """Test per il limite di frequenza"""
+
+    def test_waits_for_refill(self):
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(60, clock=lambda: now[0], sleep=sleep)  # 1 unità al secondo
+        assert bucket.acquire(60) == 0
+        assert bucket.acquire(2) == pytest.approx(2.0)
+        assert bucket.acquire(1000) == pytest.approx(60.0)  # richiesta oltre il picco: bucket pieno
+
+class TestEmbeddingDriver:
+    """Test per il driver concorrente degli embedding (server locale compatibile OpenAI)"""
+
+    def test_concurrent_batches_keep_order(self):
+        texts = [f"chunk {'x ' * i}" for i in range(40)]
+        with StubEmbeddingServer(delay=0.1) as server:
+            driver = EmbeddingDriver(openai_embed_fn(server.client(), "stub"), _count,
+                                     concurrency=4, max_batch_tokens=50, max_batch_items=5)
+            vectors = driver.embed(texts)
+        np.testing.assert_array_equal(vectors[:, 0], [len(t) for t in texts])
+        assert len(server.requests) == driver.stats["requests"] > 4
+        assert all(sum(_count(t) for t in batch) <= 50 or len(batch) == 1 for batch in server.requests)
+        assert server.max_in_flight > 1
+
+    def test_retries_rate_limit(self):
+        with StubEmbeddingServer(fail_first=2, status=429, delay=0) as server:
+            driver = EmbeddingDriver(openai_embed_fn(server.client(), "stub"), _count, backoff_base=0.01)
+            vectors = driver.embed(["alfa", "beta"])
+        assert vectors.shape == (2, 2)
+        assert driver.stats["retries"] == 2 and len(server.requests) == 3
+
+    def test_client_errors_are_not_retried(self):
+        with StubEmbeddingServer(fail_first=5, status=400, delay=0) as server:
+            driver = EmbeddingDriver(openai_embed_fn(server.client(), "stub"), _count, backoff_base=0.01)
+            with pytest.raises(Exception):
+                driver.embed(["alfa"])
+        assert len(server.requests) == 1
+
+    def test_gives_up_after_max_retries(self):
+        calls = []
+
+        def failing(texts):
+            calls.append(texts)
+            raise ConnectionError("rete non disponibile")
+
+        driver = EmbeddingDriver(failing, _count, max_retries=2, sleep=lambda s: None)
+        with pytest.raises(ConnectionError):
+            driver.embed_batch(["alfa"])
+        assert len(calls) == 3
+
+    def test_programming_errors_are_not_retried(self):
+        """Un bug nel codice (TypeError, KeyError) emerge subito, senza attese di backoff"""
+        calls = []
+
+        def broken(texts):
+            calls.append(texts)
+            return {}["embedding"]
+
+        driver = EmbeddingDriver(broken, _count, max_retries=5, sleep=lambda s: pytest.fail("backoff"))
+        with pytest.raises(KeyError):
+            driver.embed_batch(["alfa"])
+        assert len(calls) == 1
+
+    def test_connection_errors_are_retried(self):
+        """Server non raggiungibile: errore di connessione del client, ripetuto fino al limite"""
+        client = OpenAI(base_url="http://127.0.0.1:9/v1", api_key="test")
+        driver = EmbeddingDriver(openai_embed_fn(client, "stub"), _count, max_retries=1, sleep=lambda s: None)
+        with pytest.raises(APIConnectionError):
+            driver.embed_batch(["alfa"])
+        assert driver.stats["retries"] == 1
+
+    def test_token_rate_limit(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        driver = EmbeddingDriver(lambda texts: np.ones((len(texts), 2)), _count, concurrency=1,
+                                 max_batch_items=1, tokens_per_minute=60, sleep=sleep, clock=lambda: now[0])
+        driver.embed(["uno due tre"] * 30)
+        # 90 token con 60 al minuto: i primi 60 subito, gli altri 30 a 1 token al secondo
+        assert driver.stats["tokens"] == 90
+        assert driver.stats["throttled_seconds"] == pytest.approx(30.0)
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from rag.embedding_cache import ChunkEmbeddingStore, chunk_hash
+
+def _fake_embed(calls):
+    def embed(batch):
+        calls.append(list(batch))
+        return np.array([[len(t), t.count("a"), 1.0] for t in batch], dtype=np.float32)
+    return embed
+
+class TestChunkEmbeddingStore:
+    """Test per l'archivio su disco degli embedding dei chunk"""
+
+    def test_only_missing_chunks_are_embedded(self, tmp_path):
+        calls = []
+        store = ChunkEmbeddingStore(str(tmp_path), "text-embedding-3-small")
+        first = store.embed(["alfa", "beta", "alfa"], _fake_embed(calls), batch_size=10)
+        assert calls == [["alfa", "beta"]]  # chunk ripetuti calcolati una volta
+        np.testing.assert_array_equal(first[0], first[2])
+
+        reopened = ChunkEmbeddingStore(str(tmp_path), "text-embedding-3-small")
+        vectors = reopened.embed(["beta", "gamma"], _fake_embed(calls), batch_size=10)
+        assert calls[-1] == ["gamma"]
+        np.testing.assert_array_equal(vectors[0], first[1])
+        assert reopened.stats()["hits"] == 1 and len(reopened) == 3
+
+    def test_models_are_separate(self, tmp_path):
+        calls = []
+        ChunkEmbeddingStore(str(tmp_path), "model-a").embed(["alfa"], _fake_embed(calls))
+        ChunkEmbeddingStore(str(tmp_path), "model-b").embed(["alfa"], _fake_embed(calls))
+        assert len(calls) == 2
+
+    def test_resume_after_interrupted_run(self, tmp_path):
+        calls = []
+        store = ChunkEmbeddingStore(str(tmp_path), "m")
+
+        def failing(batch):
+            if len(calls) == 2:
+                raise RuntimeError("rete non disponibile")
+            return _fake_embed(calls)(batch)
+
+        with pytest.raises(RuntimeError):
+            store.embed([f"chunk {i}" for i in range(6)], failing, batch_size=2)
+        # Scrittura interrotta a metà: riga di vettore parziale e chiave senza a capo
+        with open(os.path.join(store.path, "vectors.bin"), "ab") as f:
+            f.write(b"\x00" * 5)
+        with open(os.path.join(store.path, "keys.txt"), "a", encoding="utf-8") as f:
+            f.write(chunk_hash("chunk 4")[:10])
+
+        resumed = ChunkEmbeddingStore(str(tmp_path), "m")
+        assert len(resumed) == 4
+        calls.clear()
+        vectors = resumed.embed([f"chunk {i}" for i in range(6)], _fake_embed(calls), batch_size=2)
+        assert calls == [["chunk 4", "chunk 5"]]
+        assert vectors.shape == (6, 3)
+
+    def test_float16_rows(self, tmp_path):
+        store = ChunkEmbeddingStore(str(tmp_path), "m", dtype="float16")
+        vectors = store.embed(["alfa"], _fake_embed([]))
+        assert vectors.dtype == np.float32
+        assert os.path.getsize(os.path.join(store.path, "vectors.bin")) == 3 * 2
+        with pytest.raises(ValueError):
+            ChunkEmbeddingStore(str(tmp_path), "m", dtype="int8")
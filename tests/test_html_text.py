@@ -0,0 +1,83 @@
+import importlib.util
+import pytest
+from rag.html_text import extract_main_text, normalize_whitespace
+
+PARSERS = ["html.parser"] + (["lxml"] if importlib.util.find_spec("lxml") else [])
+
+PAGE = """<html><head><title>Eventi</title><style>p { color: red }</style></head><body>
+<div id="cookie-consent">Usiamo i cookie per migliorare la navigazione. <button>Accetta</button></div>
+<header><nav><a href="/">Home</a> <a href="/eventi">Eventi</a> <a href="/contatti">Contatti</a></nav></header>
+<main>
+  <article>
+    <header><h1>Notte Rosa</h1><time>12 luglio</time></header>
+    <p>La   Notte Rosa è la <a href="/festa">festa</a> dell'estate&nbsp;romagnola.</p>
+    <div class="social-share"><a href="#">Facebook</a> <a href="#">X</a></div>
+    <h2>Programma</h2>
+    <ul><li>Concerti in spiaggia</li><li>Fuochi d'artificio</li></ul>
+  </article>
+</main>
+<aside>Articoli correlati: Capodanno, Molo Street Parade</aside>
+<footer>© 2025 Visit Rimini · P.IVA 0000000</footer>
+<script>var tracking = 1;</script>
+</body></html>"""
+
+class TestHtmlText:
+    """Test per l'estrazione del contenuto principale delle pagine web"""
+
+    @pytest.mark.parametrize("parser", PARSERS)
+    def test_main_content_without_boilerplate(self, parser):
+        extracted = extract_main_text(PAGE, parser=parser)
+        assert extracted.text == (
+            "# Notte Rosa\n\n12 luglio\n\nLa Notte Rosa è la festa dell'estate romagnola.\n\n"
+            "## Programma\n\nConcerti in spiaggia\n\nFuochi d'artificio"
+        )
+        for boilerplate in ("cookie", "Contatti", "Facebook", "correlati", "P.IVA", "tracking", "color"):
+            assert boilerplate not in extracted.text
+        assert "Usiamo i cookie" in extracted.full_text and "tracking" not in extracted.full_text
+        assert len(extracted.full_text) > len(extracted.text)
+
+    def test_link_lists_without_landmarks(self):
+        links = "".join(f'<a href="/p{i}">Voce {i}</a>' for i in range(8))
+        html = (f"<body><div>{links}</div><div><p>Il check-in è dalle 15.</p>"
+                f"<p>Prenota su <a href='/b'>questa pagina</a> entro venerdì.</p></div></body>")
+        text = extract_main_text(html, parser="html.parser").text
+        assert text == "Il check-in è dalle 15.\n\nPrenota su questa pagina entro venerdì."
+
+    def test_empty_main_falls_back_to_body(self):
+        html = "<body><main></main><div><p>Contenuto fuori dal main, abbastanza lungo da contare.</p></div></body>"
+        assert extract_main_text(html, parser="html.parser").text == "Contenuto fuori dal main, abbastanza lungo da contare."
+
+    def test_restaurant_menu_is_content(self):
+        html = "<body><div class='menu-del-giorno'><h3>Menù</h3><p>Piadina e squacquerone</p></div></body>"
+        assert "Piadina" in extract_main_text(html, parser="html.parser").text
+
+    @pytest.mark.parametrize("parser", PARSERS)
+    def test_wordpress_layout_classes_are_content(self, parser):
+        """Classi come "no-sidebar" o "has-share-buttons" descrivono il layout, non il boilerplate"""
+        html = """<body class="page-template-default no-sidebar nav-open">
+        <div id="page" class="site no-sidebar">
+          <header id="masthead" class="site-header"><a href="/">Home</a></header>
+          <div id="content" class="site-content has-share-buttons">
+            <h1>Regolamento</h1><p>Il check-out è entro le 10.</p>
+            <div class="share-buttons"><a href="#">Facebook</a></div>
+          </div>
+          <footer class="site-footer">© 2025</footer>
+        </div></body>"""
+        text = extract_main_text(html, parser=parser).text
+        assert text == "# Regolamento\n\nIl check-out è entro le 10."
+
+    @pytest.mark.parametrize("parser", PARSERS)
+    def test_main_ancestors_are_never_pruned(self, parser):
+        """Anche ricadendo sull'intero body, il contenitore del <main> non è trattato come boilerplate"""
+        html = ("<body><div class='nav-wrapper'><main><p>Colazione alle 8.</p></main></div>"
+                "<div><p>Il ristorante è aperto a pranzo e a cena, con prenotazione consigliata nel weekend.</p></div>"
+                "<div class='sidebar'><p>Altro</p></div></body>")
+        assert extract_main_text(html, parser=parser).text == (
+            "Colazione alle 8.\n\nIl ristorante è aperto a pranzo e a cena, con prenotazione consigliata nel weekend.")
+
+    def test_all_boilerplate_falls_back_to_full_text(self):
+        html = "<body><div class='sidebar'><p>Unico testo della pagina.</p></div></body>"
+        assert extract_main_text(html, parser="html.parser").text == "Unico testo della pagina."
+
+    def test_normalize_whitespace(self):
+        assert normalize_whitespace("  a \t b c \n\n\n\n d  \n") == "a b c\n\nd"
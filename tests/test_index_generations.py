@@ -0,0 +1,139 @@
+import os
+import numpy as np
+import pytest
+from rag.generations import (publish_generation, current_generation, resolve_index_path,
+                             verify_generation, generations_root)
+from rag.singleton import FAISSIndexSingleton, faiss_singleton
+from rag.vectorstore import save_faiss_index
+
+def _publish(index_path, label, n=50, dim=16, keep=2):
+    rng = np.random.default_rng(len(label))
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    texts = [f"{label} chunk {i}" for i in range(n)]
+    metadata = [{"source": f"{label}.md", "description": "", "tags": []}] * n
+    publish_generation(index_path, lambda path: save_faiss_index(vectors, texts, metadata, path), keep=keep)
+    return vectors
+
+class TestGenerations:
+    """Test per le generazioni versionate dell'indice"""
+
+    def test_publish_and_resolve(self, tmp_path):
+        index_path = str(tmp_path / "index.faiss")
+        assert resolve_index_path(index_path) == index_path
+
+        _publish(index_path, "prima")
+        assert current_generation(index_path) == "gen-000001"
+        resolved = resolve_index_path(index_path)
+        assert resolved.endswith(os.path.join("gen-000001", "index.faiss"))
+        verify_generation(os.path.dirname(resolved))
+
+    def test_checksum_mismatch(self, tmp_path):
+        index_path = str(tmp_path / "index.faiss")
+        _publish(index_path, "prima")
+        generation_dir = os.path.dirname(resolve_index_path(index_path))
+        with open(os.path.join(generation_dir, "index.faiss.texts.bin"), "r+b") as f:
+            f.write(b"X")
+        with pytest.raises(ValueError):
+            verify_generation(generation_dir)
+        # Al caricamento si controllano solo le dimensioni: il file alterato non viene riletto
+        verify_generation(generation_dir, checksums=False)
+
+    def test_load_rejects_truncated_file(self, tmp_path, monkeypatch):
+        """Il caricamento non calcola i checksum ma rifiuta una generazione con file troncati"""
+        import rag.generations as generations
+        index_path = str(tmp_path / "index.faiss")
+        _publish(index_path, "prima")
+        monkeypatch.setattr(generations, "file_sha256", lambda path: pytest.fail("checksum al caricamento"))
+        registry = _fresh_registry()
+        assert registry.load_index(index_path, reload_interval=0)
+
+        generation_dir = os.path.dirname(resolve_index_path(index_path))
+        with open(os.path.join(generation_dir, "index.faiss.texts.bin"), "r+b") as f:
+            f.truncate(10)
+        with pytest.raises(ValueError):
+            verify_generation(generation_dir, checksums=False)
+        assert not registry.load_index(index_path, reload_interval=0)
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="richiede /proc")
+    def test_files_synced_before_activation(self, tmp_path, monkeypatch):
+        """File e directory della generazione vanno su disco prima che CURRENT punti alla generazione"""
+        import rag.generations as generations
+        events = []
+        fsync, replace = os.fsync, os.replace
+        monkeypatch.setattr(generations.os, "fsync",
+                            lambda fd: (events.append(("fsync", os.readlink(f"/proc/self/fd/{fd}"))), fsync(fd)))
+        monkeypatch.setattr(generations.os, "replace",
+                            lambda src, dst: (events.append(("replace", os.path.basename(dst))), replace(src, dst)))
+        index_path = str(tmp_path / "index.faiss")
+        _publish(index_path, "prima")
+
+        generation_dir = os.path.dirname(resolve_index_path(index_path))
+        activation = events.index(("replace", "CURRENT"))
+        synced = {os.path.basename(path) for kind, path in events[:activation] if kind == "fsync"}
+        assert set(os.listdir(generation_dir)) <= synced
+        assert "gen-000001.tmp" in synced and "generations" in synced
+
+    def test_prune_keeps_latest(self, tmp_path):
+        index_path = str(tmp_path / "index.faiss")
+        for label in ("a", "bb", "ccc"):
+            _publish(index_path, label, keep=2)
+        names = sorted(n for n in os.listdir(generations_root(index_path)) if n.startswith("gen-"))
+        assert names == ["gen-000002", "gen-000003"]
+
+class TestHotSwap:
+    """Test per la sostituzione dell'indice senza riavvio"""
+
+    def test_reader_keeps_old_generation(self, tmp_path):
+        index_path = str(tmp_path / "index.faiss")
+        vectors = _publish(index_path, "prima")
+        assert faiss_singleton.load_index(index_path, reload_interval=0)
+
+        old = faiss_singleton.acquire()
+        assert old.generation == "gen-000001"
+
+        _publish(index_path, "seconda")
+        new = faiss_singleton.acquire()
+        assert new.generation == "gen-000002"
+        assert faiss_singleton.search(vectors[:1], 1)[0]["text"].startswith("seconda")
+
+        # La richiesta in corso continua sulla generazione precedente finché non la rilascia
+        assert old.retired and old.search(vectors[:1], 1)[0]["text"] == "prima chunk 0"
+        faiss_singleton.release(old)
+        assert old.index is None
+
+        faiss_singleton.release(new)
+        assert new.index is not None
+
+def _fresh_registry():
+    """Istanza indipendente dal singleton globale, per i test del caricamento lazy"""
+    registry = object.__new__(FAISSIndexSingleton)
+    registry._initialized = False
+    registry.__init__()
+    return registry
+
+class TestLazyRegistry:
+    """Test per il caricamento al primo utilizzo e il fallback a indice vuoto"""
+
+    def test_loads_on_first_use(self, tmp_path):
+        index_path = str(tmp_path / "index.faiss")
+        vectors = _publish(index_path, "lazy")
+        registry = _fresh_registry()
+        registry.configure(index_path, mmap=True)
+        assert registry.stats()["loaded"] is False
+
+        assert registry.search(vectors[:1], 1)[0]["text"] == "lazy chunk 0"
+        stats = registry.stats()
+        assert stats["loaded"] and stats["chunks"] == 50 and stats["load_seconds"] >= 0
+
+    def test_missing_index(self, tmp_path):
+        index_path = str(tmp_path / "mancante.faiss")
+        production = _fresh_registry()
+        production.configure(index_path, degrade=True)
+        generation = production.acquire()
+        assert generation is not None and generation.search(np.zeros(16, dtype=np.float32)) == []
+        production.release(generation)
+
+        development = _fresh_registry()
+        development.configure(index_path, degrade=False)
+        with pytest.raises(RuntimeError):
+            development.acquire()
@@ -0,0 +1,147 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Eseguito in un processo separato, con la directory di lavoro temporanea: ingest e routes.admin
+# calcolano i percorsi (e creano le cartelle) all'import, a partire da BASE_DIR
+UPLOAD_SCRIPT = textwrap.dedent("""
+    import io, time
+    import numpy as np
+    import tiktoken
+    import ingest
+    import rag.chunker
+    from flask import Flask
+    from rag.chunkstore import ChunkStore
+    from rag.generations import resolve_index_path
+    from routes import admin
+
+    def fake_embed(batch):
+        return np.array([[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in batch], dtype=np.float32)
+
+    ingest.openai_embed_fn = lambda client, model: fake_embed
+    ingest.config.EMBEDDING_CACHE_ENABLED = False
+    rag.chunker._encodings[rag.chunker.ENCODING_NAME] = tiktoken.Encoding(
+        name="bytes", pat_str=r"\\S+|\\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+    assert ingest.DOCUMENTS_DIR == admin.UPLOAD_FOLDER
+    with open(f"{admin.UPLOAD_FOLDER}/base.md", "w", encoding="utf-8") as f:
+        f.write("Documento iniziale del corpus.")
+    ingest.ingest_all()
+
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(admin.admin_bp)
+    client = app.test_client()
+    response = client.post(f"/admin/upload?token={admin.ADMIN_TOKEN}", content_type="multipart/form-data",
+                           data={"document": (io.BytesIO(b"Orari del check-in: dalle 15 alle 20."), "orari.md")})
+    assert response.status_code == 302
+
+    def wait_for_update():
+        job = admin.job_runner.jobs()[0]
+        while job.status not in admin.FINISHED:
+            time.sleep(0.05)
+        return job
+
+    def needs_reindex():
+        client.get(f"/admin?token={admin.ADMIN_TOKEN}")
+        with client.session_transaction() as session:
+            return session.get("needs_reindex", False) or bool(session.get("index_update_jobs"))
+
+    job = wait_for_update()
+    assert job.status == "succeeded", job.error
+    store = ChunkStore.open(resolve_index_path(ingest.INDEX_PATH), mmap_mode=False)
+    sources = {meta["source"] for meta in store.metadata if meta is not None}
+    assert sources == {"base.md", "orari.md"}, sources
+    assert not needs_reindex()
+
+    # Aggiornamento non riuscito: il pannello continua a chiedere la reindicizzazione
+    def failing_update(*args, **kwargs):
+        raise RuntimeError("embedding non disponibili")
+    ingest.update_index = failing_update
+    client.post(f"/admin/upload?token={admin.ADMIN_TOKEN}", content_type="multipart/form-data",
+                data={"document": (io.BytesIO(b"Colazione dalle 8."), "colazione.md")})
+    assert wait_for_update().status == "failed"
+    assert needs_reindex() and needs_reindex()
+    print("ok")
+""")
+
+# Reindicizzazione dal pannello quando cambiano solo i metadati dei documenti
+METADATA_SCRIPT = textwrap.dedent("""
+    import json, types
+    import numpy as np
+    import tiktoken
+    import generate_metadata
+    import ingest
+    import rag.chunker
+    from rag.chunkstore import ChunkStore
+    from rag.generations import current_generation, resolve_index_path
+    from routes import admin
+
+    embedded = []
+    def fake_embed(batch):
+        embedded.extend(batch)
+        return np.array([[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in batch], dtype=np.float32)
+
+    ingest.openai_embed_fn = lambda client, model: fake_embed
+    ingest.config.EMBEDDING_CACHE_ENABLED = False
+    rag.chunker._encodings[rag.chunker.ENCODING_NAME] = tiktoken.Encoding(
+        name="bytes", pat_str=r"\\S+|\\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+    def tags():
+        store = ChunkStore.open(resolve_index_path(ingest.INDEX_PATH), mmap_mode=False)
+        return {meta["source"]: meta["tags"] for meta in store.metadata if meta is not None}
+
+    with open(f"{ingest.DOCUMENTS_DIR}/wifi.md", "w", encoding="utf-8") as f:
+        f.write("La password del wifi è nel libretto di benvenuto.")
+    ingest.ingest_all()
+    generation, embedded[:] = current_generation(ingest.INDEX_PATH), []
+    assert ingest.ingest_incremental() == {"added": [], "removed": []}
+    assert current_generation(ingest.INDEX_PATH) == generation
+
+    # Solo metadata.json modificato: nuova generazione con i tag, nessun embedding ricalcolato
+    with open(ingest.METADATA_PATH, "w", encoding="utf-8") as f:
+        json.dump({"wifi.md": {"description": "Wifi", "tags": ["wifi"]}}, f)
+    ingest.ingest_incremental()
+    assert current_generation(ingest.INDEX_PATH) != generation
+    assert tags() == {"wifi.md": ["wifi"]} and embedded == []
+    assert ingest.ingest_incremental() == {"added": [], "removed": []}
+
+    # Dal pannello i metadati sono generati prima dell'indicizzazione, che li applica subito
+    def fake_metadata(progress=None):
+        with open(ingest.METADATA_PATH, "w", encoding="utf-8") as f:
+            json.dump({"wifi.md": {"description": "Wifi", "tags": ["wifi", "password"]}}, f)
+        return {"documents": 1}
+    generate_metadata.scan_and_generate_metadata = fake_metadata
+    admin.reindex_job()(types.SimpleNamespace(progress=ingest.no_progress))
+    assert tags() == {"wifi.md": ["wifi", "password"]} and embedded == []
+    print("ok")
+""")
+
+
+def _run_script(script, cwd):
+    env = dict(os.environ, FLASK_ENV="development", OPENAI_API_KEY="test",
+               PYTHONPATH=os.pathsep.join([REPO_DIR, os.environ.get("PYTHONPATH", "")]))
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert result.stdout.strip().endswith("ok")
+
+
+class TestUploadToIndex:
+    """
+    Test del percorso completo: upload dal pannello admin → aggiunta incrementale all'indice,
+    con il flag di reindicizzazione ricavato dall'esito dell'aggiornamento
+    """
+
+    def test_uploaded_document_is_indexed(self, tmp_path):
+        _run_script(UPLOAD_SCRIPT, tmp_path)
+
+
+class TestMetadataOnlyChanges:
+    """Test delle modifiche ai soli metadati: devono arrivare all'indice senza ricalcolare gli embedding"""
+
+    def test_metadata_edit_reaches_index(self, tmp_path):
+        _run_script(METADATA_SCRIPT, tmp_path)
@@ -0,0 +1,88 @@
+import threading
+import time
+import pytest
+from rag.jobs import CANCELLED, FAILED, SUCCEEDED, JobBusy, JobRunner
+
+def _wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.status not in (SUCCEEDED, FAILED, CANCELLED):
+        assert time.monotonic() < deadline, "lavoro non terminato"
+        time.sleep(0.01)
+    return job
+
+class TestJobRunner:
+    """Test per i lavori in background del pannello admin"""
+
+    def test_result_and_single_job(self):
+        runner = JobRunner()
+        release = threading.Event()
+
+        def blocked(job):
+            job.progress("attesa")
+            release.wait(5)
+            return {"chunks": 3}
+
+        job = runner.start("reindex", blocked)
+        assert runner.current() is job
+        with pytest.raises(JobBusy) as busy:
+            runner.start("metadata", lambda job: None)
+        assert busy.value.job is job
+        release.set()
+        assert _wait(job).to_dict()["result"] == {"chunks": 3}
+        assert runner.current() is None
+        # Terminato il primo, se ne può avviare un altro
+        assert _wait(runner.start("metadata", lambda job: "ok")).result == "ok"
+        assert [j.kind for j in runner.jobs()] == ["metadata", "reindex"]
+
+    def test_progress_and_eta(self):
+        now = [100.0]
+        runner = JobRunner(clock=lambda: now[0])
+        step = threading.Event()
+        done = threading.Event()
+
+        def work(job):
+            job.progress("embedding", 0, 10)
+            now[0] += 20
+            job.progress(done=4)
+            step.set()
+            done.wait(5)
+
+        job = runner.start("reindex", work)
+        step.wait(5)
+        status = job.to_dict()
+        assert status["stage"] == "embedding" and status["percent"] == 40.0
+        assert status["eta_seconds"] == 30.0  # 4 documenti in 20s, ne restano 6
+        done.set()
+        assert _wait(job).eta_seconds() is None
+
+    def test_cancel(self):
+        runner = JobRunner()
+        started = threading.Event()
+
+        def endless(job):
+            job.progress("embedding", 0, 1000)
+            started.set()
+            for i in range(1000):
+                time.sleep(0.01)
+                job.progress(done=i)
+
+        job = runner.start("reindex", endless)
+        started.wait(5)
+        assert runner.cancel(job.id) is job
+        assert _wait(job).status == CANCELLED and job.done < 1000
+        assert runner.cancel("sconosciuto") is None
+
+    def test_failure_is_reported(self):
+        runner = JobRunner()
+
+        def failing(job):
+            raise RuntimeError("API non disponibile")
+
+        job = _wait(runner.start("reindex", failing))
+        assert job.status == FAILED and job.error == "API non disponibile"
+        assert runner.current() is None
+
+    def test_history_limit(self):
+        runner = JobRunner(history=2)
+        ids = [_wait(runner.start("metadata", lambda job: None)).id for _ in range(3)]
+        assert runner.get(ids[0]) is None and runner.get(ids[2]) is not None
@@ -0,0 +1,63 @@
+import os
+from PyPDF2 import PdfWriter
+from rag.loader import TextCache, load_documents
+
+def _pdf(path):
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+class TestLoadDocuments:
+    """Test per il caricamento parallelo dei documenti e la cache del testo estratto"""
+
+    def _folder(self, tmp_path):
+        docs = tmp_path / "docs"
+        (docs / "sub").mkdir(parents=True)
+        (docs / "guida.md").write_text("# Check-in\nDalle 15.", encoding="utf-8")
+        _pdf(str(docs / "a.pdf"))
+        _pdf(str(docs / "sub" / "b.pdf"))
+        (docs / "rotto.pdf").write_bytes(b"non un pdf")
+        return str(docs)
+
+    def test_parallel_extraction_and_report(self, tmp_path):
+        folder = self._folder(tmp_path)
+        relpaths = ["guida.md", "a.pdf", "rotto.pdf", "sub/b.pdf"]
+        texts, report = load_documents(folder, relpaths, cache_dir=str(tmp_path / "cache"), max_workers=2)
+        assert [relpath for relpath, _ in texts] == ["guida.md", "a.pdf", "sub/b.pdf"]
+        assert texts[0][1].startswith("# Check-in")
+        assert [entry["source"] for entry in report] == relpaths
+        assert report[2]["error"] is not None
+        assert all(entry["seconds"] >= 0 for entry in report)
+
+    def test_workers_are_not_forked(self, tmp_path, monkeypatch):
+        """Nel server multithread i processi di estrazione non devono ereditare i lock con fork"""
+        import rag.loader as loader
+        contexts = []
+
+        class Recorder(loader.ProcessPoolExecutor):
+            def __init__(self, *args, mp_context=None, **kwargs):
+                contexts.append(mp_context.get_start_method() if mp_context is not None else None)
+                super().__init__(*args, mp_context=mp_context, **kwargs)
+
+        monkeypatch.setattr(loader, "ProcessPoolExecutor", Recorder)
+        texts, _ = load_documents(self._folder(tmp_path), ["a.pdf", "sub/b.pdf"], max_workers=2)
+        assert len(texts) == 2
+        assert contexts and contexts[0] in ("spawn", "forkserver")
+
+    def test_cached_text_is_reused(self, tmp_path):
+        folder = self._folder(tmp_path)
+        cache_dir = str(tmp_path / "cache")
+        load_documents(folder, ["a.pdf"], cache_dir=cache_dir, max_workers=1)
+        assert len(os.listdir(cache_dir)) == 1
+        # Testo in cache per hash del file: il PDF non viene più analizzato
+        digest = os.listdir(cache_dir)[0][:-len(".txt")]
+        TextCache(cache_dir).put(digest, "testo già estratto")
+        texts, report = load_documents(folder, ["a.pdf"], cache_dir=cache_dir, max_workers=1)
+        assert texts == [("a.pdf", "testo già estratto")]
+        assert report[0]["cached"] is True
+
+    def test_without_cache(self, tmp_path):
+        folder = self._folder(tmp_path)
+        texts, report = load_documents(folder, ["guida.md", "a.pdf"])
+        assert len(texts) == 2 and not any(entry["cached"] for entry in report)
@@ -0,0 +1,40 @@
+import numpy as np
+from rag.mmr import mmr_select
+from rag.singleton import IndexGeneration
+from rag.vectorstore import save_faiss_index, load_faiss_index
+
+class TestMMR:
+    """Test per la diversificazione dei risultati (Maximal Marginal Relevance)"""
+
+    def test_skips_near_duplicates(self):
+        query = np.array([1.0, 0.0, 0.0])
+        vectors = np.array([
+            [0.95, 0.05, 0.0],   # molto rilevante
+            [0.95, 0.06, 0.0],   # quasi identico al precedente
+            [0.7, 0.0, 0.7],     # meno rilevante ma diverso
+        ])
+        assert mmr_select(query, vectors, k=2, lambda_mult=1.0) == [0, 1]
+        assert mmr_select(query, vectors, k=2, lambda_mult=0.5) == [0, 2]
+
+    def test_per_source_cap(self):
+        query = np.array([1.0, 0.0])
+        vectors = np.array([[1.0, 0.0], [0.99, 0.1], [0.98, 0.2], [0.5, 0.5]])
+        picks = mmr_select(query, vectors, k=3, lambda_mult=1.0, sources=["a", "a", "a", "b"], per_source_cap=2)
+        assert picks == [0, 1, 3]
+
+    def test_generation_diversify(self, tmp_path):
+        rng = np.random.default_rng(0)
+        base = rng.standard_normal((20, 8)).astype(np.float32)
+        # Ogni documento ha tre chunk quasi identici (finestre sovrapposte)
+        vectors = np.repeat(base, 3, axis=0) + 0.01 * rng.standard_normal((60, 8)).astype(np.float32)
+        texts = [f"chunk {i}" for i in range(60)]
+        metadata = [{"source": f"doc_{i // 3}.md", "description": "", "tags": []} for i in range(60)]
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path, index_type="ivf")
+        index, loaded_texts, loaded_meta = load_faiss_index(path)
+        generation = IndexGeneration(index, loaded_texts, loaded_meta, path)
+
+        candidates = generation.search(base[4], top_k=9)
+        diverse = generation.diversify(base[4], candidates, top_k=3, per_source_cap=1)
+        sources = [r.meta["source"] for r in diverse]
+        assert sources[0] == "doc_4.md" and len(set(sources)) == 3
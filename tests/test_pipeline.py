@@ -0,0 +1,113 @@
+import os
+import threading
+import numpy as np
+import pytest
+from rag.dedup import MinHashDeduplicator
+from rag.pipeline import VectorBuffer, run_pipeline
+
+def _embed(batch):
+    return np.array([[len(text), i] for i, text in enumerate(batch)], dtype=np.float32)
+
+def _chunk(text):
+    words = text.split()
+    return [" ".join(words[i:i + 3]) for i in range(0, len(words), 3)]
+
+def _chunk_all(texts):
+    return [_chunk(text) for text in texts]
+
+class TestVectorBuffer:
+    """Test per il buffer di vettori crescente"""
+
+    @pytest.mark.parametrize("on_disk", [False, True])
+    def test_growth(self, tmp_path, on_disk):
+        path = str(tmp_path / "vectors.f32") if on_disk else None
+        buffer = VectorBuffer(path, capacity=2)
+        rows = np.arange(30, dtype=np.float32).reshape(10, 3)
+        for i in range(0, 10, 3):
+            buffer.append(rows[i:i + 3])
+        assert len(buffer) == 10 and buffer.capacity == 12  # 3 -> 6 -> 12
+        np.testing.assert_array_equal(buffer.array(), rows)
+        with pytest.raises(ValueError):
+            buffer.append(np.zeros((1, 4), dtype=np.float32))
+        buffer.close()
+        assert path is None or not os.path.exists(path)
+
+    def test_empty(self):
+        assert VectorBuffer().array().shape == (0, 0)
+
+class TestRunPipeline:
+    """Test per la pipeline di ingestione in streaming"""
+
+    def test_order_metadata_and_dedup(self):
+        documents = [("a.md", "uno due tre quattro cinque sei"), ("b.md", "uno due tre sette otto nove")]
+        result = run_pipeline(iter(documents), _chunk_all, lambda relpath: {"source": relpath}, _embed,
+                              batch_size=2, deduplicator=MinHashDeduplicator(threshold=0.9),
+                              count_tokens=lambda chunk: len(chunk.split()))
+        assert result.texts == ["uno due tre", "quattro cinque sei", "sette otto nove"]
+        assert [meta["source"] for meta in result.metadata] == ["a.md", "a.md", "b.md"]
+        assert result.vectors.array().shape == (3, 2)
+        assert result.stats == {"documents": 2, "chunks": 3, "duplicates": 1, "duplicate_tokens": 3}
+
+    def test_concurrent_batches_keep_order(self):
+        import random
+        import time
+
+        def slow_embed(batch):
+            time.sleep(random.uniform(0, 0.02))
+            return np.array([[float(text.split()[0])] for text in batch], dtype=np.float32)
+
+        documents = [(f"doc{i}.md", " ".join(str(i * 10 + j) for j in range(9))) for i in range(10)]
+        result = run_pipeline(iter(documents), _chunk_all, lambda relpath: {"source": relpath}, slow_embed,
+                              batch_size=2, concurrency=4, max_batch_tokens=5,
+                              count_tokens=lambda chunk: len(chunk.split()))
+        np.testing.assert_array_equal(result.vectors.array()[:, 0], [float(t.split()[0]) for t in result.texts])
+        assert len(result.texts) == 30
+
+    def test_documents_are_consumed_lazily(self):
+        produced = []
+        ahead = []
+
+        def documents():
+            for i in range(20):
+                produced.append(i)
+                yield f"doc{i}.md", f"testo numero {i}"
+
+        def embed(batch):
+            ahead.append(len(produced))
+            return _embed(batch)
+
+        run_pipeline(documents(), _chunk_all, lambda relpath: {"source": relpath}, embed, batch_size=1, queue_size=2,
+                     chunk_group=1)
+        # Il produttore non anticipa più di queue_size batch (più quello in costruzione)
+        assert all(count - i <= 4 for i, count in enumerate(ahead))
+
+    def test_errors_are_propagated(self):
+        def documents():
+            yield "a.md", "uno due tre"
+            raise OSError("disco non disponibile")
+
+        with pytest.raises(OSError):
+            run_pipeline(documents(), _chunk_all, lambda relpath: {}, _embed, batch_size=10)
+
+        def failing(batch):
+            raise RuntimeError("API non disponibile")
+
+        endless = (("doc.md", "uno due tre") for _ in iter(int, 1))
+        with pytest.raises(RuntimeError):
+            run_pipeline(endless, _chunk_all, lambda relpath: {}, failing, batch_size=1, queue_size=1)
+        assert not any(t.name == "ingest-producer" and t.is_alive() for t in threading.enumerate())
+
+    def test_progress_can_stop_the_pipeline(self):
+        seen = []
+
+        def progress(stats):
+            seen.append(stats["chunks"])
+            if stats["chunks"] >= 3:
+                raise KeyboardInterrupt  # come un annullamento: nessuna eccezione "ordinaria"
+
+        endless = (("doc.md", "uno due tre") for _ in iter(int, 1))
+        with pytest.raises(KeyboardInterrupt):
+            run_pipeline(endless, _chunk_all, lambda relpath: {}, _embed, batch_size=1, queue_size=1,
+                         progress=progress)
+        assert seen == [1, 2, 3]
+        assert not any(t.name == "ingest-producer" and t.is_alive() for t in threading.enumerate())
@@ -0,0 +1,53 @@
+import numpy as np
+from rag.query_cache import QueryEmbeddingCache, normalize_query
+
+class TestQueryEmbeddingCache:
+    """Test per la cache degli embedding delle domande"""
+
+    def test_normalize_query(self):
+        assert normalize_query("  Qual è il  codice WiFi? ") == "qual è il codice wifi"
+
+    def test_memory_and_disk_hits(self, tmp_path):
+        path = str(tmp_path / "cache" / "query_embeddings.sqlite")
+        calls = []
+
+        def compute(text):
+            calls.append(text)
+            return np.arange(4, dtype=np.float32)
+
+        cache = QueryEmbeddingCache(path, "model-a")
+        cache.get_or_compute("Codice wifi?", compute)
+        cache.get_or_compute("codice   WIFI", compute)
+        assert len(calls) == 1
+        assert cache.stats()["hits_memory"] == 1 and cache.stats()["misses"] == 1
+
+        # Un nuovo processo ritrova l'embedding su disco
+        restarted = QueryEmbeddingCache(path, "model-a")
+        assert np.array_equal(restarted.get_or_compute("codice wifi", compute), np.arange(4))
+        assert len(calls) == 1 and restarted.stats()["hits_disk"] == 1
+
+    def test_compute_many_batches_misses(self):
+        cache = QueryEmbeddingCache(None, "model-a")
+        cache.put("parcheggio", np.ones(4))
+        calls = []
+
+        def compute(texts):
+            calls.append(list(texts))
+            return np.zeros((len(texts), 4))
+
+        vectors = cache.get_or_compute_many(["wifi", "parcheggio", "colazione"], compute)
+        assert calls == [["wifi", "colazione"]]
+        assert vectors.shape == (3, 4) and vectors[1].sum() == 4
+
+    def test_model_change_invalidates(self, tmp_path):
+        path = str(tmp_path / "query_embeddings.sqlite")
+        QueryEmbeddingCache(path, "model-a").put("parcheggio", np.ones(4))
+        other = QueryEmbeddingCache(path, "model-b")
+        assert other.get("parcheggio") is None
+        assert QueryEmbeddingCache(path, "model-a").get("parcheggio") is None
+
+    def test_lru_eviction(self):
+        cache = QueryEmbeddingCache(None, "model-a", max_entries=2)
+        for text in ("a", "b", "c"):
+            cache.put(text, np.zeros(2))
+        assert cache.get("a") is None and cache.get("c") is not None
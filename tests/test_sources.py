@@ -0,0 +1,48 @@
+import os
+from rag.sources import chunk_ids_by_source, file_entry, read_sources, scan_changes, write_sources
+
+def _write(folder, relpath, content):
+    path = os.path.join(folder, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+class TestSourcesManifest:
+    """Test per il manifest dei documenti dell'ingestione incrementale"""
+
+    def test_roundtrip_and_missing(self, tmp_path):
+        index_path = str(tmp_path / "index.faiss")
+        assert read_sources(index_path) is None
+        write_sources(index_path, {"chunk_size": 500}, {"a.md": {"size": 1, "mtime": 2, "sha256": "x", "chunk_ids": [0]}})
+        sources = read_sources(index_path)
+        assert sources["params"] == {"chunk_size": 500}
+        assert sources["documents"]["a.md"]["chunk_ids"] == [0]
+
+    def test_chunk_ids_by_source(self):
+        metadata = [{"source": "a.md"}, {"source": "b.md"}, {"source": "a.md"}]
+        assert chunk_ids_by_source(metadata, [10, 11, 12]) == {"a.md": [10, 12], "b.md": [11]}
+
+    def test_scan_changes(self, tmp_path):
+        folder = str(tmp_path)
+        for name in ("same.md", "touched.md", "edited.md", "gone.md"):
+            _write(folder, name, f"contenuto di {name}")
+        previous = {name: dict(file_entry(folder, name), chunk_ids=[i])
+                    for i, name in enumerate(("same.md", "touched.md", "edited.md", "gone.md"))}
+
+        touched = os.path.join(folder, "touched.md")
+        os.utime(touched, ns=(0, os.stat(touched).st_mtime_ns + 1_000_000_000))
+        _write(folder, "edited.md", "contenuto modificato")
+        _write(folder, "sub/new.txt", "nuovo")
+        os.remove(os.path.join(folder, "gone.md"))
+
+        added, changed, removed, unchanged = scan_changes(
+            folder, ["same.md", "touched.md", "edited.md", "sub/new.txt"], previous
+        )
+        assert list(added) == ["sub/new.txt"]
+        assert list(changed) == ["edited.md"]
+        assert removed == ["gone.md"]
+        assert set(unchanged) == {"same.md", "touched.md"}
+        # Solo mtime cambiato: chunk mantenuti, mtime aggiornato
+        assert unchanged["touched.md"]["chunk_ids"] == [1]
+        assert unchanged["touched.md"]["mtime"] == os.stat(touched).st_mtime_ns
@@ -0,0 +1,369 @@
+import json
+import os
+import pickle
+import faiss
+import numpy as np
+import pytest
+from rag.chunkstore import ChunkStore, write_chunk_store
+from rag.filters import MetadataFilterIndex, bitmap_count, validate_filters
+from rag.vectorstore import save_faiss_index, load_faiss_index, search_faiss, search_faiss_batch, build_faiss_index
+from rag.vectorstore import exact_knn, unwrap_id_map, update_faiss_index
+from rag.singleton import IndexGeneration
+from rag.benchmark import load_index_vectors, run_benchmark, sample_queries, synthetic_vectors
+
+def _corpus(n=400, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    texts = [f"chunk numero {i}" for i in range(n)]
+    metadata = [{"source": f"doc_{i % 7}.md", "description": "", "tags": []} for i in range(n)]
+    return vectors, texts, metadata
+
+class TestIndexTypes:
+    """Test per i tipi di indice configurabili"""
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+    def test_roundtrip(self, tmp_path, index_type):
+        """Salvataggio e caricamento mantengono tipo e parametri di ricerca"""
+        vectors, texts, metadata = _corpus()
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path, index_type=index_type,
+                         index_params={"efSearch": 48, "nprobe": 3})
+
+        with open(path + ".params.json", encoding="utf-8") as f:
+            saved = json.load(f)
+        assert saved["index_type"] == index_type
+        assert saved["ntotal"] == len(texts)
+
+        index, loaded_texts, loaded_meta = load_faiss_index(path)
+        base = unwrap_id_map(index)
+        if index_type == "hnsw":
+            assert base.hnsw.efSearch == 48
+        if index_type == "ivf":
+            assert base.nprobe == min(3, saved["params"]["nlist"])
+
+        results = search_faiss(index, loaded_texts, loaded_meta, vectors[10:11], top_k=3)
+        assert results[0]["text"] == "chunk numero 10"
+
+    def test_unknown_type(self):
+        """Un tipo non supportato genera un errore esplicito"""
+        vectors, _, _ = _corpus(n=10)
+        with pytest.raises(ValueError):
+            build_faiss_index(vectors, "annoy")
+
+    def test_ivf_small_corpus(self):
+        """Con pochi chunk nlist viene ridotto per permettere il training"""
+        vectors, _, _ = _corpus(n=20)
+        index, params = build_faiss_index(vectors, "ivf", {"nlist": 100})
+        assert params["nlist"] == 1
+        assert index.ntotal == 20
+
+class TestQuantizedIndex:
+    """Test per gli indici quantizzati con riordinamento esatto"""
+
+    @pytest.mark.parametrize("metric", [faiss.METRIC_L2, faiss.METRIC_INNER_PRODUCT])
+    def test_exact_knn_on_memmap_batches(self, tmp_path, metric):
+        """I vicini esatti calcolati a blocchi da np.memmap coincidono con quelli di IndexFlat"""
+        vectors, _, _ = _corpus(n=500)
+        stored = np.memmap(str(tmp_path / "vectors.f32"), dtype=np.float32, mode="w+", shape=vectors.shape)
+        stored[:] = vectors
+        queries = vectors[:20] + 0.01
+
+        expected_vectors = vectors.copy()
+        if metric == faiss.METRIC_INNER_PRODUCT:
+            faiss.normalize_L2(expected_vectors)
+        exact = faiss.IndexFlat(vectors.shape[1], metric)
+        exact.add(expected_vectors)
+        _, expected = exact.search(queries, 5)
+        np.testing.assert_array_equal(exact_knn(stored, queries, 5, metric, batch_size=64), expected)
+
+    @pytest.mark.parametrize("index_type", ["sq8", "sqfp16", "pq"])
+    def test_report_and_mmap(self, tmp_path, index_type):
+        """Il build riporta memoria risparmiata e recall; l'indice si carica anche mappato"""
+        vectors, texts, metadata = _corpus(n=600)
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path, index_type=index_type,
+                         index_params={"pq_m": 8, "rerank": 8})
+
+        with open(path + ".params.json", encoding="utf-8") as f:
+            report = json.load(f)["report"]
+        assert report["memory_saved_pct"] > 40
+        assert report["recall_reranked"] >= report["recall_quantized"]
+
+        index, loaded_texts, loaded_meta = load_faiss_index(path, mmap=True)
+        assert unwrap_id_map(index).k_factor == 8
+        results = search_faiss(index, loaded_texts, loaded_meta, vectors[42:43], top_k=3)
+        assert results[0]["text"] == "chunk numero 42"
+
+    def test_pq_invalid_code_size(self):
+        vectors, _, _ = _corpus(n=300)
+        with pytest.raises(ValueError):
+            build_faiss_index(vectors, "pq", {"pq_m": 7})
+
+class TestFilteredSearch:
+    """Test per la ricerca filtrata su source e tags"""
+
+    def _filter_corpus(self):
+        vectors, texts, _ = _corpus(n=600)
+        metadata = []
+        for i in range(len(texts)):
+            if i % 10 == 3:
+                metadata.append({"source": "keyboxes/keybox_codici.md", "description": "", "tags": ["Codici"]})
+            elif i % 10 == 5:
+                metadata.append({"source": "docs/guida/parcheggio.md", "description": "", "tags": ["parcheggio", "accesso"]})
+            else:
+                metadata.append({"source": "docs/regole/house_rules.md", "description": "", "tags": ["regole"]})
+        return vectors, texts, metadata
+
+    def test_bitmaps(self):
+        _, _, metadata = self._filter_corpus()
+        filter_index = MetadataFilterIndex(metadata)
+        assert bitmap_count(filter_index.bitmap({"source": "keyboxes/"})) == 60
+        assert bitmap_count(filter_index.bitmap({"source": "docs/"})) == 540
+        assert bitmap_count(filter_index.bitmap({"tags": ["codici", "accesso"]})) == 120
+        assert bitmap_count(filter_index.bitmap({"source": "docs/", "tags": ["parcheggio"]})) == 60
+        assert bitmap_count(filter_index.bitmap({"tags": ["inesistente"]})) == 0
+        assert filter_index.bitmap({}) is None
+
+    def test_invalid_filters(self):
+        with pytest.raises(ValueError):
+            validate_filters({"autore": "x"})
+        with pytest.raises(ValueError):
+            validate_filters({"tags": [1, 2]})
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf", "sq8", "pq"])
+    def test_filter_before_top_k(self, tmp_path, index_type):
+        """Il filtro restringe i candidati prima del top-k: si ottengono comunque k risultati ammessi"""
+        vectors, texts, metadata = self._filter_corpus()
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path, index_type=index_type,
+                         index_params={"pq_m": 8, "nprobe": 100})
+        index, loaded_texts, loaded_meta = load_faiss_index(path)
+        id_bitmap = MetadataFilterIndex(loaded_meta).bitmap({"source": "keyboxes/"})
+
+        results = search_faiss(index, loaded_texts, loaded_meta, vectors[0:1], top_k=5, id_bitmap=id_bitmap)
+        assert len(results) == 5
+        assert all(r["meta"]["source"].startswith("keyboxes/") for r in results)
+
+        empty = MetadataFilterIndex(loaded_meta).bitmap({"tags": ["inesistente"]})
+        assert search_faiss(index, loaded_texts, loaded_meta, vectors[0:1], top_k=5, id_bitmap=empty) == []
+
+class TestBenchmark:
+    """Test per il benchmark recall/latenza"""
+
+    def test_report_rows(self):
+        vectors = synthetic_vectors(500, dim=32)
+        queries = sample_queries(vectors, 20)
+        rows = run_benchmark(vectors, queries, k=5, ef_search=[64], nprobe=[4])
+        assert [r["index_type"] for r in rows] == ["flat", "hnsw", "ivf"]
+        assert rows[0]["recall"] == 1.0
+        for row in rows:
+            assert 0.0 <= row["recall"] <= 1.0
+            assert row["p99_ms"] >= row["p50_ms"] >= 0.0
+
+    @pytest.mark.parametrize("index_type,rerank", [("flat", 0), ("hnsw", 0), ("ivf", 0), ("pq", 0), ("pq", 4)])
+    def test_load_vectors_after_removal(self, tmp_path, index_type, rerank):
+        """Dopo una rimozione incrementale si ricostruiscono solo i vettori dei chunk presenti"""
+        vectors, texts, metadata = _corpus(n=300)
+        src, dst = str(tmp_path / "src.faiss"), str(tmp_path / "dst.faiss")
+        save_faiss_index(vectors, texts, metadata, src, index_type=index_type,
+                         index_params={"pq_m": 8, "rerank": rerank})
+        update_faiss_index(src, dst, vectors[:0], [], [], remove_sources=["doc_1.md"])
+
+        loaded = load_index_vectors(dst)
+        kept = [i for i in range(300) if i % 7 != 1]
+        assert loaded.shape == (len(kept), vectors.shape[1])
+        if index_type in ("flat", "hnsw"):
+            np.testing.assert_allclose(loaded, vectors[kept], rtol=1e-5)
+
+class TestMmapLoading:
+    """Test per il caricamento dell'indice mappato in memoria"""
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+    def test_mmap_matches_copy(self, tmp_path, index_type):
+        """L'indice mappato restituisce gli stessi risultati della copia in RAM"""
+        vectors, texts, metadata = _corpus()
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path, index_type=index_type)
+
+        copied, _, _ = load_faiss_index(path)
+        mapped, _, _ = load_faiss_index(path, mmap=True)
+        _, expected = copied.search(vectors[:5], 4)
+        _, actual = mapped.search(vectors[:5], 4)
+        assert np.array_equal(expected, actual)
+
+class TestChunkStore:
+    """Test per l'archivio colonnare dei chunk"""
+
+    def test_roundtrip(self, tmp_path):
+        """Testi multibyte e metadati sopravvivono al salvataggio; la tabella documenti è deduplicata"""
+        path = str(tmp_path / "index.faiss")
+        texts = ["Città di Rimini 🏖️", "", "perché sì"]
+        doc = {"source": "guida.md", "description": "Guida", "tags": ["parcheggio"]}
+        metadata = [doc, dict(doc), {"source": "web_page_0", "description": "", "tags": []}]
+        write_chunk_store(path, texts, metadata)
+
+        store = ChunkStore.open(path)
+        assert len(store) == 3
+        assert list(store.texts) == texts
+        assert store.texts[-1] == "perché sì"
+        assert store.metadata[1] == doc
+        assert len(store.docs) == 2
+        assert store.doc_ids.dtype == np.int32
+
+    def test_legacy_pickle(self, tmp_path):
+        """Gli indici con il vecchio sidecar pickle continuano a essere caricati"""
+        vectors, texts, metadata = _corpus(n=20)
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path)
+        for suffix in (".texts.bin", ".offsets.npy", ".docs.json", ".doc_ids.npy"):
+            os.remove(path + suffix)
+        with open(path + ".meta.pkl", "wb") as f:
+            pickle.dump({"texts": texts, "metadata": metadata}, f)
+
+        _, loaded_texts, loaded_meta = load_faiss_index(path)
+        assert loaded_texts == texts
+        assert loaded_meta == metadata
+
+class TestBatchSearch:
+    """Test per la ricerca multi-query"""
+
+    def test_batch_matches_single(self, tmp_path):
+        """Ogni riga del batch coincide con la ricerca singola e riporta le distanze"""
+        vectors, texts, metadata = _corpus()
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path)
+        index, loaded_texts, loaded_meta = load_faiss_index(path)
+
+        batch = search_faiss_batch(index, loaded_texts, loaded_meta, vectors[:8], top_k=3)
+        assert len(batch) == 8
+        for i, results in enumerate(batch):
+            single = search_faiss(index, loaded_texts, loaded_meta, vectors[i:i + 1], top_k=3)
+            assert [r["text"] for r in results] == [r["text"] for r in single]
+            assert results[0]["distance"] == pytest.approx(0.0, abs=1e-4)
+            assert [r["distance"] for r in results] == sorted(r["distance"] for r in results)
+
+class TestSearchResults:
+    """Test per il tipo compatto dei risultati e la metrica coseno"""
+
+    def test_cosine_scores_and_threshold(self, tmp_path):
+        vectors, texts, metadata = _corpus()
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors * 3.0, texts, metadata, path, index_params={"metric": "cosine"})
+        index, loaded_texts, loaded_meta = load_faiss_index(path)
+
+        results = search_faiss(index, loaded_texts, loaded_meta, vectors[5], top_k=5)
+        assert results[0].id == 5 and results[0].text == texts[5]
+        assert results[0].score == pytest.approx(1.0, abs=1e-4)
+        assert [r.score for r in results] == sorted((r.score for r in results), reverse=True)
+
+        threshold = results[2].score
+        filtered = search_faiss(index, loaded_texts, loaded_meta, vectors[5], top_k=5, min_score=threshold)
+        assert [r.id for r in filtered] == [r.id for r in results[:3]]
+
+    def test_dict_compatibility(self, tmp_path):
+        vectors, texts, metadata = _corpus(n=50)
+        path = str(tmp_path / "index.faiss")
+        save_faiss_index(vectors, texts, metadata, path)
+        index, loaded_texts, loaded_meta = load_faiss_index(path)
+
+        result = search_faiss(index, loaded_texts, loaded_meta, vectors[0], top_k=1)[0]
+        assert result["meta"] == metadata[0] and result["distance"] == result.distance
+        assert "rrf" not in result and result.get("rrf") is None
+        assert result.to_dict()["text"] == texts[0]
+        with pytest.raises(ValueError):
+            build_faiss_index(vectors, "flat", {"metric": "manhattan"})
+
+class TestBatchedBuild:
+    """Test per la costruzione dell'indice a blocchi da vettori su disco"""
+
+    @pytest.mark.parametrize("index_type", ["flat", "ivf", "sq8"])
+    def test_same_results_as_single_add(self, tmp_path, index_type):
+        vectors, _, _ = _corpus(n=300)
+        on_disk = np.memmap(str(tmp_path / "vectors.f32"), dtype=np.float32, mode="w+", shape=vectors.shape)
+        on_disk[:] = vectors
+        params = {"metric": "cosine"}
+        single, _ = build_faiss_index(vectors, index_type, params, ids=np.arange(300))
+        batched, _ = build_faiss_index(on_disk, index_type, params, ids=np.arange(300), add_batch_size=64)
+        assert batched.ntotal == 300
+        _, expected = single.search(vectors[:10], 5)
+        _, found = batched.search(vectors[:10], 5)
+        np.testing.assert_array_equal(found, expected)
+
+
+class TestIncrementalUpdate:
+    """Test per l'aggiunta e la rimozione incrementale di documenti"""
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+    def test_add_and_remove_document(self, tmp_path, index_type):
+        """I chunk del documento rimosso spariscono, i nuovi ricevono id successivi e quelli esistenti non cambiano"""
+        vectors, texts, metadata = _corpus(n=200)
+        src, dst = str(tmp_path / "src.faiss"), str(tmp_path / "dst.faiss")
+        save_faiss_index(vectors, texts, metadata, src, index_type=index_type)
+
+        new_vectors = np.random.default_rng(7).standard_normal((3, vectors.shape[1])).astype(np.float32)
+        new_meta = {"source": "nuovo.md", "description": "", "tags": []}
+        added, removed = update_faiss_index(src, dst, new_vectors, ["nuovo 0", "nuovo 1", "nuovo 2"],
+                                            [new_meta] * 3, remove_sources=["doc_1.md"])
+        assert added == [200, 201, 202]
+        assert removed == [i for i in range(200) if i % 7 == 1]
+
+        index, loaded_texts, loaded_meta = load_faiss_index(dst)
+        params = json.load(open(dst + ".params.json", encoding="utf-8"))
+        generation = IndexGeneration(index, loaded_texts, loaded_meta, dst, tombstones=params["tombstones"])
+        assert (params["tombstones"] > 0) == (index_type == "hnsw")
+
+        assert generation.search(new_vectors[1], top_k=1)[0].text == "nuovo 1"
+        assert generation.search(vectors[16], top_k=1)[0].id == 16
+        results = generation.search(vectors[8], top_k=10)
+        assert results and all(r.meta["source"] != "doc_1.md" for r in results)
+
+    @pytest.mark.parametrize("index_type", ["hnsw", "pq"])
+    def test_tombstones_compacted_above_ratio(self, tmp_path, index_type):
+        """Oltre la soglia l'indice viene ricostruito senza tombstone, con gli stessi id dei chunk"""
+        vectors, texts, metadata = _corpus(n=300)
+        paths = [str(tmp_path / f"gen{i}.faiss") for i in range(3)]
+        save_faiss_index(vectors, texts, metadata, paths[0], index_type=index_type, index_params={"pq_m": 8})
+
+        update_faiss_index(paths[0], paths[1], vectors[:0], [], [], remove_sources=["doc_1.md"], compact_ratio=0.2)
+        params = json.load(open(paths[1] + ".params.json", encoding="utf-8"))
+        assert params["tombstones"] == 43 and params["ntotal"] == 300  # 14% dei vettori: sotto la soglia
+        assert params["tombstone_ratio"] == round(43 / 300, 4)
+
+        update_faiss_index(paths[1], paths[2], vectors[:0], [], [], remove_sources=["doc_2.md"], compact_ratio=0.2)
+        params = json.load(open(paths[2] + ".params.json", encoding="utf-8"))
+        kept = [i for i in range(300) if i % 7 not in (1, 2)]
+        assert params["tombstones"] == 0 and params["ntotal"] == len(kept)
+
+        index, loaded_texts, loaded_meta = load_faiss_index(paths[2])
+        generation = IndexGeneration(index, loaded_texts, loaded_meta, paths[2], tombstones=params["tombstones"])
+        assert generation.search(vectors[17], top_k=1)[0].id == 17
+        results = generation.search(vectors[9], top_k=10)
+        assert results and all(r.meta["source"] not in ("doc_1.md", "doc_2.md") for r in results)
+
+    def test_metadata_updates_without_reembedding(self, tmp_path):
+        vectors, texts, metadata = _corpus(n=50)
+        src, dst = str(tmp_path / "src.faiss"), str(tmp_path / "dst.faiss")
+        save_faiss_index(vectors, texts, metadata, src, index_type="flat")
+        updated = {"source": "doc_2.md", "description": "nuova descrizione", "tags": ["x"]}
+        added, removed = update_faiss_index(src, dst, vectors[:0], [], [], metadata_updates={"doc_2.md": updated})
+        assert added == [] and removed == []
+        _, _, loaded_meta = load_faiss_index(dst)
+        assert loaded_meta[2] == updated and loaded_meta[3]["source"] == "doc_3.md"
+
+    def test_token_counts_carried_forward(self, tmp_path):
+        vectors, texts, metadata = _corpus(n=14)
+        src, dst = str(tmp_path / "src.faiss"), str(tmp_path / "dst.faiss")
+        save_faiss_index(vectors, texts, metadata, src, index_type="flat", token_counts=list(range(1, 15)))
+        update_faiss_index(src, dst, vectors[:2], ["a", "b"], [{"source": "nuovo.md"}] * 2,
+                           remove_sources=["doc_0.md"], token_counts=[40, 41])
+        store = ChunkStore.open(dst)
+        assert store.get_tokens(0) == 0 and store.get_tokens(1) == 2
+        assert store.get_tokens(14) == 40 and store.get_tokens(15) == 41
+
+    def test_legacy_index_requires_full_ingest(self, tmp_path):
+        vectors, texts, metadata = _corpus(n=20)
+        index, _ = build_faiss_index(vectors, "flat")
+        path = str(tmp_path / "index.faiss")
+        faiss.write_index(index, path)
+        with pytest.raises(ValueError):
+            update_faiss_index(path, str(tmp_path / "out.faiss"), vectors[:1], ["x"], [{}])
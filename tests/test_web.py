@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rag.web import fetch_pages, make_session, read_urls
+
+class StubSite:
+    """Sito locale: /etag/* con ETag, /modified con Last-Modified, /plain senza validatori, /broken 404, /slow lento"""
+
+    LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+    def __init__(self, delay=0.0):
+        self.bodies = {"/etag/a": "<p>pagina a</p>", "/etag/b": "<p>pagina b</p>",
+                       "/modified": "<p>orari</p>", "/plain": "<p>città</p>"}
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests.append((self.path, dict(self.headers)))
+                    site.connections.add(self.client_address)
+                    site.in_flight += 1
+                    site.max_in_flight = max(site.max_in_flight, site.in_flight)
+                try:
+                    if self.path == "/slow":
+                        time.sleep(1)
+                    time.sleep(site.delay)
+                    body = site.bodies.get(self.path)
+                    if body is None:
+                        self.send_response(404)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+                    if self.path.startswith("/etag") and self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    if self.path == "/modified" and self.headers.get("If-Modified-Since") == site.LAST_MODIFIED:
+                        self.send_response(304)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    payload = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    if self.path.startswith("/etag"):
+                        self.send_header("ETag", etag)
+                    if self.path == "/modified":
+                        self.send_header("Last-Modified", site.LAST_MODIFIED)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    with site._lock:
+                        site.in_flight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+class TestReadUrls:
+    """Test per la lettura dell'elenco delle pagine"""
+
+    def test_skips_blank_comments_and_duplicates(self, tmp_path):
+        path = tmp_path / "urls.txt"
+        path.write_text("https://a.it/\n\n# commento\n  https://b.it/  \nhttps://a.it/\n", encoding="utf-8")
+        assert read_urls(str(path)) == ["https://a.it/", "https://b.it/"]
+        assert read_urls(str(tmp_path / "assente.txt")) == []
+
+class TestFetchPages:
+    """Test per il download concorrente con GET condizionale (server locale)"""
+
+    def test_conditional_get(self, tmp_path):
+        cache = str(tmp_path / "web")
+        with StubSite() as site:
+            urls = [site.url(path) for path in ("/etag/a", "/etag/b", "/modified", "/plain")]
+            first = fetch_pages(urls, cache_dir=cache)
+            assert [page.status for page in first] == ["fetched"] * 4
+            assert first[3].html == "<p>città</p>"
+
+            site.bodies["/etag/b"] = "<p>pagina b aggiornata</p>"
+            site.requests.clear()
+            second = fetch_pages(urls, cache_dir=cache)
+            assert [page.status for page in second] == ["not_modified", "fetched", "not_modified", "fetched"]
+            assert second[0].html == first[0].html and second[0].sha256 == first[0].sha256
+            assert second[1].sha256 != first[1].sha256
+            # Senza validatori la pagina viene riscaricata, ma l'hash del corpo resta lo stesso
+            assert second[3].sha256 == first[3].sha256
+            sent = dict((path, headers) for path, headers in site.requests)
+            assert "If-None-Match" in sent["/etag/a"] and "If-Modified-Since" in sent["/modified"]
+            assert "If-None-Match" not in sent["/plain"]
+
+    def test_errors_and_removed_urls(self, tmp_path):
+        cache = str(tmp_path / "web")
+        with StubSite() as site:
+            fetch_pages([site.url("/etag/a"), site.url("/etag/b")], cache_dir=cache)
+            pages = fetch_pages([site.url("/etag/a"), site.url("/broken"), site.url("/slow")],
+                                cache_dir=cache, timeout=0.3)
+            assert [page.status for page in pages] == ["not_modified", "error", "error"]
+            assert pages[1].html is None and pages[2].error
+        # La pagina tolta dall'elenco esce dalla cache, insieme al suo corpo
+        assert len([name for name in os.listdir(cache) if name.endswith(".html")]) == 1
+
+    def test_bounded_concurrency_and_pooled_connections(self):
+        with StubSite(delay=0.1) as site:
+            site.bodies.update({f"/etag/{i}": f"<p>{i}</p>" for i in range(12)})
+            urls = [site.url(f"/etag/{i}") for i in range(12)]
+            session = make_session(pool_size=3)
+            start = time.perf_counter()
+            pages = fetch_pages(urls, max_workers=3, session=session)
+            elapsed = time.perf_counter() - start
+            fetch_pages(urls, max_workers=3, session=session)
+            session.close()
+        assert all(page.status == "fetched" for page in pages)
+        assert [page.html for page in pages] == [f"<p>{i}</p>" for i in range(12)]
+        assert site.max_in_flight <= 3 and elapsed < 1.0
+        # Connessioni riusate: al più una per thread, anche tra due chiamate
+        assert len(site.connections) <= 3